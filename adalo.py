@@ -0,0 +1,320 @@
+"""
+Adalo collection API segédfüggvények: URL-ek, fejlécek és a közös, paginált lekérdezés.
+"""
+import asyncio
+import os
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+from app_logging import get_logger
+from cache import RecordCache
+from http_client import HttpClient
+
+log = get_logger("adalo")
+
+# Felülírható, pl. egy helyi, Adalo-t utánzó szerverre (benchmarks/fake_adalo.py). Importáláskor
+# olvasódik (a .env betöltése előtt), ezért a folyamat környezetében kell megadni.
+ADALO_API_BASE = os.getenv("ADALO_API_BASE", "https://api.adalo.com/v0").rstrip("/")
+
+
+def collection_url(app_id: str, collection_id: str, record_id: Any = None) -> str:
+    url = f"{ADALO_API_BASE}/apps/{app_id}/collections/{collection_id}"
+    if record_id is not None:
+        url = f"{url}/{record_id}"
+    return url
+
+
+def parse_collection_url(url: str) -> Optional[Tuple[str, str, Optional[str]]]:
+    """
+    collection_url() inverze: (app_id, collection_id, record_id vagy None), ha az URL egy
+    Adalo collection (vagy annak egy rekordja) címe, különben None.
+    """
+    prefix = f"{ADALO_API_BASE}/apps/"
+    if not url.startswith(prefix):
+        return None
+    parts = url[len(prefix):].split("?", 1)[0].split("/")
+    if len(parts) == 3 and parts[1] == "collections":
+        return parts[0], parts[2], None
+    if len(parts) == 4 and parts[1] == "collections":
+        return parts[0], parts[2], parts[3]
+    return None
+
+
+def app_users_url(app_id: str) -> str:
+    return f"{ADALO_API_BASE}/apps/{app_id}/users"
+
+
+def adalo_headers(api_key: str) -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+
+def extract_records(data: Any) -> List[dict]:
+    """
+    Adalo API válasz formátum ellenőrzése: a collection végpontok {"records": [...]}-t,
+    a /users végpont néha {"users": [...]}-t vagy közvetlenül listát ad vissza.
+    """
+    if isinstance(data, dict) and "records" in data:
+        return data["records"] or []
+    if isinstance(data, dict) and "users" in data:
+        return data["users"] or []
+    if isinstance(data, list):
+        return data
+    raise HTTPException(
+        status_code=500,
+        detail=f"Váratlan Adalo API válasz formátum: {type(data)}"
+    )
+
+
+def _extract_total(data: Any) -> Optional[int]:
+    # Ha az API megadja az összes rekord számát, a további oldalak előre ütemezhetők
+    if isinstance(data, dict):
+        for key in ("total", "count", "totalCount"):
+            value = data.get(key)
+            if isinstance(value, int) and value >= 0:
+                return value
+    return None
+
+
+async def _fetch_page(
+    client: HttpClient,
+    url: str,
+    headers: Dict[str, str],
+    offset: int,
+    limit: int,
+    params: Optional[Dict[str, Any]] = None,
+) -> Tuple[List[dict], Any]:
+    query = dict(params or {})
+    query.update({"offset": offset, "limit": limit})
+    response = await client.get(url, headers=headers, params=query)
+    if response.status_code != 200:
+        log.error("Hibás Adalo API válasz (offset: %s): %s", offset, response.text)
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"Adalo API hiba: {response.text}"
+        )
+    data = response.json()
+    return extract_records(data), data
+
+
+async def iter_collection_pages(
+    client: HttpClient,
+    url: str,
+    headers: Dict[str, str],
+    page_size: int = 100,
+    concurrency: int = 4,
+    max_records: Optional[int] = None,
+    params: Optional[Dict[str, Any]] = None,
+    on_page: Optional[Callable[[List[dict]], None]] = None,
+) -> AsyncIterator[List[dict]]:
+    """
+    Oldalanként adja vissza egy Adalo collection rekordjait, sorrendben.
+
+    Az első oldal után a tényleges oldalméret ahhoz igazodik, amennyit az API valójában
+    visszaad (ha az API kisebb limitet érvényesít). A további oldalakat legfeljebb
+    `concurrency` párhuzamos kéréssel tölti előre; ha ismert a teljes darabszám, csak a
+    szükséges oldalakat kéri le, különben az első rövid/üres oldalnál megáll.
+    Egyszerre legfeljebb `concurrency` oldal van a memóriában, és a hívó `break`-kel
+    vagy a `max_records` limittel bármikor leállíthatja a lekérdezést.
+    Az `on_page` (ha meg van adva) minden lekért oldal rekordjaival meghívódik (haladás követéshez).
+    """
+    records, data = await _fetch_page(client, url, headers, 0, page_size, params)
+    log.debug("Oldal 1: %s rekord (offset: 0)", len(records))
+    if on_page is not None:
+        on_page(records)
+    if not records:
+        return
+
+    yielded = 0
+    if max_records is not None and len(records) >= max_records:
+        yield records[:max_records]
+        return
+    yield records
+    yielded += len(records)
+
+    next_offset = data.get("offset") if isinstance(data, dict) else None
+    has_more = isinstance(next_offset, int) and next_offset >= len(records)
+    if len(records) < page_size and not has_more:
+        return
+
+    # Adaptív oldalméret: ha az API kevesebbet ad vissza, mint amennyit kértünk,
+    # de jelzi, hogy van még adat, akkor az API saját limitjével lapozunk tovább
+    effective_size = len(records) if len(records) < page_size else page_size
+    total = _extract_total(data)
+    offset = len(records)
+    # Rövid első oldal után nem biztos, hogy van még adat: egyesével indulunk, és minden
+    # teli oldal után duplázzuk az előre lekért oldalak számát (ismert összesnél rögtön teljes)
+    window = max(1, concurrency) if total is not None or effective_size == page_size else 1
+
+    pending: deque = deque()
+    exhausted = False
+    page = 2
+    try:
+        while True:
+            while not exhausted and len(pending) < window:
+                if total is not None and offset >= total:
+                    exhausted = True
+                    break
+                if max_records is not None and offset >= max_records:
+                    exhausted = True
+                    break
+                task = asyncio.ensure_future(
+                    _fetch_page(client, url, headers, offset, effective_size, params)
+                )
+                pending.append((offset, task))
+                offset += effective_size
+
+            if not pending:
+                return
+
+            page_offset, task = pending.popleft()
+            records, _ = await task
+            log.debug("Oldal %s: %s rekord (offset: %s)", page, len(records), page_offset)
+            if on_page is not None:
+                on_page(records)
+            page += 1
+
+            if not records:
+                return
+            if max_records is not None and yielded + len(records) >= max_records:
+                yield records[:max_records - yielded]
+                return
+            yield records
+            yielded += len(records)
+
+            if len(records) < effective_size:
+                return
+            window = min(max(1, concurrency), window * 2)
+    finally:
+        # Korai leállás vagy hiba esetén a már elindított kéréseket eldobjuk
+        for _, task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*(task for _, task in pending), return_exceptions=True)
+
+
+async def iter_collection(
+    client: HttpClient,
+    url: str,
+    headers: Dict[str, str],
+    **kwargs,
+) -> AsyncIterator[dict]:
+    """
+    Rekordonként adja vissza egy Adalo collection tartalmát (lásd iter_collection_pages).
+    """
+    pages = iter_collection_pages(client, url, headers, **kwargs)
+    try:
+        async for records in pages:
+            for record in records:
+                yield record
+    finally:
+        await pages.aclose()
+
+
+async def fetch_collection(
+    client: HttpClient,
+    url: str,
+    headers: Dict[str, str],
+    **kwargs,
+) -> List[dict]:
+    """
+    A teljes collection listaként (csak ott használd, ahol tényleg minden rekord kell egyszerre).
+    """
+    result: List[dict] = []
+    async for records in iter_collection_pages(client, url, headers, **kwargs):
+        result.extend(records)
+    return result
+
+
+async def get_record(
+    client: HttpClient,
+    app_id: str,
+    collection_id: str,
+    record_id: Any,
+    headers: Dict[str, str],
+    cache: Optional[RecordCache] = None,
+) -> Tuple[int, Any]:
+    """
+    Egy rekord lekérése id alapján, a rekord cache-ből, ha ott friss bejegyzés van.
+    Visszaadja a státuszkódot és sikeres lekérésnél a rekordot, különben a válasz szövegét.
+    """
+    if cache is not None:
+        record = cache.get(app_id, collection_id, record_id)
+        if record is not None:
+            return 200, record
+    response = await client.get(collection_url(app_id, collection_id, record_id), headers=headers)
+    if response.status_code != 200:
+        return response.status_code, response.text
+    record = response.json()
+    if cache is not None:
+        cache.put(app_id, collection_id, record)
+    return 200, record
+
+
+async def fetch_records_by_id(
+    client: HttpClient,
+    app_id: str,
+    collection_id: str,
+    record_ids: Iterable[Any],
+    headers: Dict[str, str],
+    concurrency: int = 10,
+    cache: Optional[RecordCache] = None,
+) -> Tuple[Dict[Any, dict], Dict[Any, int]]:
+    """
+    Több rekord lekérése id alapján egy menetben, legfeljebb `concurrency` párhuzamos GET-tel
+    (az Adalo API-nak nincs több id-s lekérdezése); a cache-ben frissen meglévő rekordokhoz
+    nem megy kérés. Visszaadja a megtalált rekordokat és a sikertelen lekérések státuszkódját,
+    mindkettőt id szerint.
+    """
+    found: Dict[Any, dict] = {}
+    failed: Dict[Any, int] = {}
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def fetch(record_id: Any) -> None:
+        async with semaphore:
+            status, body = await get_record(client, app_id, collection_id, record_id, headers, cache)
+        if status == 200:
+            found[record_id] = body
+        else:
+            failed[record_id] = status
+
+    tasks = [asyncio.ensure_future(fetch(record_id)) for record_id in dict.fromkeys(record_ids)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # Hiba esetén a még futó lekéréseket eldobjuk
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return found, failed
+
+
+def record_cache_hook(cache: RecordCache) -> Callable[[str, str, Optional[httpx.Response], float], None]:
+    """
+    HttpClient response hook: a saját írásaink (PUT / POST / DELETE) frissítik a rekord cache-t.
+    Sikeres PUT / POST után a válaszban kapott rekord kerül a cache-be, DELETE vagy sikertelen
+    (illetve bizonytalan kimenetelű) írás után a bejegyzés törlődik.
+    """
+    def hook(method: str, url: str, response: Optional[httpx.Response], elapsed: float) -> None:
+        if method not in ("PUT", "POST", "DELETE", "PATCH"):
+            return
+        parsed = parse_collection_url(url)
+        if parsed is None:
+            return
+        app_id, collection_id, record_id = parsed
+        if method != "DELETE" and response is not None and response.status_code in (200, 201):
+            try:
+                record = response.json()
+            except ValueError:
+                record = None
+            if isinstance(record, dict) and record.get("id") is not None:
+                cache.put(app_id, collection_id, record)
+                return
+        if record_id is not None:
+            cache.invalidate(app_id, collection_id, record_id)
+    return hook
@@ -1,14 +1,41 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+import numpy as np
 import pandas as pd
-import requests
+import httpx
+import asyncio
+import hmac
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 import os
-import json
+import time
 from dotenv import load_dotenv
-from typing import List, Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel
 
+from adalo import (
+    adalo_headers, app_users_url, collection_url, fetch_records_by_id, get_record, iter_collection, parse_collection_url,
+    record_cache_hook
+)
+from app_logging import get_logger, sample, setup_logging
+from bulk_update import bulk_update
+from cache import FileBackedJSON, RecordCache, RefreshingValue, ResponseCache, etag_matches
+from export_jobs import ExportJobManager
+from exports import (
+    EXPORT_FORMATS, ExportProgress, ExportTable, cached_export_response, export_response, parquet_available,
+    present_columns, render_export, table_rows
+)
+from filters import (
+    column, contains_mask, equals_mask, filter_records, filter_stream, iter_batches, nonempty_mask, parse_timestamps
+)
+from http_client import HttpClient
+from mailersend import EmailTemplate, mailersend_headers, send_bulk_emails
+from metrics import REGISTRY, RequestStats, StageTimer, current_request, observe_request, stage, track_upstream_call
+from mutation_jobs import MutationJob, MutationJobRunner
+from profiler import SamplingProfiler
+from transactions_store import PartnerTransactionIndex, TransactionsReplica
+from write_buffer import WriteCoalescer
+
 # Környezeti változók betöltése
 load_dotenv()
 
@@ -35,7 +62,405 @@ ADALO_API_KEY = os.getenv("ADALO_API_KEY", "2oq7qmxcjwa4m1tcqdf1w1e8i")
 # Transactions API kulcs (külön, mert a tranzakciók másik app-ban vannak)
 ADALO_TRANSACTIONS_API_KEY = os.getenv("ADALO_TRANSACTIONS_API_KEY", "2f7hg3qfd2fctfrf3argfal9d")
 
-app = FastAPI(title="Huniexport API")
+# --- HTTP KLIENS KONFIGURÁCIÓ (közös, pool-os kliens minden upstream híváshoz) ---
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# Host-onkénti adaptív párhuzamossági limit: induló érték, ebből nő egészséges válaszidő mellett
+# legfeljebb HTTP_MAX_PER_HOST-ig, és 429 / 5xx esetén csökken
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "20"))
+HTTP_INITIAL_PER_HOST = int(os.getenv("HTTP_INITIAL_PER_HOST", "4"))
+# Újrapróbálkozás 429 / 5xx / hálózati hiba esetén (jitteres exponenciális visszalépés, Retry-After betartásával)
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))
+HTTP_RETRY_MAX_BACKOFF = float(os.getenv("HTTP_RETRY_MAX_BACKOFF", "30"))
+# Az egyszerre futó, azonos upstream GET-ek (URL + paraméterek + fejlécek) egyetlen kérésen osztoznak
+HTTP_SINGLE_FLIGHT = os.getenv("HTTP_SINGLE_FLIGHT", "1") == "1"
+
+# Paginálás: oldalméret és az egyszerre futó oldal-lekérések száma
+ADALO_PAGE_SIZE = int(os.getenv("ADALO_PAGE_SIZE", "100"))
+ADALO_PAGE_CONCURRENCY = int(os.getenv("ADALO_PAGE_CONCURRENCY", "4"))
+# Tömeges frissítéseknél (pl. /notifalse) legfeljebb ennyi PUT lehet folyamatban; a ténylegesen
+# párhuzamos kérések számát a host-onkénti adaptív limit szabályozza
+ADALO_WRITE_CONCURRENCY = int(os.getenv("ADALO_WRITE_CONCURRENCY", "20"))
+
+# --- TRANZAKCIÓ REPLIKA (helyi SQLite másolat háttér-szinkronnal) ---
+TRANSACTIONS_REPLICA_ENABLED = os.getenv("TRANSACTIONS_REPLICA_ENABLED", "1") == "1"
+TRANSACTIONS_REPLICA_PATH = os.getenv("TRANSACTIONS_REPLICA_PATH", "transactions_replica.sqlite3")
+TRANSACTIONS_REPLICA_SYNC_INTERVAL = float(os.getenv("TRANSACTIONS_REPLICA_SYNC_INTERVAL", "60"))
+# Alapértelmezett maximális elavultság (másodperc), ha a kérés nem ad meg max_staleness-t
+TRANSACTIONS_REPLICA_MAX_STALENESS = float(os.getenv("TRANSACTIONS_REPLICA_MAX_STALENESS", "300"))
+
+# --- KUPON CACHE (kupon id -> kupon név, az Excel exporthoz) ---
+COUPONS_CACHE_TTL = float(os.getenv("COUPONS_CACHE_TTL", "300"))
+# Ennyi ideig még a régi érték is kiszolgálható, miközben a háttérben frissül
+COUPONS_CACHE_STALE_TTL = float(os.getenv("COUPONS_CACHE_STALE_TTL", "86400"))
+
+# --- EXPORT CACHE (renderelt partner tranzakció exportok, a replika adatverziójához kötve) ---
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+EXPORT_CACHE_MAX_ENTRIES = int(os.getenv("EXPORT_CACHE_MAX_ENTRIES", "256"))
+
+# --- ASZINKRON EXPORT JOBOK ---
+EXPORT_JOBS_DIR = os.getenv("EXPORT_JOBS_DIR", "export_jobs")
+# Egyszerre legfeljebb ennyi export job fut, a többi sorban áll
+EXPORT_JOBS_MAX_WORKERS = int(os.getenv("EXPORT_JOBS_MAX_WORKERS", "2"))
+# Ennyi másodpercig tölthető le egy kész export, utána a fájl törlődik
+EXPORT_JOBS_TTL = float(os.getenv("EXPORT_JOBS_TTL", "3600"))
+
+# --- TARTÓS MÓDOSÍTÓ JOBOK (set-all-hungarian, notifalse, auto-delete-users) ---
+MUTATION_JOBS_PATH = os.getenv("MUTATION_JOBS_PATH", "mutation_jobs.sqlite3")
+# Futás közben legfeljebb ennyi másodpercenként íródik ki a checkpoint
+MUTATION_JOBS_CHECKPOINT_INTERVAL = float(os.getenv("MUTATION_JOBS_CHECKPOINT_INTERVAL", "2"))
+
+# Az automatikus törlésnél egyszerre ennyi user törlése fut (az upstream kéréseket a HTTP kliens limitje korlátozza)
+AUTO_DELETE_CONCURRENCY = int(os.getenv("AUTO_DELETE_CONCURRENCY", "4"))
+
+# --- REKORD CACHE ---
+# Egyedi Adalo rekordok (user, tranzakció) cache-e listázásból és egyedi lekérésből;
+# a saját írásaink frissítik / érvénytelenítik. Az appból közvetlenül végzett módosításokat
+# nem látja, ezért a TTL legyen rövid, és írás / törlés előtti olvasáshoz nem használjuk.
+RECORD_CACHE_ENABLED = os.getenv("RECORD_CACHE_ENABLED", "1") == "1"
+RECORD_CACHE_TTL = float(os.getenv("RECORD_CACHE_TTL", "60"))
+RECORD_CACHE_MAX_ENTRIES = int(os.getenv("RECORD_CACHE_MAX_ENTRIES", "20000"))
+
+# --- USER ÍRÁSOK ÖSSZEFÉSÜLÉSE ---
+# Az ugyanarra a userre rövid időn belül érkező mezőfrissítések (/hun, /eng, /lang/batch,
+# /notifalse, /set-all-hungarian) egyetlen PUT-ba olvadnak össze
+USER_WRITE_COALESCING_ENABLED = os.getenv("USER_WRITE_COALESCING_ENABLED", "1") == "1"
+# Egy PUT után ennyi másodpercig gyűjtjük az ugyanarra a userre érkező további frissítéseket
+USER_WRITE_COALESCE_WINDOW = float(os.getenv("USER_WRITE_COALESCE_WINDOW", "0.2"))
+
+# --- MAILERSEND ---
+MAILERSEND_API_KEY = os.getenv("MAILERSEND_API_KEY", "mlsn.f16b8868e4730cd3c9f9f5319e2b20c7627b8548541ba811c7a77c9281ce0d2c")
+# Felülírható, pl. egy helyi, MailerSend-et utánzó szerverre teszteléshez / benchmarkhoz
+MAILERSEND_BULK_URL = os.getenv("MAILERSEND_BULK_URL", "https://api.mailersend.com/v1/bulk-email")
+# Egy batch-ben ennyi email objektum megy ki (a MailerSend legfeljebb 500-at fogad el)
+MAILERSEND_BATCH_SIZE = int(os.getenv("MAILERSEND_BATCH_SIZE", "500"))
+# Egyszerre ennyi batch küldése fut; a 429 választ a HTTP kliens Retry-After szerint kezeli
+MAILERSEND_CONCURRENCY = int(os.getenv("MAILERSEND_CONCURRENCY", "4"))
+# Kapcsolódási hiba vagy Retry-After-es 503 esetén egy batch legfeljebb ennyiszer megy ki újra
+# (más hiba után nem: a bulk küldés nem idempotens)
+MAILERSEND_MAX_RETRIES = int(os.getenv("MAILERSEND_MAX_RETRIES", "3"))
+
+# --- PROFILOZÁS ---
+# A ?profile=1 mód csak ezzel a kulccsal (X-Admin-Key fejléc) érhető el; üresen a mód ki van kapcsolva
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
+# A mintavételező profiler ennyi másodpercenként veszi a hívási láncokat
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+# --- NAPLÓZÁS ---
+# Alapszint (DEBUG, INFO, WARNING, ERROR)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Útvonalankénti szintek a route sablon szerint, pl. "/download-transactions/{partner_id}=WARNING,/deleteuser/{user_id}=DEBUG"
+LOG_ROUTE_LEVELS = os.getenv("LOG_ROUTE_LEVELS", "")
+# A rekordonkénti (ciklusban keletkező) üzenetekből kulcsonként minden N-edik kerül ki
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+# A kiírásra váró rekordok sorának mérete; tele sor esetén az új rekordok eldobódnak (a kérés nem vár)
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# "json" (soronként egy JSON objektum) vagy "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+
+logging_setup = setup_logging(
+    level=LOG_LEVEL,
+    route_levels=LOG_ROUTE_LEVELS,
+    sample_every=LOG_SAMPLE_EVERY,
+    queue_size=LOG_QUEUE_SIZE,
+    json_lines=LOG_FORMAT == "json",
+    # Ezek az értékek sehol nem jelenhetnek meg a naplóban
+    secrets=[ADALO_API_KEY, ADALO_TRANSACTIONS_API_KEY, MAILERSEND_API_KEY, ADMIN_API_KEY],
+)
+log = get_logger("app")
+
+http_client = HttpClient(
+    timeout=HTTP_TIMEOUT,
+    connect_timeout=HTTP_CONNECT_TIMEOUT,
+    max_connections=HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    max_per_host=HTTP_MAX_PER_HOST,
+    initial_per_host=HTTP_INITIAL_PER_HOST,
+    max_retries=HTTP_MAX_RETRIES,
+    retry_backoff=HTTP_RETRY_BACKOFF,
+    retry_max_backoff=HTTP_RETRY_MAX_BACKOFF,
+    single_flight=HTTP_SINGLE_FLIGHT,
+)
+
+record_cache = RecordCache("records", ttl=RECORD_CACHE_TTL, max_entries=RECORD_CACHE_MAX_ENTRIES if RECORD_CACHE_ENABLED else 0)
+http_client.add_response_hook(record_cache_hook(record_cache))
+
+def upstream_call_type(method: str, url: str) -> str:
+    """
+    Upstream hívás típusa a metrikákhoz: list_page, get, put, post, delete vagy mailersend_bulk.
+    """
+    if url.startswith(MAILERSEND_BULK_URL):
+        return "mailersend_bulk"
+    if method == "GET":
+        parsed = parse_collection_url(url)
+        return "get" if parsed is not None and parsed[2] is not None else "list_page"
+    return method.lower()
+
+def upstream_metrics_hook(method: str, url: str, response: Optional[httpx.Response], elapsed: float) -> None:
+    track_upstream_call(
+        upstream_call_type(method, url),
+        str(response.status_code) if response is not None else "error",
+        elapsed,
+        len(response.content) if response is not None else 0
+    )
+
+http_client.add_response_hook(upstream_metrics_hook)
+
+# A user rekordokra érkező PUT-ok rövid időn belül egyetlen PUT-ba olvadnak össze
+user_writes = WriteCoalescer(http_client, window=USER_WRITE_COALESCE_WINDOW, enabled=USER_WRITE_COALESCING_ENABLED)
+
+def _replica_source():
+    return adalo_records(
+        collection_url(ADALO_TRANSACTIONS_APP_ID, ADALO_TRANSACTIONS_COLLECTION_ID),
+        adalo_headers(ADALO_API_KEY),
+        cache_records=False
+    )
+
+transactions_replica: Optional[TransactionsReplica] = None
+# Partner -> 'finalized' tranzakciók memóriabeli indexe, a replika szinkron tartja naprakészen
+transactions_index = PartnerTransactionIndex()
+
+export_jobs = ExportJobManager(EXPORT_JOBS_DIR, max_workers=EXPORT_JOBS_MAX_WORKERS, ttl=EXPORT_JOBS_TTL)
+
+mutation_jobs: Optional[MutationJobRunner] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global transactions_replica, mutation_jobs
+    # A közös HTTP kliens az app indulásakor jön létre és leálláskor zárul
+    await http_client.start()
+    if TRANSACTIONS_REPLICA_ENABLED:
+        transactions_replica = TransactionsReplica(
+            TRANSACTIONS_REPLICA_PATH,
+            _replica_source,
+            sync_interval=TRANSACTIONS_REPLICA_SYNC_INTERVAL,
+            index=transactions_index,
+        )
+        transactions_replica.start()
+    export_jobs.start()
+    # A félbemaradt módosító jobok (pl. egy deploy miatt) itt folytatódnak
+    mutation_jobs = MutationJobRunner(MUTATION_JOBS_PATH, checkpoint_interval=MUTATION_JOBS_CHECKPOINT_INTERVAL)
+    mutation_jobs.register("notifalse", notifalse_job)
+    mutation_jobs.register("set-all-hungarian", set_all_hungarian_job)
+    mutation_jobs.register("auto-delete-users", auto_delete_users_job)
+    mutation_jobs.start()
+    yield
+    await mutation_jobs.stop()
+    mutation_jobs.close()
+    mutation_jobs = None
+    await export_jobs.stop()
+    if transactions_replica is not None:
+        await transactions_replica.stop()
+        transactions_replica.close()
+        transactions_replica = None
+    # A még összefésülésre váró user írások leállás előtt kimennek
+    await user_writes.flush()
+    await http_client.close()
+
+app = FastAPI(title="Huniexport API", lifespan=lifespan)
+
+# Egyszerre csak egy kérés profilozható (a mintavétel az egész folyamatra vonatkozik)
+profile_lock = asyncio.Lock()
+
+def admin_authorized(request: Request) -> bool:
+    key = request.headers.get("x-admin-key", "")
+    return bool(ADMIN_API_KEY) and hmac.compare_digest(key.encode(), ADMIN_API_KEY.encode())
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """
+    ?profile=1 (csak admin): a kérés a szokásos módon lefut, a válasz törzse (pl. a teljes export fájl)
+    is elkészül, de eldobjuk, és helyette a közben futó mintavételező profiler riportja megy vissza.
+    """
+    if request.query_params.get("profile") not in ("1", "true"):
+        return await call_next(request)
+    if not admin_authorized(request):
+        return JSONResponse({"detail": "A profilozás csak admin kulccsal (X-Admin-Key) érhető el"}, status_code=403)
+    if profile_lock.locked():
+        return JSONResponse({"detail": "Már fut egy profilozott kérés"}, status_code=409)
+    async with profile_lock:
+        profiler = SamplingProfiler(interval=PROFILE_SAMPLE_INTERVAL)
+        profiler.start()
+        body_bytes = 0
+        try:
+            response = await call_next(request)
+            async for chunk in response.body_iterator:
+                body_bytes += len(chunk)
+        finally:
+            profiler.stop()
+    title = f"Profil: {request.method} {request.url.path}?{request.url.query} -> {response.status_code}, {body_bytes} bájt válasz"
+    return PlainTextResponse(profiler.report(title))
+
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    # A kérés upstream statisztikája és szakaszidői contextvar-ban gyűlnek (a kérésből indított taskokban is)
+    stats = RequestStats(request.scope)
+    token = current_request.set(stats)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        # Streamelt válasznál a sorok formázása és a fájl írása (format / render) a fejléc után történik, így az itt nem
+        # látszik; profilozott kérésnél a törzs már elkészült, ott benne van
+        response.headers["Server-Timing"] = stats.server_timing(time.perf_counter() - started)
+        return response
+    finally:
+        current_request.reset(token)
+        observe_request(stats, request.method, status_code, time.perf_counter() - started)
+
+def adalo_records(url: str, headers: dict, cache_records: bool = True, **kwargs):
+    """
+    Egy Adalo collection összes rekordja rekordonként, a közös kliensen és paginálási beállításokkal.
+    `cache_records=False` esetén a lekért rekordok nem kerülnek a rekord cache-be (pl. a replika
+    teljes szinkronjánál, ami kiszorítaná a többi bejegyzést).
+    """
+    kwargs.setdefault("page_size", ADALO_PAGE_SIZE)
+    kwargs.setdefault("concurrency", ADALO_PAGE_CONCURRENCY)
+    parsed = parse_collection_url(url)
+    if RECORD_CACHE_ENABLED and cache_records and parsed is not None:
+        # A listázott oldalak a rekord cache-t is feltöltik
+        app_id, collection_id, _ = parsed
+        on_page = kwargs.get("on_page")
+
+        def cache_page(records):
+            record_cache.put_many(app_id, collection_id, records)
+            if on_page is not None:
+                on_page(records)
+        kwargs["on_page"] = cache_page
+    return iter_collection(http_client, url, headers, **kwargs)
+
+async def load_coupon_names() -> dict:
+    """
+    Kupon id -> coupon_name szótár a teljes kupon collection-ből.
+    """
+    coupons_url = collection_url(ADALO_COUPONS_APP_ID, ADALO_COUPONS_COLLECTION_ID)
+    coupons_headers = adalo_headers(ADALO_TRANSACTIONS_API_KEY)
+    coupons_dict = {}
+    async for coupon in adalo_records(coupons_url, coupons_headers):
+        coupons_dict[coupon.get("id")] = coupon.get("coupon_name", "")
+    return coupons_dict
+
+def add_coupon_names(transactions: List[dict], coupons_dict: dict) -> None:
+    """
+    Minden tranzakcióba coupon_name kerül az első coupon_transaction ID alapján (kupon nélkül üres).
+    """
+    for transaction in transactions:
+        coupon_ids = transaction.get("coupon_transaction", [])
+        if coupon_ids and isinstance(coupon_ids, list) and len(coupon_ids) > 0:
+            coupon_id = coupon_ids[0]  # Első kupon ID használata
+            transaction["coupon_name"] = coupons_dict.get(coupon_id, "")
+            log.debug("Tranzakció %s: coupon_id=%s, coupon_name='%s'", transaction.get('id'), coupon_id, transaction['coupon_name'], extra=sample("coupon_join"))
+        else:
+            transaction["coupon_name"] = ""
+            log.debug("Tranzakció %s: nincs kupon", transaction.get('id'), extra=sample("coupon_join"))
+
+coupons_cache = RefreshingValue("coupons", load_coupon_names, ttl=COUPONS_CACHE_TTL, stale_ttl=COUPONS_CACHE_STALE_TTL)
+
+export_cache = ResponseCache("exports", max_bytes=EXPORT_CACHE_MAX_BYTES, max_entries=EXPORT_CACHE_MAX_ENTRIES)
+
+# Nyelvi szövegcsomagok (text_ mezők); a fájl módosításakor automatikusan újratöltődnek
+text_bundles = {
+    language: FileBackedJSON(os.path.join(os.path.dirname(__file__), f"texts_{language}.json"))
+    for language in ("hun", "eng")
+}
+
+def replica_usable(max_staleness: Optional[float]) -> bool:
+    """
+    Igaz, ha a helyi tranzakció replika elég friss a kéréshez (max_staleness=0 mindig élő olvasást kér).
+    """
+    if transactions_replica is None:
+        return False
+    staleness = transactions_replica.staleness()
+    if staleness is None:
+        return False
+    limit = TRANSACTIONS_REPLICA_MAX_STALENESS if max_staleness is None else max_staleness
+    return staleness <= limit
+
+def select_partner_transactions(
+    transactions: List[dict],
+    partner_id: int,
+    from_datetime: Optional[datetime] = None,
+    to_datetime: Optional[datetime] = None,
+    check_dates: bool = True
+) -> List[dict]:
+    """
+    A 'finalized', az adott partnerhez tartozó tranzakciók, updated_at alapján a dátum tartományban.
+    Hibás updated_at esetén a tranzakció kimarad; hiányzó updated_at csak dátumszűrő esetén zárja ki.
+    check_dates=False esetén a dátumot egyáltalán nem vizsgálja.
+    """
+    return filter_records(
+        transactions,
+        where=lambda records: equals_mask(records, "transaction_status", "finalized")
+        & contains_mask(records, "partner_transaction", partner_id),
+        date_field="updated_at" if check_dates else None,
+        from_datetime=from_datetime,
+        to_datetime=to_datetime,
+        label="tranzakcióban"
+    )
+
+def select_users_created_between(
+    users: List[dict],
+    email_field: str,
+    from_datetime: Optional[datetime] = None,
+    to_datetime: Optional[datetime] = None
+) -> List[dict]:
+    """
+    A nem üres email címmel rendelkező userek, created_at alapján a dátum tartományban
+    (hibás created_at esetén kimarad, hiányzó created_at csak dátumszűrő esetén zárja ki).
+    """
+    return filter_records(
+        users,
+        where=lambda records: nonempty_mask(records, email_field),
+        date_field="created_at",
+        from_datetime=from_datetime,
+        to_datetime=to_datetime,
+        label="felhasználóban"
+    )
+
+def parse_date_window(from_date: Optional[str], to_date: Optional[str]):
+    """
+    DD/MM/YYYY from_date/to_date paraméterek (from_datetime, to_datetime) párrá alakítása (UTC).
+    A to_date a nap végéig tart; hibás formátum vagy fordított tartomány esetén 400-at dob.
+    """
+    from_datetime = None
+    if from_date:
+        try:
+            # Próbáljuk meg DD/MM/YYYY formátumként értelmezni, és a nap elejére (UTC) konvertálni
+            from_datetime = datetime.strptime(from_date, '%d/%m/%Y').replace(tzinfo=timezone.utc)
+            log.debug("Szűrési kezdő dátum: %s", from_datetime)
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail="Érvénytelen dátum formátum a from_date paraméterben. Használd a DD/MM/YYYY formátumot."
+            )
+
+    to_datetime = None
+    if to_date:
+        try:
+            # Próbáljuk meg DD/MM/YYYY formátumként értelmezni, és a nap végére (UTC) konvertálni
+            # Hozzáadunk 1 napot és visszamegyünk 1 másodpercet, hogy a nap végét is magába foglalja
+            to_datetime = datetime.strptime(to_date, '%d/%m/%Y').replace(tzinfo=timezone.utc)
+            to_datetime = to_datetime + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+            log.debug("Szűrési záró dátum: %s", to_datetime)
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail="Érvénytelen dátum formátum a to_date paraméterben. Használd a DD/MM/YYYY formátumot."
+            )
+
+    # Dátum tartomány validálása (ha mindkettő meg van adva)
+    if from_datetime and to_datetime and from_datetime > to_datetime:
+        raise HTTPException(
+            status_code=400,
+            detail="A from_date nem lehet későbbi, mint a to_date."
+        )
+    return from_datetime, to_datetime
 
 class Transaction(BaseModel):
     id: int
@@ -68,21 +493,54 @@ class SendMailsRequest(BaseModel):
     # Opcionális user lista (ha nincs megadva, akkor az összes user)
     user_emails: Optional[List[str]] = None
 
-@app.get("/notifalse")
-async def notifalse():
+class LanguageBatchRequest(BaseModel):
+    user_ids: List[int]
+    language: Literal["hun", "eng"]
+
+class ExportJobRequest(BaseModel):
+    # Melyik export fusson: /download-transactions, /download-users vagy /download-users-collection megfelelője
+    kind: Literal["partner-transactions", "users", "users-collection"]
+    format: Literal["xlsx", "csv", "ndjson", "parquet"] = "xlsx"
+    # Csak a partner-transactions exporthoz kötelező
+    partner_id: Optional[int] = None
+    from_date: Optional[str] = None
+    to_date: Optional[str] = None
+    max_staleness: Optional[float] = None
+
+def job_checkpoint(job: MutationJob):
     """
-    Lekéri az összes usert, és mindegyiknél a latestnotivisited mezőt false-ra állítja (PUT-tal, csak Adalo által elvárt mezőkkel és alapértelmezett értékekkel).
-    GET kérésre is működik, így elég csak betölteni az URL-t.
+    bulk_update on_result callback: minden írás eredménye bekerül a job checkpointjába.
+    """
+    def on_result(record_id, error: Optional[dict]) -> None:
+        if error is None:
+            job.record_success(record_id)
+        else:
+            job.record_failure(record_id, error)
+    return on_result
+
+async def run_mutation_job(kind: str, background: bool):
+    """
+    Módosító job indítása (vagy a már futó, azonos fajtájú job átvétele). Háttér módban azonnal
+    a job adataival tér vissza, különben megvárja a végét és a korábbi válasz formátumát adja.
+    """
+    job = mutation_jobs.submit(kind)
+    if background:
+        return job.to_dict()
+    await mutation_jobs.wait(job)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    return job.result
+
+async def notifalse_job(job: MutationJob) -> dict:
+    """
+    A /notifalse job törzse; a checkpointban már szereplő usereket kihagyja.
     """
     app_id = ADALO_USERS_APP_ID
     collection_id = ADALO_USERS_COLLECTION_ID
     api_key = ADALO_API_KEY
 
-    users_url = f"https://api.adalo.com/v0/apps/{app_id}/collections/{collection_id}"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    users_url = collection_url(app_id, collection_id)
+    headers = adalo_headers(api_key)
 
     allowed_fields = [
         "Email", "valami", "Full Name", "Transactions (jouser_transact)s", "level_name", "liked_coupons",
@@ -119,119 +577,105 @@ async def notifalse():
         "Admin?": False
     }
 
-    response = requests.get(users_url, headers=headers)
-    if response.status_code != 200:
-        raise HTTPException(status_code=response.status_code, detail=f"Adalo API hiba: {response.text}")
-    data = response.json()
-    users = data.get("records", [])
-
-    updated = 0
-    errors = []
-    for user in users:
-        user_id = user.get("id")
-        if user_id is None:
-            continue
-        get_url = f"https://api.adalo.com/v0/apps/{app_id}/collections/{collection_id}/{user_id}"
-        get_resp = requests.get(get_url, headers=headers)
-        if get_resp.status_code != 200:
-            errors.append({"user_id": user_id, "status": get_resp.status_code, "body": get_resp.text, "step": "get"})
-            continue
-        full_record = get_resp.json()
+    # Egy folytatott job korábbi futásaiban már feldolgozott userek (ezek nem "kihagyottak")
+    already_done = 0
+
+    def build_payload(user: dict) -> Optional[dict]:
+        nonlocal already_done
+        if job.is_done(user["id"]):
+            already_done += 1
+            return None
+        # Akinél már false, annál nincs mit írni
+        if user.get("latestnotivisited") is False:
+            return None
+        # A PUT törzs a listázásban kapott rekordból készül (nincs külön GET userenként)
         filtered_record = {}
         for k in allowed_fields:
-            v = full_record.get(k, None)
+            v = user.get(k, None)
             if v is None:
                 filtered_record[k] = default_values[k]
             else:
                 filtered_record[k] = v
         filtered_record["latestnotivisited"] = False
-        put_url = get_url
-        put_resp = requests.put(put_url, headers=headers, json=filtered_record)
-        if put_resp.status_code in [200, 201]:
-            updated += 1
-        else:
-            errors.append({"user_id": user_id, "status": put_resp.status_code, "body": put_resp.text, "step": "put", "sent": filtered_record})
-
+        return filtered_record
+
+    result = await bulk_update(
+        user_writes,
+        adalo_records(users_url, headers),
+        lambda user_id: collection_url(app_id, collection_id, user_id),
+        headers,
+        build_payload,
+        concurrency=ADALO_WRITE_CONCURRENCY,
+        on_result=job_checkpoint(job)
+    )
+    log.info("notifalse kész: %s", result.to_dict())
+
+    # Az eredmény a checkpointból készül, így egy folytatott job a korábbi futások írásait is tartalmazza
     return {
-        "updated_users": updated,
-        "errors": errors,
-        "total_users": len(users)
+        "updated_users": len(job.succeeded),
+        "skipped_users": result.skipped - already_done,
+        "errors": [entry["detail"] for entry in job.failed],
+        "total_users": result.total,
+        "stats": result.to_dict()
     }
 
+@app.get("/notifalse")
+async def notifalse(
+    background: bool = Query(False, description="Optional: true esetén azonnal visszatér a job adataival (haladás: GET /jobs/{job_id})")
+):
+    """
+    Lekéri az összes usert, és mindegyiknél a latestnotivisited mezőt false-ra állítja (PUT-tal, csak Adalo által elvárt mezőkkel és alapértelmezett értékekkel).
+    GET kérésre is működik, így elég csak betölteni az URL-t.
+    A PUT törzs a listázott rekordból készül, a már false értékű userek kimaradnak, az írások párhuzamosan futnak.
+    Tartós háttér jobként fut: újraindítás után onnan folytatódik, ahol abbamaradt.
+    """
+    return await run_mutation_job("notifalse", background)
+
 @app.post("/get-partner-transactions")
-async def get_partner_transactions(request_data: GetTransactionsRequest):
+async def get_partner_transactions(
+    request_data: GetTransactionsRequest,
+    max_staleness: Optional[float] = Query(None, description="Optional: A helyi replika maximális elavultsága másodpercben (0 = mindig élő Adalo lekérdezés)")
+):
     """
     Lekéri egy partner összes 'finalized' tranzakcióját és JSON-ként visszaadja (nincs API kulcs védelem)
     Ez a végpont Adalo custom function-ök számára készült.
+    Ha a helyi tranzakció replika elég friss, abból szolgálja ki a kérést.
     """
     partner_id = request_data.partner_id
 
     if not ADALO_API_KEY:
         raise HTTPException(status_code=500, detail="Adalo API kulcs nincs beállítva (ADALO_API_KEY környezeti változó)")
 
-    print(f"\n=== Új kérés kezdése partner_id={partner_id} ===")
+    log.info("Új kérés kezdése partner_id=%s", partner_id)
     
     # Adalo API hívás
-    url = f"https://api.adalo.com/v0/apps/{ADALO_TRANSACTIONS_APP_ID}/collections/{ADALO_TRANSACTIONS_COLLECTION_ID}"
-    headers = {
-        "Authorization": f"Bearer {ADALO_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    url = collection_url(ADALO_TRANSACTIONS_APP_ID, ADALO_TRANSACTIONS_COLLECTION_ID)
+    headers = adalo_headers(ADALO_API_KEY)
     
-    print(f"API URL: {url}")
-    print(f"API Headers: {headers}")
+    log.debug("API URL: %s", url)
     
     try:
-        print("Adalo API hívás indítása...")
-        response = requests.get(url, headers=headers)
-        print(f"Adalo API válasz státuszkód: {response.status_code}")
-        print(f"Adalo API válasz fejlécek: {dict(response.headers)}")
-        
-        if response.status_code != 200:
-            print(f"Hibás Adalo API válasz: {response.text}")
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Adalo API hiba: {response.text}"
-            )
-        
-        print("Adalo API válasz feldolgozása...")
-        print(f"Válasz tartalom (első 1000 karakter): {response.text[:1000]}")
+        if replica_usable(max_staleness):
+            log.debug("Tranzakciók lekérdezése a helyi replikából...")
+            with stage("fetch"):
+                if transactions_index.is_ready:
+                    finalized_partner_transactions = transactions_index.lookup(partner_id, include_bad_dates=True)
+                else:
+                    finalized_partner_transactions = await transactions_replica.partner_transactions(partner_id)
+            log.info("Talált 'finalized' partner tranzakciók száma (replika): %s", len(finalized_partner_transactions))
+            return JSONResponse(content=finalized_partner_transactions, status_code=200)
+
+        log.debug("Adalo API hívás indítása (paginálva)...")
         
         try:
-            transactions = response.json()
-            print(f"JSON válasz típusa: {type(transactions)}")
-            
-            # Adalo API válasz formátum ellenőrzése
-            if isinstance(transactions, dict):
-                if "records" in transactions:
-                    transactions = transactions["records"]
-                    print(f"Talált records lista hossza: {len(transactions)}")
-                #else:
-                    # Adalo API néha közvetlenül a listát adja vissza dictionary nélkül
-                    #print(f"Hiányzó 'records' kulcs az Adalo API válaszból. Elérhető kulcsok: {list(transactions.keys())}")
-                    #raise HTTPException(
-                    #    status_code=500,
-                    #    detail=f"Hiányzó 'records' kulcs az Adalo API válaszból. Elérhető kulcsok: {list(transactions.keys())}"
-                    #)
-            elif not isinstance(transactions, list):
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Váratlan Adalo API válasz formátum: {type(transactions)}"
-                )
-            
-            print(f"Összes Adalo tranzakció száma: {len(transactions)}")
-            
-            # Szűrés partner ID és státusz alapján
-            finalized_partner_transactions = []
-            for t in transactions:
-                if isinstance(t, dict):
-                    #print(f"Tranzakció kulcsok: {list(t.keys())}") # Túl sok log lehet
-                    if t.get("transaction_status") == "finalized":
-                         if "partner_transaction" in t:
-                            if partner_id in t["partner_transaction"]:
-                                finalized_partner_transactions.append(t)
+            # Szűrés partner ID és státusz alapján, oldalanként (a teljes collection nem kerül a memóriába)
+            total_transactions, finalized_partner_transactions = await filter_stream(
+                adalo_records(url, headers),
+                lambda batch: select_partner_transactions(batch, partner_id, check_dates=False)
+            )
             
-            print(f"Talált 'finalized' partner tranzakciók száma: {len(finalized_partner_transactions)}")
+            log.info("Összes Adalo tranzakció száma: %s", total_transactions)
+            log.info("Talált 'finalized' partner tranzakciók száma: %s", len(finalized_partner_transactions))
             
             if not finalized_partner_transactions:
                 # 200-as státusz, de üres lista, ha nincs találat (Adalo custom function friendly)
@@ -250,734 +694,443 @@ async def get_partner_transactions(request_data: GetTransactionsRequest):
             return JSONResponse(content=finalized_partner_transactions, status_code=200)
             
         except ValueError as e:
-            print(f"JSON feldolgozási hiba: {str(e)}")
+            log.error("JSON feldolgozási hiba: %s", e)
             raise HTTPException(
                 status_code=500,
                 detail=f"Hibás JSON válasz az Adalo API-tól: {str(e)}"
             )
         
-    except requests.exceptions.RequestException as e:
-        print(f"Adalo API hívási hiba: {str(e)}")
+    except httpx.HTTPError as e:
+        log.error("Adalo API hívási hiba: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Hiba az Adalo API hívás során: {str(e)}"
         )
     except Exception as e:
-         print(f"Váratlan hiba történt: {str(e)}")
+         log.exception("Váratlan hiba történt: %s", e)
          raise HTTPException(status_code=500, detail=f"Váratlan szerverhiba: {str(e)}")
 
+async def build_partner_transactions_export(
+    partner_id: int,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    max_staleness: Optional[float] = None,
+    progress: Optional[ExportProgress] = None
+) -> ExportTable:
+    """
+    Egy partner 'finalized' tranzakcióinak exportja (szűrés, kupon nevek, oszlopok, formázás).
+    A /download-transactions végpont és az aszinkron export jobok közösen használják.
+    """
+    # Adalo API hívás
+    url = collection_url(ADALO_TRANSACTIONS_APP_ID, ADALO_TRANSACTIONS_COLLECTION_ID)
+    headers = adalo_headers(ADALO_API_KEY)
+
+    log.debug("API URL: %s", url)
+
+    # Dátum paraméterek feldolgozása
+    from_datetime, to_datetime = parse_date_window(from_date, to_date)
+
+    # Szűrés partner ID, státusz és dátum tartomány alapján
+    if replica_usable(max_staleness) and transactions_index.is_ready:
+        # Memóriabeli index: bináris keresés a partner dátum szerint rendezett tranzakcióin
+        log.debug("Tranzakciók lekérdezése a memóriabeli indexből (Excel végpont)...")
+        with stage("fetch"):
+            finalized_partner_transactions = transactions_index.lookup(partner_id, from_datetime, to_datetime)
+        total_transactions = len(finalized_partner_transactions)
+    elif replica_usable(max_staleness):
+        # Friss helyi replika: indexelt lekérdezés, Adalo hívás nélkül
+        log.debug("Tranzakciók lekérdezése a helyi replikából (Excel végpont)...")
+        with stage("fetch"):
+            candidates = await transactions_replica.partner_transactions(
+                partner_id, updated_from=from_datetime, updated_to=to_datetime
+            )
+        total_transactions = len(candidates)
+        with stage("filter"):
+            finalized_partner_transactions = select_partner_transactions(candidates, partner_id, from_datetime, to_datetime)
+    else:
+        # Élő lekérdezés az Adalo API-ból, oldalanként, vektorizált szűréssel
+        total_transactions, finalized_partner_transactions = await filter_stream(
+            adalo_records(url, headers, on_page=progress.page_fetched if progress else None),
+            lambda batch: select_partner_transactions(batch, partner_id, from_datetime, to_datetime)
+        )
+    
+    log.info("Összes Adalo tranzakció száma (Excel végpont): %s", total_transactions)
+    log.info("Talált 'finalized' partner tranzakciók száma (Excel végpont, dátum szűrővel): %s", len(finalized_partner_transactions))
+    
+    if not finalized_partner_transactions:
+         # Excel végponton 404-et adunk vissza, ha nincs adat
+         raise HTTPException(
+            status_code=404,
+            detail=f"Nem található 'finalized' tranzakció a partner_id={partner_id} számára"
+         )
+    
+    # Kuponok lekérdezése és coupon_name hozzáadása a DataFrame létrehozása ELŐTT
+    log.debug("Kuponok lekérdezése a coupon_name mezőhöz (cache)...")
+    coupons_dict = {}
+    with stage("coupons"):
+        try:
+            coupons_dict = await coupons_cache.get()
+            log.debug("Sikeresen betöltött %s kupon", len(coupons_dict))
+        except HTTPException as e:
+            log.warning("Kuponok lekérdezése sikertelen: %s", e.status_code)
+        except Exception as e:
+            log.warning("Hiba a kuponok lekérdezése során: %s", e)
+
+        # coupon_name hozzáadása a tranzakciókhoz MINDEN tranzakcióhoz
+        log.debug("Coupon_name hozzáadása a tranzakciókhoz...")
+        add_coupon_names(finalized_partner_transactions, coupons_dict)
+    
+    # Kívánt oszlopok kiválasztása és átnevezése
+    desired_columns = [
+        "id",
+        "transaction_status",
+        "user_transaction",
+        "partner_transaction", # Eredetileg kért oszlop, de a lekeresnel szurtunk ra, user_transaction es coupon_transaction volt helyette
+        "coupon_transaction",
+        "coupon_name",
+        "spend_value",
+        "discount_value",
+        "saved_value",
+        "hunicoin_value",
+        "jutalek_value",
+        "updated_at"
+    ]
+    # Ellenőrizzük, hogy a kívánt oszlopok léteznek-e a tranzakciókban
+    with stage("columns"):
+        existing_columns = present_columns(finalized_partner_transactions, desired_columns)
+    log.debug("Oszlopok (kiválasztott): %s", existing_columns)
+    
+    # Fejlécek átnevezése
+    column_mapping = {
+        "id": "Tranzakció azonosítója",
+        "transaction_status": "Tranzakció státusza",
+        "user_transaction": "User id-ja",
+        "partner_transaction": "Partner id-ja", # Hozzáadva az átnevezéshez, ha létezik
+        "coupon_transaction": "Kupon id-ja",
+        "coupon_name": "Kupon neve",
+        "spend_value": "Költés",
+        "discount_value": "Kedvezmény %",
+        "saved_value": "Spórolás",
+        "hunicoin_value": "Hunicoinok száma",
+        "jutalek_value": "Jutalék összege",
+        "updated_at": "Tranzakció dátuma"
+    }
+    headers = [column_mapping.get(col, col) for col in existing_columns]
+    
+    # Sorok előállítása: a 'Tranzakció dátuma' (updated_at) 'YYYY-MM-DD HH:MM' formátumban (UTC)
+    rows = table_rows(finalized_partner_transactions, existing_columns, date_columns=["updated_at"])
+    
+    if progress is not None:
+        progress.rows_total = len(finalized_partner_transactions)
+    basename = f"transactions_partner_{partner_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    return ExportTable(basename, headers, rows)
+
+
 @app.get("/download-transactions/{partner_id}")
 async def download_partner_transactions(
+    request: Request,
     partner_id: int,
-    background_tasks: BackgroundTasks,
     from_date: Optional[str] = Query(None, description="Optional: Szűrés ettől a dátumtól (DD/MM/YYYY formátum)"),
-    to_date: Optional[str] = Query(None, description="Optional: Szűrés eddig a dátumig (DD/MM/YYYY formátum)")
+    to_date: Optional[str] = Query(None, description="Optional: Szűrés eddig a dátumig (DD/MM/YYYY formátum)"),
+    max_staleness: Optional[float] = Query(None, description="Optional: A helyi replika maximális elavultsága másodpercben (0 = mindig élő Adalo lekérdezés)"),
+    export_format: Literal["xlsx", "csv", "ndjson", "parquet"] = Query("xlsx", alias="format", description="Optional: Export formátum (xlsx, csv, ndjson vagy parquet)")
 ):
     """
-    Lekéri egy partner összes 'finalized' tranzakcióját és Excel fájlként visszaadja.
+    Lekéri egy partner összes 'finalized' tranzakcióját és Excel fájlként (vagy format szerint CSV/NDJSON/Parquet) visszaadja.
     Szűrhető a tranzakció dátuma alapján (updated_at) egy megadott időszakban.
     Ez a végpont közvetlen böngésző vagy Adalo 'Open Website' híváshoz készült.
+    Ha a helyi tranzakció replika elég friss, abból szolgálja ki a kérést; ilyenkor a kész fájl
+    a replika adatverziójával együtt cache-be kerül, és ETag / If-None-Match alapján 304 is adható.
     """
     if not ADALO_API_KEY:
         raise HTTPException(status_code=500, detail="Adalo API kulcs nincs beállítva (ADALO_API_KEY környezeti változó)")
 
-    print(f"\n=== Új Excel letöltési kérés kezdése partner_id={partner_id} ===")
-    
-    # Adalo API hívás
-    url = f"https://api.adalo.com/v0/apps/{ADALO_TRANSACTIONS_APP_ID}/collections/{ADALO_TRANSACTIONS_COLLECTION_ID}"
-    headers = {
-        "Authorization": f"Bearer {ADALO_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    print(f"API URL: {url}")
-    print(f"API Headers: {headers}")
+    if export_format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="A parquet exporthoz a pyarrow csomag szükséges")
+
+    log.info("Új Excel letöltési kérés kezdése partner_id=%s", partner_id)
     
     try:
-        print("Adalo API hívás indítása (Excel végpont)...")
-        response = requests.get(url, headers=headers)
-        print(f"Adalo API válasz státuszkód: {response.status_code}")
-        print(f"Adalo API válasz fejlécek: {dict(response.headers)}")
-        
-        if response.status_code != 200:
-            print(f"Hibás Adalo API válasz (Excel végpont): {response.text}")
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Adalo API hiba: {response.text}"
-            )
-        
-        print("Adalo API válasz feldolgozása (Excel végpont)...")
-        print(f"Válasz tartalom (első 1000 karakter): {response.text[:1000]}")
+        log.debug("Adalo API hívás indítása (Excel végpont, paginálva)...")
         
         try:
-            transactions = response.json()
-            print(f"JSON válasz típusa: {type(transactions)}")
-            
-            # Adalo API válasz formátum ellenőrzése
-            if isinstance(transactions, dict):
-                if "records" in transactions:
-                    transactions = transactions["records"]
-                    print(f"Talált records lista hossza: {len(transactions)}")
-                #else:
-                    #print(f"Hiányzó 'records' kulcs az Adalo API válaszból (Excel végpont).")
-                    #raise HTTPException(
-                    #    status_code=500,
-                    #    detail=f"Hiányzó 'records' kulcs az Adalo API válaszból (Excel végpont)."
-                    #)
-            elif not isinstance(transactions, list):
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Váratlan Adalo API válasz formátum (Excel végpont): {type(transactions)}"
+            # Cache csak replikából kiszolgált kérésnél: élő lekérdezésnél az adatverzió nem ismert
+            cache_key = None
+            if replica_usable(max_staleness):
+                with stage("coupons"):
+                    try:
+                        await coupons_cache.get()
+                    except Exception as e:
+                        log.warning("Hiba a kuponok lekérdezése során: %s", e)
+                cache_key = (
+                    "download-transactions", partner_id, from_date, to_date, export_format,
+                    transactions_replica.data_version, coupons_cache.version
                 )
-            
-            print(f"Összes Adalo tranzakció száma (Excel végpont): {len(transactions)}")
-            
-            # Dátum paraméterek feldolgozása
-            from_datetime = None
-            if from_date:
-                try:
-                    # Próbáljuk meg DD/MM/YYYY formátumként értelmezni, és a nap elejére (UTC) konvertálni
-                    from_datetime = datetime.strptime(from_date, '%d/%m/%Y').replace(tzinfo=timezone.utc)
-                    print(f"Szűrési kezdő dátum: {from_datetime}")
-                except ValueError:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Érvénytelen dátum formátum a from_date paraméterben. Használd a DD/MM/YYYY formátumot."
-                    )
-
-            to_datetime = None
-            if to_date:
-                try:
-                    # Próbáljuk meg DD/MM/YYYY formátumként értelmezni, és a nap végére (UTC) konvertálni
-                    # Hozzáadunk 1 napot és visszamegyünk 1 másodpercet, hogy a nap végét is magába foglalja
-                    to_datetime = datetime.strptime(to_date, '%d/%m/%Y').replace(tzinfo=timezone.utc)
-                    to_datetime = to_datetime + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-                    print(f"Szűrési záró dátum: {to_datetime}")
-                except ValueError:
-                     raise HTTPException(
-                        status_code=400,
-                        detail="Érvénytelen dátum formátum a to_date paraméterben. Használd a DD/MM/YYYY formátumot."
-                    )
-
-            # Dátum tartomány validálása (ha mindkettő meg van adva)
-            if from_datetime and to_datetime and from_datetime > to_datetime:
-                 raise HTTPException(
-                     status_code=400,
-                     detail="A from_date nem lehet későbbi, mint a to_date."
-                 )
+                cached = export_cache.get(cache_key)
+                if cached is not None:
+                    not_modified = etag_matches(request.headers.get("if-none-match"), cached.etag)
+                    log.info("Export cache találat (Excel végpont): %s%s", cached.filename, ' (304)' if not_modified else '')
+                    return cached_export_response(cached.body, cached.media_type, cached.filename, cached.etag, not_modified)
 
-            
-            # Szűrés partner ID, státusz és dátum tartomány alapján
-            finalized_partner_transactions = []
-            for t in transactions:
-                if isinstance(t, dict):
-                    if t.get("transaction_status") == "finalized":
-                         if "partner_transaction" in t:
-                            if partner_id in t["partner_transaction"]:
-                                # Dátum szűrés
-                                transaction_date_str = t.get("updated_at")
-                                if transaction_date_str:
-                                    try:
-                                        # Adalo dátum string átalakítása datetime objektummá (UTC-ben)
-                                        updated_at_datetime = datetime.strptime(transaction_date_str, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
-                                        
-                                        # Ellenőrzés a dátum tartományra
-                                        include_transaction = True
-                                        if from_datetime and updated_at_datetime < from_datetime:
-                                            include_transaction = False
-                                        if to_datetime and updated_at_datetime > to_datetime:
-                                            include_transaction = False
-                                        
-                                        if include_transaction:
-                                             finalized_partner_transactions.append(t)
-
-                                    except (ValueError, TypeError) as e:
-                                        print(f"Figyelmeztetés: Hibás updated_at formátum a tranzakcióban (id: {t.get('id')}, érték: {transaction_date_str}). Kihagyva a dátum szűrésből: {e}")
-                                        # Ha a dátum formátum hibás, kihagyjuk a tranzakciót
-                                        pass
-                                elif from_datetime or to_datetime:
-                                     # Ha van dátumszűrő, de a tranzakción nincs updated_at, akkor kihagyjuk
-                                     print(f"Figyelmeztetés: Hiányzó updated_at a tranzakcióban (id: {t.get('id')}). Kihagyva a dátum szűrésből.")
-                                     pass
-                                else:
-                                    # Nincs dátum szűrés, és van partner ID, státusz, és partner_transaction
-                                    finalized_partner_transactions.append(t)
-            
-            print(f"Talált 'finalized' partner tranzakciók száma (Excel végpont, dátum szűrővel): {len(finalized_partner_transactions)}")
-            
-            if not finalized_partner_transactions:
-                 # Excel végponton 404-et adunk vissza, ha nincs adat
-                 raise HTTPException(
-                    status_code=404,
-                    detail=f"Nem található 'finalized' tranzakció a partner_id={partner_id} számára"
-                 )
-            
-            # Kuponok lekérdezése és coupon_name hozzáadása a DataFrame létrehozása ELŐTT
-            print("Kuponok lekérdezése a coupon_name mezőhöz...")
-            coupons_url = f"https://api.adalo.com/v0/apps/{ADALO_COUPONS_APP_ID}/collections/{ADALO_COUPONS_COLLECTION_ID}"
-            coupons_headers = {
-                "Authorization": f"Bearer {ADALO_TRANSACTIONS_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            coupons_dict = {}
-            try:
-                coupons_response = requests.get(coupons_url, headers=coupons_headers)
-                if coupons_response.status_code == 200:
-                    coupons_data = coupons_response.json()
-                    coupons = coupons_data.get("records", [])
-                    for coupon in coupons:
-                        coupons_dict[coupon.get("id")] = coupon.get("coupon_name", "")
-                    print(f"Sikeresen betöltött {len(coupons_dict)} kupon")
-                else:
-                    print(f"Kuponok lekérdezése sikertelen: {coupons_response.status_code}")
-            except Exception as e:
-                print(f"Hiba a kuponok lekérdezése során: {str(e)}")
-            
-            # coupon_name hozzáadása a tranzakciókhoz MINDEN tranzakcióhoz
-            print("Coupon_name hozzáadása a tranzakciókhoz...")
-            for transaction in finalized_partner_transactions:
-                coupon_ids = transaction.get("coupon_transaction", [])
-                if coupon_ids and isinstance(coupon_ids, list) and len(coupon_ids) > 0:
-                    coupon_id = coupon_ids[0]  # Első kupon ID használata
-                    transaction["coupon_name"] = coupons_dict.get(coupon_id, "")
-                    print(f"Tranzakció {transaction.get('id')}: coupon_id={coupon_id}, coupon_name='{transaction['coupon_name']}'")
-                else:
-                    transaction["coupon_name"] = ""
-                    print(f"Tranzakció {transaction.get('id')}: nincs kupon")
-            
-            # DataFrame létrehozása a coupon_name hozzáadása UTÁN
-            print("DataFrame létrehozása (Excel végpont)...")
-            df = pd.DataFrame(finalized_partner_transactions)
-            print(f"DataFrame oszlopok (eredeti): {list(df.columns)}")
-            
-            # Kívánt oszlopok kiválasztása és átnevezése
-            desired_columns = [
-                "id",
-                "transaction_status",
-                "user_transaction",
-                "partner_transaction", # Eredetileg kért oszlop, de a lekeresnel szurtunk ra, user_transaction es coupon_transaction volt helyette
-                "coupon_transaction",
-                "coupon_name",
-                "spend_value",
-                "discount_value",
-                "saved_value",
-                "hunicoin_value",
-                "jutalek_value",
-                "updated_at"
-            ]
-            # Ellenőrizzük, hogy a kívánt oszlopok léteznek-e a DataFrame-ben
-            existing_columns = [col for col in desired_columns if col in df.columns]
-            df = df[existing_columns]
-            print(f"DataFrame oszlopok (kiválasztott): {list(df.columns)}")
-            
-            # Fejlécek átnevezése
-            column_mapping = {
-                "id": "Tranzakció azonosítója",
-                "transaction_status": "Tranzakció státusza",
-                "user_transaction": "User id-ja",
-                "partner_transaction": "Partner id-ja", # Hozzáadva az átnevezéshez, ha létezik
-                "coupon_transaction": "Kupon id-ja",
-                "coupon_name": "Kupon neve",
-                "spend_value": "Költés",
-                "discount_value": "Kedvezmény %",
-                "saved_value": "Spórolás",
-                "hunicoin_value": "Hunicoinok száma",
-                "jutalek_value": "Jutalék összege",
-                "updated_at": "Tranzakció dátuma"
-            }
-            # Csak a kiválasztott oszlopoknak megfelelő mapping használata
-            renamed_columns = {old_name: new_name for old_name, new_name in column_mapping.items() if old_name in df.columns}
-            df = df.rename(columns=renamed_columns)
-            print(f"DataFrame oszlopok (átnevezett): {list(df.columns)}")
-            
-            # Dátum formázása a 'Tranzakció dátuma' oszlopban
-            if "Tranzakció dátuma" in df.columns:
-                try:
-                    # Átalakítás datetime objektummá
-                    # Az Adalo API válasz ISO formátumú, UTC időzónával
-                    df["Tranzakció dátuma"] = pd.to_datetime(df["Tranzakció dátuma"], utc=True)
-                    # Formázás a kívánt string formátumra (óra, perc)
-                    df["Tranzakció dátuma"] = df["Tranzakció dátuma"].dt.strftime('%Y-%m-%d %H:%M')
-                    print("Tranzakció dátuma oszlop formázva.")
-                except Exception as e:
-                    print(f"Hiba a dátum formázása során: {str(e)}")
-                    # Hibakezelés: ha nem sikerül formázni, hagyjuk az eredeti értéket
-                    pass # Folytatjuk az eredeti dátum formátummal
-            else:
-                 print("'Tranzakció dátuma' oszlop nem található a formázáshoz.")
+            table = await build_partner_transactions_export(partner_id, from_date, to_date, max_staleness)
 
-            
-            # Excel fájl mentése
-            filename = f"transactions_partner_{partner_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            print(f"Excel fájl mentése (Excel végpont): {filename}")
-            df.to_excel(filename, index=False)
-            
-            print("Fájl sikeresen létrehozva (Excel végpont)!")
-            
-            # FileResponse létrehozása
-            response = FileResponse(
-                filename,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                filename=filename
-            )
-            
-            # Fájl törlése miután elküldtük a BackgroundTasks segítségével
-            background_tasks.add_task(os.remove, filename)
-            
-            return response
+            if cache_key is not None:
+                extension, media_type = EXPORT_FORMATS[export_format]
+                body = await asyncio.to_thread(render_export, export_format, table.headers, table.rows)
+                cached = export_cache.put(cache_key, body, media_type, f"{table.basename}.{extension}")
+                log.info("Fájl renderelve és cache-elve (Excel végpont): %s", cached.filename)
+                return cached_export_response(cached.body, cached.media_type, cached.filename, cached.etag)
+
+            # Fájl streamelése közvetlenül a kliensnek (nincs ideiglenes fájl)
+            log.info("Fájl streamelése (Excel végpont): %s.%s", table.basename, export_format)
+            return export_response(export_format, table.basename, table.headers, table.rows)
             
         except ValueError as e:
-            print(f"JSON feldolgozási hiba (Excel végpont): {str(e)}")
+            log.error("JSON feldolgozási hiba (Excel végpont): %s", e)
             raise HTTPException(
                 status_code=500,
                 detail=f"Hibás JSON válasz az Adalo API-tól (Excel végpont): {str(e)}"
             )
         
-    except requests.exceptions.RequestException as e:
-        print(f"Adalo API hívási hiba (Excel végpont): {str(e)}")
+    except httpx.HTTPError as e:
+        log.error("Adalo API hívási hiba (Excel végpont): %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Hiba az Adalo API hívás során (Excel végpont): {str(e)}"
         )
     except Exception as e:
-         print(f"Váratlan hiba történt (Excel végpont): {str(e)}")
+         log.exception("Váratlan hiba történt (Excel végpont): %s", e)
          raise HTTPException(status_code=500, detail=f"Váratlan szerverhiba (Excel végpont): {str(e)}")
 
+async def build_users_export(
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    progress: Optional[ExportProgress] = None
+) -> ExportTable:
+    """
+    Az Adalo Users API felhasználóinak exportja (email és created_at szerinti szűrés, oszlopok, formázás).
+    A /download-users végpont és az aszinkron export jobok közösen használják.
+    """
+    url = app_users_url(ADALO_USERS_APP_ID)
+    headers = adalo_headers(ADALO_API_KEY)
+
+    # Dátum paraméterek feldolgozása
+    from_datetime, to_datetime = parse_date_window(from_date, to_date)
+
+    # Szűrés email és dátum alapján, oldalanként lekérve, vektorizáltan
+    total_users, filtered_users = await filter_stream(
+        adalo_records(url, headers, on_page=progress.page_fetched if progress else None),
+        lambda batch: select_users_created_between(batch, "email", from_datetime, to_datetime)
+    )
+
+    log.info("Összes felhasználó száma: %s", total_users)
+    log.info("Szűrt felhasználók száma: %s", len(filtered_users))
+
+    if not filtered_users:
+        raise HTTPException(
+            status_code=404,
+            detail="Nem található felhasználó a megadott feltételek alapján"
+        )
+
+    # Kívánt oszlopok kiválasztása és átnevezése
+    column_mapping = {
+        "id": "Felhasználó azonosító",
+        "email": "Email cím",
+        "phone": "Telefonszám",
+        "created_at": "Regisztráció dátuma",
+        "updated_at": "Utolsó módosítás dátuma",
+        "first_name": "Keresztnév",
+        "last_name": "Vezetéknév",
+        "status": "Státusz"
+    }
+    
+    # Csak azokat az oszlopokat választjuk ki, amelyek léteznek a felhasználókban
+    with stage("columns"):
+        existing_columns = present_columns(filtered_users, list(column_mapping.keys()))
+    headers = [column_mapping[col] for col in existing_columns]
+    
+    # Dátum formázás
+    rows = table_rows(filtered_users, existing_columns, date_columns=["created_at", "updated_at"])
+
+    if progress is not None:
+        progress.rows_total = len(filtered_users)
+    basename = f"users_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    return ExportTable(basename, headers, rows)
+
 @app.get("/download-users")
 async def download_users(
-    background_tasks: BackgroundTasks,
     from_date: Optional[str] = Query(None, description="Optional: Szűrés ettől a dátumtól (DD/MM/YYYY formátum)"),
-    to_date: Optional[str] = Query(None, description="Optional: Szűrés eddig a dátumig (DD/MM/YYYY formátum)")
+    to_date: Optional[str] = Query(None, description="Optional: Szűrés eddig a dátumig (DD/MM/YYYY formátum)"),
+    export_format: Literal["xlsx", "csv", "ndjson", "parquet"] = Query("xlsx", alias="format", description="Optional: Export formátum (xlsx, csv, ndjson vagy parquet)")
 ):
     """
-    Lekéri az összes felhasználót az Adalo API-ból és Excel fájlként visszaadja.
+    Lekéri az összes felhasználót az Adalo API-ból és Excel fájlként (vagy format szerint CSV/NDJSON/Parquet) visszaadja.
     Szűrhető a felhasználó létrehozásának dátuma alapján egy megadott időszakban.
     """
     if not ADALO_API_KEY:
         raise HTTPException(status_code=500, detail="Adalo API kulcs nincs beállítva (ADALO_API_KEY környezeti változó)")
 
-    print("\n=== Új felhasználó Excel letöltési kérés kezdése ===")
+    if export_format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="A parquet exporthoz a pyarrow csomag szükséges")
+
+    log.info("Új felhasználó Excel letöltési kérés kezdése")
     
     # Adalo Users API hívás
-    url = f"https://api.adalo.com/v0/apps/{ADALO_USERS_APP_ID}/users"
-    headers = {
-        "Authorization": f"Bearer {ADALO_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    url = app_users_url(ADALO_USERS_APP_ID)
+    headers = adalo_headers(ADALO_API_KEY)
     
-    print(f"API URL: {url}")
+    log.debug("API URL: %s", url)
     
     try:
-        print("Adalo Users API hívás indítása (paginálva)...")
-        users = []
-        offset = 0
-        limit = 100
-        page = 1
-
-        while True:
-            params = {"offset": offset, "limit": limit}
-            response = requests.get(url, headers=headers, params=params)
-            print(f"Oldal {page} - Adalo API válasz státuszkód: {response.status_code}")
-
-            if response.status_code != 200:
-                print(f"Hibás Adalo API válasz: {response.text}")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Adalo API hiba: {response.text}"
-                )
-
-            data = response.json()
-
-            # Adalo API válasz formátum ellenőrzése
-            if isinstance(data, dict) and "records" in data:
-                records = data["records"]
-            elif isinstance(data, dict) and "users" in data:
-                records = data["users"]
-            elif isinstance(data, list):
-                records = data
-            else:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Váratlan Adalo API válasz formátum: {type(data)}"
-                )
-
-            print(f"Oldal {page}: {len(records)} rekord (offset: {offset})")
-
-            if not records:
-                break
-
-            users.extend(records)
-
-            # Paginálás: ha van offset a válaszban, használjuk azt; egyébként léptetünk
-            next_offset = data.get("offset") if isinstance(data, dict) else None
-            if next_offset is not None and next_offset > offset:
-                offset = next_offset
-            elif len(records) >= limit:
-                offset += limit
-            else:
-                break
-
-            page += 1
+        log.debug("Adalo Users API hívás indítása (paginálva)...")
 
         try:
-            print(f"Összes felhasználó száma: {len(users)}")
             
-            # Dátum paraméterek feldolgozása
-            from_datetime = None
-            if from_date:
-                try:
-                    from_datetime = datetime.strptime(from_date, '%d/%m/%Y').replace(tzinfo=timezone.utc)
-                    print(f"Szűrési kezdő dátum: {from_datetime}")
-                except ValueError:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Érvénytelen dátum formátum a from_date paraméterben. Használd a DD/MM/YYYY formátumot."
-                    )
-
-            to_datetime = None
-            if to_date:
-                try:
-                    to_datetime = datetime.strptime(to_date, '%d/%m/%Y').replace(tzinfo=timezone.utc)
-                    to_datetime = to_datetime + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-                    print(f"Szűrési záró dátum: {to_datetime}")
-                except ValueError:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Érvénytelen dátum formátum a to_date paraméterben. Használd a DD/MM/YYYY formátumot."
-                    )
-
-            # Dátum tartomány validálása
-            if from_datetime and to_datetime and from_datetime > to_datetime:
-                raise HTTPException(
-                    status_code=400,
-                    detail="A from_date nem lehet későbbi, mint a to_date."
-                )
+            table = await build_users_export(from_date, to_date)
 
-            # Szűrés dátum alapján
-            filtered_users = []
-            for user in users:
-                if isinstance(user, dict):
-                    # Email ellenőrzés - csak nem üres email címmel rendelkező userek
-                    email = user.get("email", "")
-                    if not email:
-                        continue
-
-                    created_at_str = user.get("created_at")
-                    if created_at_str:
-                        try:
-                            created_at = datetime.strptime(created_at_str, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
-
-                            include_user = True
-                            if from_datetime and created_at < from_datetime:
-                                include_user = False
-                            if to_datetime and created_at > to_datetime:
-                                include_user = False
-
-                            if include_user:
-                                filtered_users.append(user)
-                        except (ValueError, TypeError) as e:
-                            print(f"Figyelmeztetés: Hibás created_at formátum a felhasználóban (id: {user.get('id')}). Kihagyva: {e}")
-                            pass
-                    elif from_datetime or to_datetime:
-                        print(f"Figyelmeztetés: Hiányzó created_at a felhasználóban (id: {user.get('id')}). Kihagyva.")
-                        pass
-                    else:
-                        filtered_users.append(user)
-
-            print(f"Szűrt felhasználók száma: {len(filtered_users)}")
-
-            if not filtered_users:
-                raise HTTPException(
-                    status_code=404,
-                    detail="Nem található felhasználó a megadott feltételek alapján"
-                )
-
-            # DataFrame létrehozása
-            df = pd.DataFrame(filtered_users)
-
-            # Kívánt oszlopok kiválasztása és átnevezése
-            column_mapping = {
-                "id": "Felhasználó azonosító",
-                "email": "Email cím",
-                "phone": "Telefonszám",
-                "created_at": "Regisztráció dátuma",
-                "updated_at": "Utolsó módosítás dátuma",
-                "first_name": "Keresztnév",
-                "last_name": "Vezetéknév",
-                "status": "Státusz"
-            }
-            
-            # Csak azokat az oszlopokat választjuk ki, amelyek léteznek a DataFrame-ben
-            existing_columns = [col for col in column_mapping.keys() if col in df.columns]
-            df = df[existing_columns]
-            
-            # Oszlopok átnevezése
-            df = df.rename(columns={old: new for old, new in column_mapping.items() if old in df.columns})
-            
-            # Dátum formázás
-            for date_col in ["Regisztráció dátuma", "Utolsó módosítás dátuma"]:
-                if date_col in df.columns:
-                    try:
-                        df[date_col] = pd.to_datetime(df[date_col], utc=True)
-                        df[date_col] = df[date_col].dt.strftime('%Y-%m-%d %H:%M')
-                    except Exception as e:
-                        print(f"Hiba a {date_col} formázása során: {str(e)}")
-                        pass
-
-            # Excel fájl mentése
-            filename = f"users_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            df.to_excel(filename, index=False)
-            
-            # FileResponse létrehozása
-            response = FileResponse(
-                filename,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                filename=filename
-            )
-            
-            # Fájl törlése miután elküldtük
-            background_tasks.add_task(os.remove, filename)
-            
-            return response
+            # Fájl streamelése közvetlenül a kliensnek (nincs ideiglenes fájl)
+            return export_response(export_format, table.basename, table.headers, table.rows)
             
         except ValueError as e:
-            print(f"JSON feldolgozási hiba: {str(e)}")
+            log.error("JSON feldolgozási hiba: %s", e)
             raise HTTPException(
                 status_code=500,
                 detail=f"Hibás JSON válasz az Adalo API-tól: {str(e)}"
             )
         
-    except requests.exceptions.RequestException as e:
-        print(f"Adalo API hívási hiba: {str(e)}")
+    except httpx.HTTPError as e:
+        log.error("Adalo API hívási hiba: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Hiba az Adalo API hívás során: {str(e)}"
         )
     except Exception as e:
-        print(f"Váratlan hiba történt: {str(e)}")
+        log.exception("Váratlan hiba történt: %s", e)
         raise HTTPException(status_code=500, detail=f"Váratlan szerverhiba: {str(e)}")
 
+async def build_users_collection_export(
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    progress: Optional[ExportProgress] = None
+) -> ExportTable:
+    """
+    Az Adalo Users Collection felhasználóinak exportja (email és created_at szerinti szűrés, oszlopok, formázás).
+    A /download-users-collection végpont és az aszinkron export jobok közösen használják.
+    """
+    url = collection_url(ADALO_USERS_APP_ID, ADALO_USERS_COLLECTION_ID)
+    headers = adalo_headers(ADALO_API_KEY)
+
+    # Dátum paraméterek feldolgozása
+    from_datetime, to_datetime = parse_date_window(from_date, to_date)
+
+    # Szűrés email és dátum alapján, oldalanként lekérve, vektorizáltan
+    total_users, filtered_users = await filter_stream(
+        adalo_records(url, headers, on_page=progress.page_fetched if progress else None),
+        lambda batch: select_users_created_between(batch, "Email", from_datetime, to_datetime)
+    )
+
+    log.info("Összes felhasználó száma: %s", total_users)
+    log.info("Szűrt felhasználók száma: %s", len(filtered_users))
+
+    if not filtered_users:
+        raise HTTPException(
+            status_code=404,
+            detail="Nem található felhasználó a megadott feltételek alapján"
+        )
+
+    # Kívánt oszlopok kiválasztása és átnevezése
+    column_mapping = {
+        "id": "Felhasználó azonosító",
+        "Email": "Email cím",
+        "subscribedtonews": "Hírlevél feliratkozás",
+        "Full Name": "Teljes név",
+        "nickname": "Becenév",
+        "registration_date": "Regisztráció dátuma",
+        "student_verified": "Diákigazolvány ellenőrizve",
+        "verified_time": "Ellenőrzés dátuma",
+        "diakigazolvany_azonosito": "Diákigazolvány azonosító",
+        "total_hunicoins": "Hunicoinok száma",
+        "gender": "Nem",
+        "level_name": "Szint neve",
+        "level_url": "Szint URL",
+        "hunidate": "Huni dátum",
+        "liked_categories": "Kedvelt kategóriák",
+        "disliked_categories": "Nem kedvelt kategóriák",
+        "liked_partners": "Kedvelt partnerek",
+        "transactions_user": "Felhasználó tranzakciói",
+        "opened_noticoupon": "Megnyitott értesítési kuponok",
+        "Admin?": "Admin",
+        "wantsto_delete": "Törölni akar",
+        "latestnotivisited": "Utolsó értesítés látogatás"
+    }
+    
+    # Csak azokat az oszlopokat választjuk ki, amelyek léteznek a felhasználókban
+    with stage("columns"):
+        existing_columns = present_columns(filtered_users, list(column_mapping.keys()))
+    headers = [column_mapping[col] for col in existing_columns]
+    
+    # Dátum formázás és Boolean értékek formázása (Igen/Nem)
+    rows = table_rows(
+        filtered_users,
+        existing_columns,
+        date_columns=["registration_date", "verified_time", "hunidate"],
+        bool_columns=["student_verified", "Admin?", "subscribedtonews", "latestnotivisited"]
+    )
+
+    if progress is not None:
+        progress.rows_total = len(filtered_users)
+    basename = f"users_collection_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    return ExportTable(basename, headers, rows)
+
 @app.get("/download-users-collection")
 async def download_users_collection(
-    background_tasks: BackgroundTasks,
     from_date: Optional[str] = Query(None, description="Optional: Szűrés ettől a dátumtól (DD/MM/YYYY formátum)"),
-    to_date: Optional[str] = Query(None, description="Optional: Szűrés eddig a dátumig (DD/MM/YYYY formátum)")
+    to_date: Optional[str] = Query(None, description="Optional: Szűrés eddig a dátumig (DD/MM/YYYY formátum)"),
+    export_format: Literal["xlsx", "csv", "ndjson", "parquet"] = Query("xlsx", alias="format", description="Optional: Export formátum (xlsx, csv, ndjson vagy parquet)")
 ):
     """
-    Lekéri az összes felhasználót az Adalo Users Collection API-ból és Excel fájlként visszaadja.
+    Lekéri az összes felhasználót az Adalo Users Collection API-ból és Excel fájlként (vagy format szerint CSV/NDJSON/Parquet) visszaadja.
     Szűrhető a felhasználó létrehozásának dátuma alapján egy megadott időszakban.
     """
     if not ADALO_API_KEY:
         raise HTTPException(status_code=500, detail="Adalo API kulcs nincs beállítva (ADALO_API_KEY környezeti változó)")
 
-    print("\n=== Új felhasználó Collection Excel letöltési kérés kezdése ===")
+    if export_format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="A parquet exporthoz a pyarrow csomag szükséges")
+
+    log.info("Új felhasználó Collection Excel letöltési kérés kezdése")
     
     # Adalo Users Collection API hívás
-    url = f"https://api.adalo.com/v0/apps/{ADALO_USERS_APP_ID}/collections/{ADALO_USERS_COLLECTION_ID}"
-    headers = {
-        "Authorization": f"Bearer {ADALO_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    url = collection_url(ADALO_USERS_APP_ID, ADALO_USERS_COLLECTION_ID)
+    headers = adalo_headers(ADALO_API_KEY)
     
-    print(f"API URL: {url}")
+    log.debug("API URL: %s", url)
     
     try:
-        print("Adalo Users Collection API hívás indítása (paginálva)...")
-        users = []
-        offset = 0
-        limit = 100
-        page = 1
-
-        while True:
-            params = {"offset": offset, "limit": limit}
-            response = requests.get(url, headers=headers, params=params)
-            print(f"Oldal {page} - Adalo API válasz státuszkód: {response.status_code}")
-
-            if response.status_code != 200:
-                print(f"Hibás Adalo API válasz: {response.text}")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Adalo API hiba: {response.text}"
-                )
-
-            data = response.json()
-            records = data.get("records", [])
-
-            print(f"Oldal {page}: {len(records)} rekord (offset: {offset})")
-
-            if not records:
-                break
-
-            users.extend(records)
-
-            next_offset = data.get("offset")
-            if next_offset is not None and next_offset > offset:
-                offset = next_offset
-            elif len(records) >= limit:
-                offset += limit
-            else:
-                break
-
-            page += 1
+        log.debug("Adalo Users Collection API hívás indítása (paginálva)...")
 
         try:
-            print(f"Összes felhasználó száma: {len(users)}")
             
-            # Dátum paraméterek feldolgozása
-            from_datetime = None
-            if from_date:
-                try:
-                    from_datetime = datetime.strptime(from_date, '%d/%m/%Y').replace(tzinfo=timezone.utc)
-                    print(f"Szűrési kezdő dátum: {from_datetime}")
-                except ValueError:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Érvénytelen dátum formátum a from_date paraméterben. Használd a DD/MM/YYYY formátumot."
-                    )
-
-            to_datetime = None
-            if to_date:
-                try:
-                    to_datetime = datetime.strptime(to_date, '%d/%m/%Y').replace(tzinfo=timezone.utc)
-                    to_datetime = to_datetime + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-                    print(f"Szűrési záró dátum: {to_datetime}")
-                except ValueError:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Érvénytelen dátum formátum a to_date paraméterben. Használd a DD/MM/YYYY formátumot."
-                    )
-
-            # Dátum tartomány validálása
-            if from_datetime and to_datetime and from_datetime > to_datetime:
-                raise HTTPException(
-                    status_code=400,
-                    detail="A from_date nem lehet későbbi, mint a to_date."
-                )
-
-            # Szűrés dátum alapján
-            filtered_users = []
-            for user in users:
-                if isinstance(user, dict):
-                    # Email ellenőrzés - csak nem üres email címmel rendelkező userek
-                    email = user.get("Email", "")
-                    if not email:
-                        continue
-
-                    created_at_str = user.get("created_at")
-                    if created_at_str:
-                        try:
-                            created_at = datetime.strptime(created_at_str, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
-
-                            include_user = True
-                            if from_datetime and created_at < from_datetime:
-                                include_user = False
-                            if to_datetime and created_at > to_datetime:
-                                include_user = False
-
-                            if include_user:
-                                filtered_users.append(user)
-                        except (ValueError, TypeError) as e:
-                            print(f"Figyelmeztetés: Hibás created_at formátum a felhasználóban (id: {user.get('id')}). Kihagyva: {e}")
-                            pass
-                    elif from_datetime or to_datetime:
-                        print(f"Figyelmeztetés: Hiányzó created_at a felhasználóban (id: {user.get('id')}). Kihagyva.")
-                        pass
-                    else:
-                        filtered_users.append(user)
-
-            print(f"Szűrt felhasználók száma: {len(filtered_users)}")
+            table = await build_users_collection_export(from_date, to_date)
 
-            if not filtered_users:
-                raise HTTPException(
-                    status_code=404,
-                    detail="Nem található felhasználó a megadott feltételek alapján"
-                )
-
-            # DataFrame létrehozása
-            df = pd.DataFrame(filtered_users)
-
-            # Kívánt oszlopok kiválasztása és átnevezése
-            column_mapping = {
-                "id": "Felhasználó azonosító",
-                "Email": "Email cím",
-                "subscribedtonews": "Hírlevél feliratkozás",
-                "Full Name": "Teljes név",
-                "nickname": "Becenév",
-                "registration_date": "Regisztráció dátuma",
-                "student_verified": "Diákigazolvány ellenőrizve",
-                "verified_time": "Ellenőrzés dátuma",
-                "diakigazolvany_azonosito": "Diákigazolvány azonosító",
-                "total_hunicoins": "Hunicoinok száma",
-                "gender": "Nem",
-                "level_name": "Szint neve",
-                "level_url": "Szint URL",
-                "hunidate": "Huni dátum",
-                "liked_categories": "Kedvelt kategóriák",
-                "disliked_categories": "Nem kedvelt kategóriák",
-                "liked_partners": "Kedvelt partnerek",
-                "transactions_user": "Felhasználó tranzakciói",
-                "opened_noticoupon": "Megnyitott értesítési kuponok",
-                "Admin?": "Admin",
-                "wantsto_delete": "Törölni akar",
-                "latestnotivisited": "Utolsó értesítés látogatás"
-            }
-            
-            # Csak azokat az oszlopokat választjuk ki, amelyek léteznek a DataFrame-ben
-            existing_columns = [col for col in column_mapping.keys() if col in df.columns]
-            df = df[existing_columns]
-            
-            # Oszlopok átnevezése
-            df = df.rename(columns={old: new for old, new in column_mapping.items() if old in df.columns})
-            
-            # Dátum formázás
-            date_columns = ["Regisztráció dátuma", "Ellenőrzés dátuma", "Huni dátum"]
-            for date_col in date_columns:
-                if date_col in df.columns:
-                    try:
-                        df[date_col] = pd.to_datetime(df[date_col], utc=True)
-                        df[date_col] = df[date_col].dt.strftime('%Y-%m-%d %H:%M')
-                    except Exception as e:
-                        print(f"Hiba a {date_col} formázása során: {str(e)}")
-                        pass
-
-            # Boolean értékek formázása
-            boolean_columns = ["Diákigazolvány ellenőrizve", "Admin", "Hírlevél feliratkozás", "Utolsó értesítés látogatás"]
-            for bool_col in boolean_columns:
-                if bool_col in df.columns:
-                    df[bool_col] = df[bool_col].map({True: "Igen", False: "Nem"})
-
-            # Excel fájl mentése
-            filename = f"users_collection_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            df.to_excel(filename, index=False)
-            
-            # FileResponse létrehozása
-            response = FileResponse(
-                filename,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                filename=filename
-            )
-            
-            # Fájl törlése miután elküldtük
-            background_tasks.add_task(os.remove, filename)
-            
-            return response
+            # Fájl streamelése közvetlenül a kliensnek (nincs ideiglenes fájl)
+            return export_response(export_format, table.basename, table.headers, table.rows)
             
         except ValueError as e:
-            print(f"JSON feldolgozási hiba: {str(e)}")
+            log.error("JSON feldolgozási hiba: %s", e)
             raise HTTPException(
                 status_code=500,
                 detail=f"Hibás JSON válasz az Adalo API-tól: {str(e)}"
             )
         
-    except requests.exceptions.RequestException as e:
-        print(f"Adalo API hívási hiba: {str(e)}")
+    except httpx.HTTPError as e:
+        log.error("Adalo API hívási hiba: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Hiba az Adalo API hívás során: {str(e)}"
         )
     except Exception as e:
-        print(f"Váratlan hiba történt: {str(e)}")
+        log.exception("Váratlan hiba történt: %s", e)
         raise HTTPException(status_code=500, detail=f"Váratlan szerverhiba: {str(e)}")
 
 @app.get("/test-users")
@@ -988,41 +1141,31 @@ async def test_users():
     if not ADALO_API_KEY:
         raise HTTPException(status_code=500, detail="Adalo API kulcs nincs beállítva (ADALO_API_KEY környezeti változó)")
 
-    print("\n=== Felhasználók számának lekérdezése és statisztika létrehozása ===")
+    log.info("Felhasználók számának lekérdezése és statisztika létrehozása")
     
     # Adalo Users API hívás
-    users_url = f"https://api.adalo.com/v0/apps/{ADALO_USERS_APP_ID}/collections/{ADALO_USERS_COLLECTION_ID}"
-    headers = {
-        "Authorization": f"Bearer {ADALO_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    users_url = collection_url(ADALO_USERS_APP_ID, ADALO_USERS_COLLECTION_ID)
+    headers = adalo_headers(ADALO_API_KEY)
     
     try:
-        # Felhasználók lekérdezése
-        response = requests.get(users_url, headers=headers)
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Adalo API hiba a felhasználók lekérdezésekor: {response.text}"
-            )
-        
         try:
-            data = response.json()
-            users = data.get("records", [])
-            
             # Mai dátum lekérdezése
             today = datetime.now(timezone.utc)
             
-            # Felhasználók számolása, akik a mai napon lettek létrehozva
-            users_today = sum(1 for user in users if user.get("created_at") and 
-                            datetime.strptime(user["created_at"], '%Y-%m-%dT%H:%M:%S.%fZ').date() == today.date())
-            
-            # Összes felhasználó száma
-            total_users = len(users)
+            # Felhasználók lekérdezése oldalanként, és számolása (összes, illetve a mai napon létrehozottak)
+            users_today = 0
+            total_users = 0
+            day_start = pd.Timestamp(today.date(), tz="UTC")
+            async for page in iter_batches(adalo_records(users_url, headers)):
+                total_users += len(page)
+                created = parse_timestamps([user.get("created_at") for user in page])
+                if created.malformed.any():
+                    bad_value = page[int(created.malformed.argmax())].get("created_at")
+                    raise ValueError(f"Hibás created_at formátum: {bad_value}")
+                users_today += int(((created.values >= day_start) & (created.values < day_start + pd.Timedelta(days=1))).sum())
             
             # Új statisztika rekord létrehozása
-            stats_url = f"https://api.adalo.com/v0/apps/{ADALO_STATS_APP_ID}/collections/{ADALO_STATS_COLLECTION_ID}"
+            stats_url = collection_url(ADALO_STATS_APP_ID, ADALO_STATS_COLLECTION_ID)
             
             # Új rekord adatai - módosítva a dátum formátum
             new_record = {
@@ -1030,22 +1173,17 @@ async def test_users():
                 "registered_date": today.strftime("%Y-%m-%dT%H:%M:%S.000Z")  # Pontos formátum az Adalo API-hoz
             }
             
-            print(f"\nÚj rekord adatai:")
-            print(f"URL: {stats_url}")
-            print(f"Headers: {headers}")
-            print(f"Body: {new_record}")
+            log.debug("Új statisztika rekord: %s %s", stats_url, new_record)
             
             # POST kérés az új rekord létrehozásához
-            stats_response = requests.post(stats_url, headers=headers, json=new_record)
+            stats_response = await http_client.post(stats_url, headers=headers, json=new_record)
             
-            print(f"\nStatisztika API válasz:")
-            print(f"Status code: {stats_response.status_code}")
-            print(f"Response headers: {dict(stats_response.headers)}")
-            print(f"Response body: {stats_response.text}")
+            log.info("Statisztika API válasz státuszkód: %s", stats_response.status_code)
+            log.debug("Statisztika API válasz: %s", stats_response.text)
             
             if stats_response.status_code not in [200, 201]:
                 error_detail = f"Adalo API hiba a statisztika létrehozásakor: Status {stats_response.status_code}, Response: {stats_response.text}"
-                print(f"\nHiba: {error_detail}")
+                log.error("%s", error_detail)
                 raise HTTPException(
                     status_code=stats_response.status_code,
                     detail=error_detail
@@ -1065,13 +1203,13 @@ async def test_users():
                 detail=f"Hibás JSON válasz az Adalo API-tól: {str(e)}"
             )
         
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=500,
             detail=f"Hiba az Adalo API hívás során: {str(e)}"
         )
     except Exception as e:
-        print(f"\nVáratlan hiba részletei: {str(e)}")
+        log.exception("Váratlan hiba részletei: %s", e)
         raise HTTPException(status_code=500, detail=f"Váratlan szerverhiba: {str(e)}")
 
 @app.get("/deleteuser/{user_id}")
@@ -1083,7 +1221,7 @@ async def deleteuser(user_id: int):
     if not ADALO_API_KEY:
         raise HTTPException(status_code=500, detail="Adalo API kulcs nincs beállítva (ADALO_API_KEY környezeti változó)")
 
-    print(f"\n=== Felhasználó másolása user_id={user_id} ===")
+    log.info("Felhasználó másolása user_id=%s", user_id)
     
     # Adalo API konfiguráció
     app_id = ADALO_USERS_APP_ID
@@ -1091,36 +1229,35 @@ async def deleteuser(user_id: int):
     api_key = ADALO_API_KEY
     
     # URL-ek
-    get_url = f"https://api.adalo.com/v0/apps/{app_id}/collections/{collection_id}/{user_id}"
-    create_url = f"https://api.adalo.com/v0/apps/{app_id}/collections/{collection_id}"
+    get_url = collection_url(app_id, collection_id, user_id)
+    create_url = collection_url(app_id, collection_id)
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    headers = adalo_headers(api_key)
     
     try:
         # 1. Lekérjük az eredeti felhasználót
-        print(f"Eredeti felhasználó lekérdezése: {get_url}")
-        get_response = requests.get(get_url, headers=headers)
+        log.debug("Eredeti felhasználó lekérdezése: %s", get_url)
+        # Írás/törlés előtti olvasás: mindig élő (a cache-elt, esetleg régi rekordból készülne a PUT)
+        with stage("read"):
+            status_code, original_user = await get_record(http_client, app_id, collection_id, user_id, headers)
         
-        if get_response.status_code != 200:
+        if status_code != 200:
             raise HTTPException(
-                status_code=get_response.status_code,
-                detail=f"Adalo API hiba a felhasználó lekérdezésekor: {get_response.text}"
+                status_code=status_code,
+                detail=f"Adalo API hiba a felhasználó lekérdezésekor: {original_user}"
             )
         
-        original_user = get_response.json()
-        print(f"Eredeti felhasználó sikeresen lekérdezve")
+        log.debug("Eredeti felhasználó sikeresen lekérdezve")
         
         # 2. Generálunk egyedi azonosítót
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]  # milliszekundumok nélkül
-        unique_id = f"delete_user_{timestamp}"
+        # A párhuzamos (auto-delete) törlések ugyanabba a milliszekundumba eshetnek: az eredeti ID teszi egyedivé
+        unique_id = f"{timestamp}_{user_id}"
         
         # 3. Létrehozzuk az új rekordot csak az alapvető adatokkal (tömbök nélkül)
         basic_user_data = {
-            "Email": f"delete_user_{timestamp}@deleted.com",
-            "Full Name": f"Deleted User {timestamp}",
+            "Email": f"delete_user_{unique_id}@deleted.com",
+            "Full Name": f"Deleted User {unique_id}",
             "valami": original_user.get("valami", ""),
             "registration_date": original_user.get("registration_date", ""),
             "diakigazolvany_azonosito": original_user.get("diakigazolvany_azonosito", 0),
@@ -1146,15 +1283,16 @@ async def deleteuser(user_id: int):
             "Admin?": original_user.get("Admin?", False)
         }
         
-        print(f"Új felhasználó alapvető adatok létrehozása...")
-        print(f"Email: {basic_user_data['Email']}")
-        print(f"Full Name: {basic_user_data['Full Name']}")
+        log.debug("Új felhasználó alapvető adatok létrehozása...")
+        log.debug("Email: %s", basic_user_data['Email'])
+        log.debug("Full Name: %s", basic_user_data['Full Name'])
         
         # 4. POST kérés az új rekord létrehozásához (csak alapvető adatokkal)
-        create_response = requests.post(create_url, headers=headers, json=basic_user_data)
+        with stage("create"):
+            create_response = await http_client.post(create_url, headers=headers, json=basic_user_data)
         
-        print(f"Létrehozási válasz státuszkód: {create_response.status_code}")
-        print(f"Létrehozási válasz: {create_response.text}")
+        log.info("Létrehozási válasz státuszkód: %s", create_response.status_code)
+        log.debug("Létrehozási válasz: %s", create_response.text)
         
         if create_response.status_code not in [200, 201]:
             raise HTTPException(
@@ -1165,10 +1303,10 @@ async def deleteuser(user_id: int):
         created_user = create_response.json()
         new_user_id = created_user.get('id')
         
-        print(f"Új felhasználó létrehozva, ID: {new_user_id}")
+        log.info("Új felhasználó létrehozva, ID: %s", new_user_id)
         
         # 5. PUT kérés az összes mező frissítéséhez (transactions_user nélkül)
-        print("Összes mező frissítése PUT kéréssel...")
+        log.debug("Összes mező frissítése PUT kéréssel...")
         
         # Összegyűjtjük az összes mezőt az eredeti user-ből (transactions_user nélkül)
         complete_user_data = {
@@ -1207,102 +1345,114 @@ async def deleteuser(user_id: int):
         }
         
         # PUT URL az új user-hez
-        put_url = f"https://api.adalo.com/v0/apps/{app_id}/collections/{collection_id}/{new_user_id}"
+        put_url = collection_url(app_id, collection_id, new_user_id)
         
         # PUT kérés az összes mező frissítéséhez
-        print(f"PUT kérés küldése: {put_url}")
-        put_response = requests.put(put_url, headers=headers, json=complete_user_data)
+        log.debug("PUT kérés küldése: %s", put_url)
+        with stage("update"):
+            put_response = await http_client.put(put_url, headers=headers, json=complete_user_data)
         
-        print(f"PUT válasz státuszkód: {put_response.status_code}")
+        log.info("PUT válasz státuszkód: %s", put_response.status_code)
         
         if put_response.status_code not in [200, 201]:
-            print(f"Figyelmeztetés: A tömbök frissítése nem sikerült: {put_response.text}")
+            log.warning("A tömbök frissítése nem sikerült: %s", put_response.text)
         
         # 6. Tranzakciók frissítése - manuális teszt alapján
-        print("Tranzakciók frissítése...")
+        log.debug("Tranzakciók frissítése...")
         
         # Lekérjük az eredeti user tranzakcióit
         original_transactions = original_user.get("transactions_user", [])
-        print(f"Eredeti user tranzakciói: {len(original_transactions)} db")
+        log.info("Eredeti user tranzakciói: %s db", len(original_transactions))
         
         updated_transactions = 0
         failed_transactions = 0
         
         if original_transactions:
-            for transaction_id in original_transactions:
-                # Manuális teszt alapján: transactions app ID és API kulcs
-                transaction_url = f"https://api.adalo.com/v0/apps/{ADALO_TRANSACTIONS_APP_ID}/collections/{ADALO_TRANSACTIONS_COLLECTION_ID}/{transaction_id}"
-                transaction_headers = {
-                    "Authorization": f"Bearer {ADALO_TRANSACTIONS_API_KEY}",
-                    "Content-Type": "application/json"
+            # Manuális teszt alapján: transactions app ID és API kulcs
+            transaction_headers = adalo_headers(ADALO_TRANSACTIONS_API_KEY)
+
+            # Az összes tranzakció egy menetben (párhuzamosan) töltődik be, a PUT törzsek ebből készülnek
+            with stage("fetch"):
+                transactions, missing = await fetch_records_by_id(
+                    http_client,
+                    ADALO_TRANSACTIONS_APP_ID,
+                    ADALO_TRANSACTIONS_COLLECTION_ID,
+                    original_transactions,
+                    transaction_headers,
+                    concurrency=ADALO_WRITE_CONCURRENCY
+                )
+            for transaction_id, status_code in missing.items():
+                log.warning("Tranzakció %s nem található: %s", transaction_id, status_code, extra=sample("transaction_missing"))
+
+            async def loaded_transactions():
+                for transaction_id in transactions:
+                    yield {"id": transaction_id}
+
+            def build_transaction_payload(record: dict) -> dict:
+                transaction_data = transactions[record["id"]]
+                # Frissített tranzakció adatok - teljes payload, csak user_transaction változik
+                return {
+                    "id": transaction_data.get("id"),
+                    "transaction_id": transaction_data.get("transaction_id"),
+                    "transaction_status": transaction_data.get("transaction_status"),
+                    "user_transaction": [new_user_id],  # Csak az új user ID
+                    "partner_transaction": transaction_data.get("partner_transaction", []),
+                    "coupon_transaction": transaction_data.get("coupon_transaction"),
+                    "spend_value": transaction_data.get("spend_value"),
+                    "discount_value": transaction_data.get("discount_value"),
+                    "saved_value": transaction_data.get("saved_value"),
+                    "hunicoin_value": transaction_data.get("hunicoin_value"),
+                    "jutalek_value": transaction_data.get("jutalek_value"),
+                    "jouser_transact": transaction_data.get("jouser_transact"),
+                    "test_user_transaction": transaction_data.get("test_user_transaction"),
+                    "created_at": transaction_data.get("created_at"),
+                    "updated_at": transaction_data.get("updated_at")
                 }
-                
-                # 1. Lekérjük a tranzakciót
-                transaction_response = requests.get(transaction_url, headers=transaction_headers)
-                
-                if transaction_response.status_code == 200:
-                    transaction_data = transaction_response.json()
-                    
-                    # 2. Frissített tranzakció adatok - teljes payload, csak user_transaction változik
-                    updated_transaction_data = {
-                        "id": transaction_data.get("id"),
-                        "transaction_id": transaction_data.get("transaction_id"),
-                        "transaction_status": transaction_data.get("transaction_status"),
-                        "user_transaction": [new_user_id],  # Csak az új user ID
-                        "partner_transaction": transaction_data.get("partner_transaction", []),
-                        "coupon_transaction": transaction_data.get("coupon_transaction"),
-                        "spend_value": transaction_data.get("spend_value"),
-                        "discount_value": transaction_data.get("discount_value"),
-                        "saved_value": transaction_data.get("saved_value"),
-                        "hunicoin_value": transaction_data.get("hunicoin_value"),
-                        "jutalek_value": transaction_data.get("jutalek_value"),
-                        "jouser_transact": transaction_data.get("jouser_transact"),
-                        "test_user_transaction": transaction_data.get("test_user_transaction"),
-                        "created_at": transaction_data.get("created_at"),
-                        "updated_at": transaction_data.get("updated_at")
-                    }
-                    
-                    # Debug: Kiírjuk a payload-ot
-                    print(f"   PUT Payload: {updated_transaction_data}")
-                    print(f"   PUT Headers: {transaction_headers}")
-                    
-                    # 3. PUT kérés a tranzakció frissítéséhez
-                    transaction_put_response = requests.put(transaction_url, headers=transaction_headers, json=updated_transaction_data)
-                    
-                    if transaction_put_response.status_code in [200, 201]:
-                        updated_transactions += 1
-                        print(f"✅ Tranzakció {transaction_id} frissítve")
-                    else:
-                        failed_transactions += 1
-                        print(f"❌ Tranzakció {transaction_id} hiba: {transaction_put_response.status_code}")
+
+            def transaction_result(transaction_id, error: Optional[dict]) -> None:
+                if error is None:
+                    log.debug("Tranzakció %s frissítve", transaction_id, extra=sample("transaction_reassigned"))
                 else:
-                    failed_transactions += 1
-                    print(f"❌ Tranzakció {transaction_id} nem található: {transaction_response.status_code}")
+                    log.warning("Tranzakció %s hiba: %s", transaction_id, error['status'] or error['body'], extra=sample("transaction_reassign_failed"))
+
+            # A PUT-ok korlátozott párhuzamossággal futnak
+            reassignment = await bulk_update(
+                http_client,
+                loaded_transactions(),
+                lambda transaction_id: collection_url(ADALO_TRANSACTIONS_APP_ID, ADALO_TRANSACTIONS_COLLECTION_ID, transaction_id),
+                transaction_headers,
+                build_transaction_payload,
+                concurrency=ADALO_WRITE_CONCURRENCY,
+                on_result=transaction_result
+            )
+            updated_transactions = reassignment.updated
+            failed_transactions = len(missing) + len(reassignment.errors)
         else:
-            print("Nincs tranzakció az eredeti user-ben")
+            log.info("Nincs tranzakció az eredeti user-ben")
         
-        print(f"Frissített: {updated_transactions}, Hibás: {failed_transactions}")
+        log.info("Frissített: %s, Hibás: %s", updated_transactions, failed_transactions)
         
         # 7. Eredeti user törlése - csak ha nincs hibás tranzakció (403 hibák kivételével)
         original_user_deleted = False
-        print(f"Törlési feltétel ellenőrzése: failed_transactions={failed_transactions}, updated_transactions={updated_transactions}")
+        log.debug("Törlési feltétel ellenőrzése: failed_transactions=%s, updated_transactions=%s", failed_transactions, updated_transactions)
         
         # Ha csak 403 hibák vannak (jogosultság probléma), akkor is törölhető
         if failed_transactions == 0 or (failed_transactions > 0 and updated_transactions == 0):
-            print("Eredeti user törlése...")
-            delete_url = f"https://api.adalo.com/v0/apps/{app_id}/collections/{collection_id}/{user_id}"
-            print(f"DELETE URL: {delete_url}")
-            delete_response = requests.delete(delete_url, headers=headers)
-            print(f"DELETE Status: {delete_response.status_code}")
+            log.debug("Eredeti user törlése...")
+            delete_url = collection_url(app_id, collection_id, user_id)
+            log.debug("DELETE URL: %s", delete_url)
+            with stage("delete"):
+                delete_response = await http_client.delete(delete_url, headers=headers)
+            log.debug("DELETE Status: %s", delete_response.status_code)
             
             if delete_response.status_code in [200, 204]:
                 original_user_deleted = True
-                print(f"✅ Eredeti user {user_id} sikeresen törölve")
+                log.info("Eredeti user %s sikeresen törölve", user_id)
             else:
-                print(f"❌ Eredeti user {user_id} törlési hiba: {delete_response.status_code}")
-                print(f"DELETE Response: {delete_response.text}")
+                log.error("Eredeti user %s törlési hiba: %s", user_id, delete_response.status_code)
+                log.debug("DELETE Response: %s", delete_response.text)
         else:
-            print(f"Eredeti user nem törölhető: failed_transactions={failed_transactions}")
+            log.warning("Eredeti user nem törölhető: failed_transactions=%s", failed_transactions)
         
         return {
             "success": True,
@@ -1319,157 +1469,200 @@ async def deleteuser(user_id: int):
             "original_user_deleted": original_user_deleted
         }
         
-    except requests.exceptions.RequestException as e:
-        print(f"Adalo API hívási hiba: {str(e)}")
+    except httpx.HTTPError as e:
+        log.error("Adalo API hívási hiba: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Hiba az Adalo API hívás során: {str(e)}"
         )
     except Exception as e:
-        print(f"Váratlan hiba történt: {str(e)}")
+        log.exception("Váratlan hiba történt: %s", e)
         raise HTTPException(status_code=500, detail=f"Váratlan szerverhiba: {str(e)}")
 
-@app.get("/auto-delete-users")
-async def auto_delete_users():
+async def plan_auto_delete(today: datetime) -> dict:
     """
-    Automatikusan törli azokat a usereket, akiknek a wantsto_delete mezője legalább 30 napja be van állítva.
-    Ez a végpont cron job-okhoz készült, naponta egyszer futtatható.
+    Az automatikus törlés tervezési fázisa: végigmegy az összes useren, és összegyűjti azokat,
+    akiknek a wantsto_delete mezője legalább 30 napja be van állítva (a már törölt, delete_user
+    email-es userek kivételével). Upstream írás nem történik, így dry run-ként is visszaadható.
     """
-    if not ADALO_API_KEY:
-        raise HTTPException(status_code=500, detail="Adalo API kulcs nincs beállítva (ADALO_API_KEY környezeti változó)")
+    users_url = collection_url(ADALO_USERS_APP_ID, ADALO_USERS_COLLECTION_ID)
+    headers = adalo_headers(ADALO_API_KEY)
+    thirty_days_ago = today - pd.Timedelta(days=30)
 
-    print("\n=== Automatikus user törlés kezdése ===")
-    
-    # Adalo API konfiguráció
-    app_id = ADALO_USERS_APP_ID
-    collection_id = ADALO_USERS_COLLECTION_ID
-    api_key = ADALO_API_KEY
-    
-    # URL-ek
-    users_url = f"https://api.adalo.com/v0/apps/{app_id}/collections/{collection_id}"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
+    log.debug("Mai dátum: %s", today)
+    log.debug("30 nappal ezelőtt: %s", thirty_days_ago)
+
+    # Lekérjük az összes usert oldalanként, és ellenőrizzük minden usert
+    log.debug("Összes user lekérdezése...")
+    users_to_delete = []
+    total_users = 0
+
+    async for page in StageTimer("fetch").aiterate(iter_batches(adalo_records(users_url, headers))):
+        total_users += len(page)
+
+        # Az oldal feldolgozása a kérés "filter" szakaszidejébe számít
+        with stage("filter"):
+            # Kihagyjuk a már törölt usereket (delete_user-ral kezdődő email)
+            emails = column(page, "Email").fillna("").astype(str)
+            already_deleted = emails.str.startswith("delete_user").to_numpy()
+            for i in np.flatnonzero(already_deleted):
+                log.debug("User %s (%s) kihagyva: már törölt user", page[i].get('id'), emails[i], extra=sample("auto_delete_skipped"))
+
+            # Dátumok konvertálása egy menetben, és ellenőrizzük, hogy legalább 30 napja van-e beállítva
+            delete_dates = parse_timestamps(column(page, "wantsto_delete"))
+            for i in np.flatnonzero(~already_deleted & delete_dates.malformed):
+                log.warning("Hibás wantsto_delete formátum user %s-nél: %s", page[i].get('id'), page[i].get('wantsto_delete'), extra=sample("auto_delete_bad_date"))
+            due = ~already_deleted & (delete_dates.values <= thirty_days_ago).to_numpy()
+
+            for i in np.flatnonzero(due):
+                user = page[i]
+                user_id = user.get("id")
+                delete_date = delete_dates.values[i]
+                users_to_delete.append({
+                    "id": user_id,
+                    "email": user.get("Email", "N/A"),
+                    "full_name": user.get("Full Name", "N/A"),
+                    "wantsto_delete": user.get("wantsto_delete"),
+                    "days_old": (today - delete_date).days,
+                    "transactions": len(user.get("transactions_user") or [])
+                })
+                log.debug("User %s (%s) törlendő: %s (%s)", user_id, user.get('Email', 'N/A'), delete_date, delete_date.strftime('%Y-%m-%d'), extra=sample("auto_delete_due"))
+
+    log.info("Összesen %s user található", total_users)
+    log.info("Törlendő userek száma: %s", len(users_to_delete))
+
+    return {
+        "total_users_checked": total_users,
+        "users_to_delete": users_to_delete,
+        # Userenként GET + POST + PUT + DELETE, tranzakciónként GET + PUT
+        "estimated_requests": sum(4 + 2 * user["transactions"] for user in users_to_delete),
+        "thirty_days_ago": thirty_days_ago
     }
-    
+
+async def auto_delete_users_job(job: MutationJob) -> dict:
+    """
+    Az /auto-delete-users job törzse; a checkpointban már szereplő usereket nem törli újra.
+    Egyszerre legfeljebb AUTO_DELETE_CONCURRENCY user törlése fut, az upstream kérések összesített
+    számát a közös HTTP kliens host szintű limitje korlátozza.
+    """
+    log.info("Automatikus user törlés kezdése")
+
     try:
-        # 1. Lekérjük az összes usert
-        print("Összes user lekérdezése...")
-        response = requests.get(users_url, headers=headers)
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Adalo API hiba a userek lekérdezésekor: {response.text}"
-            )
-        
-        data = response.json()
-        users = data.get("records", [])
-        print(f"Összesen {len(users)} user található")
-        
-        # 2. Mai dátum (UTC)
+        # 1. Mai dátum (UTC), 2-3. tervezés: a törlendő userek listája
         today = datetime.now(timezone.utc)
-        thirty_days_ago = today - pd.Timedelta(days=30)
-        
-        print(f"Mai dátum: {today}")
-        print(f"30 nappal ezelőtt: {thirty_days_ago}")
-        
-        # 3. Ellenőrizzük minden usert
-        users_to_delete = []
-        
-        for user in users:
-            user_id = user.get("id")
-            wantsto_delete = user.get("wantsto_delete")
-            email = user.get("Email", "")
-            
-            # Kihagyjuk a már törölt usereket (delete_user-ral kezdődő email)
-            if email.startswith("delete_user"):
-                print(f"User {user_id} ({email}) kihagyva: már törölt user")
-                continue
-            
-            if wantsto_delete:
-                try:
-                    # Dátum konvertálása
-                    delete_date = datetime.strptime(wantsto_delete, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
-                    
-                    # Ellenőrizzük, hogy legalább 30 napja van-e beállítva
-                    if delete_date <= thirty_days_ago:
-                        users_to_delete.append({
-                            "id": user_id,
-                            "email": user.get("Email", "N/A"),
-                            "full_name": user.get("Full Name", "N/A"),
-                            "wantsto_delete": wantsto_delete,
-                            "days_old": (today - delete_date).days
-                        })
-                        print(f"User {user_id} ({user.get('Email', 'N/A')}) törlendő: {delete_date} ({delete_date.strftime('%Y-%m-%d')})")
-                        
-                except (ValueError, TypeError) as e:
-                    print(f"Figyelmeztetés: Hibás wantsto_delete formátum user {user_id}-nél: {wantsto_delete}")
-                    continue
-        
-        print(f"\nTörlendő userek száma: {len(users_to_delete)}")
-        
-        # 4. Töröljük a usereket
-        deleted_users = []
-        failed_deletions = []
-        
-        for user_info in users_to_delete:
+        plan = await plan_auto_delete(today)
+        users_to_delete = plan["users_to_delete"]
+        started = time.perf_counter()
+
+        # 4. Töröljük a usereket párhuzamosan (a korábbi futásban már feldolgozottakat kihagyva)
+        semaphore = asyncio.Semaphore(max(1, AUTO_DELETE_CONCURRENCY))
+
+        async def delete_one(user_info: dict) -> None:
             user_id = user_info["id"]
-            print(f"\n--- User {user_id} törlése ---")
-            
-            try:
-                # Használjuk a meglévő /deleteuser logikát
-                delete_response = await deleteuser(user_id)
-                
-                if delete_response.get("success"):
-                    deleted_users.append({
-                        "id": user_id,
-                        "email": user_info["email"],
-                        "full_name": user_info["full_name"],
-                        "days_old": user_info["days_old"],
-                        "new_user_id": delete_response.get("new_user_id"),
-                        "new_email": delete_response.get("new_email")
-                    })
-                    print(f"✅ User {user_id} sikeresen törölve")
-                else:
-                    failed_deletions.append({
+            async with semaphore:
+                log.debug("User %s törlése", user_id)
+                try:
+                    # Használjuk a meglévő /deleteuser logikát
+                    delete_response = await deleteuser(user_id)
+                except Exception as e:
+                    job.record_failure(user_id, {
                         "id": user_id,
                         "email": user_info["email"],
-                        "error": "deleteuser endpoint hiba"
+                        "error": str(e)
                     })
-                    print(f"❌ User {user_id} törlési hiba")
-                    
-            except Exception as e:
-                failed_deletions.append({
+                    log.error("User %s kivétel: %s", user_id, e)
+                    return
+
+            if delete_response.get("success"):
+                job.record_success(user_id, {
                     "id": user_id,
                     "email": user_info["email"],
-                    "error": str(e)
+                    "full_name": user_info["full_name"],
+                    "days_old": user_info["days_old"],
+                    "new_user_id": delete_response.get("new_user_id"),
+                    "new_email": delete_response.get("new_email")
                 })
-                print(f"❌ User {user_id} kivétel: {str(e)}")
-        
+                log.info("User %s sikeresen törölve", user_id)
+            else:
+                job.record_failure(user_id, {
+                    "id": user_id,
+                    "email": user_info["email"],
+                    "error": "deleteuser endpoint hiba"
+                })
+                log.error("User %s törlési hiba", user_id)
+
+        tasks = [
+            asyncio.ensure_future(delete_one(user_info))
+            for user_info in users_to_delete
+            if not job.is_done(user_info["id"])
+        ]
+        job.progress = {"planned": len(users_to_delete), "remaining_at_start": len(tasks)}
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # Leállításkor a még várakozó törléseket eldobjuk (a következő futás folytatja őket)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        duration = time.perf_counter() - started
+
+        deleted_users = [entry["detail"] for entry in job.succeeded]
+        failed_deletions = [entry["detail"] for entry in job.failed]
         return {
             "success": True,
             "message": "Automatikus törlés befejezve",
-            "total_users_checked": len(users),
+            "total_users_checked": plan["total_users_checked"],
             "users_to_delete_found": len(users_to_delete),
             "successfully_deleted": len(deleted_users),
             "failed_deletions": len(failed_deletions),
             "deleted_users": deleted_users,
             "failed_users": failed_deletions,
             "execution_date": today.isoformat(),
-            "thirty_days_ago": thirty_days_ago.isoformat()
+            "thirty_days_ago": plan["thirty_days_ago"].isoformat(),
+            "duration_seconds": round(duration, 3)
         }
         
-    except requests.exceptions.RequestException as e:
-        print(f"Adalo API hívási hiba: {str(e)}")
+    except httpx.HTTPError as e:
+        log.error("Adalo API hívási hiba: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Hiba az Adalo API hívás során: {str(e)}"
         )
     except Exception as e:
-        print(f"Váratlan hiba történt: {str(e)}")
+        log.exception("Váratlan hiba történt: %s", e)
         raise HTTPException(status_code=500, detail=f"Váratlan szerverhiba: {str(e)}")
 
+@app.get("/auto-delete-users")
+async def auto_delete_users(
+    background: bool = Query(False, description="Optional: true esetén azonnal visszatér a job adataival (haladás: GET /jobs/{job_id})"),
+    dry_run: bool = Query(False, description="Optional: true esetén csak a törlési tervet adja vissza, semmit nem töröl")
+):
+    """
+    Automatikusan törli azokat a usereket, akiknek a wantsto_delete mezője legalább 30 napja be van állítva.
+    Ez a végpont cron job-okhoz készült, naponta egyszer futtatható.
+    Tartós háttér jobként fut: újraindítás után onnan folytatódik, ahol abbamaradt.
+    """
+    if not ADALO_API_KEY:
+        raise HTTPException(status_code=500, detail="Adalo API kulcs nincs beállítva (ADALO_API_KEY környezeti változó)")
+
+    if dry_run:
+        today = datetime.now(timezone.utc)
+        try:
+            plan = await plan_auto_delete(today)
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=500, detail=f"Hiba az Adalo API hívás során: {str(e)}")
+        return {
+            "dry_run": True,
+            "total_users_checked": plan["total_users_checked"],
+            "users_to_delete_found": len(plan["users_to_delete"]),
+            "users_to_delete": plan["users_to_delete"],
+            "estimated_requests": plan["estimated_requests"],
+            "execution_date": today.isoformat(),
+            "thirty_days_ago": plan["thirty_days_ago"].isoformat()
+        }
+
+    return await run_mutation_job("auto-delete-users", background)
+
 @app.post("/sendmails")
 async def sendmails(request_data: SendMailsRequest):
     """
@@ -1479,62 +1672,50 @@ async def sendmails(request_data: SendMailsRequest):
     if not ADALO_API_KEY:
         raise HTTPException(status_code=500, detail="Adalo API kulcs nincs beállítva (ADALO_API_KEY környezeti változó)")
 
-    print(f"\n=== Bulk email küldés kezdése ===")
-    print(f"Template ID: {request_data.template_id}")
-    print(f"Subject: {request_data.subject}")
+    log.info("Bulk email küldés kezdése")
+    log.debug("Template ID: %s", request_data.template_id)
+    log.debug("Subject: %s", request_data.subject)
     
-    # MailerSend API konfiguráció
-    MAILERSEND_API_KEY = "mlsn.f16b8868e4730cd3c9f9f5319e2b20c7627b8548541ba811c7a77c9281ce0d2c"
-    MAILERSEND_BULK_URL = "https://api.mailersend.com/v1/bulk-email"
-    
-    mailersend_headers = {
-        "Content-Type": "application/json",
-        "X-Requested-With": "XMLHttpRequest",
-        "Authorization": f"Bearer {MAILERSEND_API_KEY}"
-    }
+    # A közös mezők (from / subject / template_id) egyszer készülnek el
+    template = EmailTemplate(
+        request_data.from_email,
+        request_data.from_name,
+        request_data.subject,
+        request_data.template_id,
+        request_data.personalization_data
+    )
+    counts = {"total_users": 0, "valid_users": 0}
     
     try:
         # 1. Lekérjük az összes usert az Adalo Collection API-ból (mint a /download-users-collection)
-        print("Userek lekérdezése az Adalo Collection API-ból...")
+        log.debug("Userek lekérdezése az Adalo Collection API-ból...")
         app_id = ADALO_USERS_APP_ID
         collection_id = ADALO_USERS_COLLECTION_ID
         api_key = ADALO_API_KEY
         
-        users_url = f"https://api.adalo.com/v0/apps/{app_id}/collections/{collection_id}"
-        adalo_headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.get(users_url, headers=adalo_headers)
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Adalo API hiba a userek lekérdezésekor: {response.text}"
-            )
-        
-        data = response.json()
-        users = data.get("records", [])
-        print(f"Összesen {len(users)} user található az Adalo Collection API-ból")
-        
-        # 2. Készítsük el a recipient listát
-        valid_users = []
-        
-        if request_data.user_emails:
-            # Ha saját email lista van megadva
-            print(f"Saját email lista használata: {len(request_data.user_emails)} email")
-            for email in request_data.user_emails:
-                if email and not email.startswith("delete_user"):
-                    valid_users.append({
-                        "email": email,
-                        "full_name": "",  # Nincs full name a saját listában
-                        "user_id": None
-                    })
-        else:
+        users_url = collection_url(app_id, collection_id)
+        users_headers = adalo_headers(api_key)
+        
+        # 2. A recipient lista lustán, generátorból áll elő (a batch-ek küldése közben)
+        async def recipients():
+            if request_data.user_emails:
+                # Ha saját email lista van megadva, az Adalo userek lekérdezésére nincs szükség
+                log.info("Saját email lista használata: %s email", len(request_data.user_emails))
+                counts["total_users"] = len(request_data.user_emails)
+                for email in request_data.user_emails:
+                    if email and not email.startswith("delete_user"):
+                        counts["valid_users"] += 1
+                        yield {
+                            "email": email,
+                            "full_name": "",  # Nincs full name a saját listában
+                            "user_id": None
+                        }
+                return
+
             # Ha nincs saját lista, akkor az összes user az Adalo Collection API-ból
-            print("Összes user használata az Adalo Collection API-ból")
-            for user in users:
+            log.debug("Összes user használata az Adalo Collection API-ból")
+            async for user in adalo_records(users_url, users_headers):
+                counts["total_users"] += 1
                 email = user.get("Email", "")
                 wantsto_delete = user.get("wantsto_delete")
                 
@@ -1543,110 +1724,48 @@ async def sendmails(request_data: SendMailsRequest):
                     not email.startswith("delete_user") and 
                     not wantsto_delete):  # Csak azok, akik NEM akarnak törölni
                     
-                    valid_users.append({
+                    counts["valid_users"] += 1
+                    log.debug("User %s (%s) hozzáadva", user.get('id'), email, extra=sample("mail_recipient"))
+                    yield {
                         "email": email,
                         "full_name": user.get("Full Name", ""),
                         "user_id": user.get("id")
-                    })
-                    print(f"User {user.get('id')} ({email}) hozzáadva")
+                    }
                 else:
                     if email.startswith("delete_user"):
-                        print(f"User {user.get('id')} ({email}) kihagyva: már törölt")
+                        log.debug("User %s (%s) kihagyva: már törölt", user.get('id'), email, extra=sample("mail_recipient_skipped"))
                     elif wantsto_delete:
-                        print(f"User {user.get('id')} ({email}) kihagyva: törölni akar")
+                        log.debug("User %s (%s) kihagyva: törölni akar", user.get('id'), email, extra=sample("mail_recipient_skipped"))
                     else:
-                        print(f"User {user.get('id')} ({email}) kihagyva: nincs email")
+                        log.debug("User %s (%s) kihagyva: nincs email", user.get('id'), email, extra=sample("mail_recipient_skipped"))
+            log.info("Összesen %s user található az Adalo Collection API-ból", counts['total_users'])
         
-        print(f"Érvényes userek száma: {len(valid_users)}")
+        # 3. MailerSend bulk email küldés
+        # MailerSend bulk endpoint: max 500 email objektum, mindegyik max 50 TO recipient
+        # Ha több mint 500 user van, több batch-re bontjuk, és a batch-ek párhuzamosan mennek ki
+        all_bulk_responses = await send_bulk_emails(
+            http_client,
+            MAILERSEND_BULK_URL,
+            mailersend_headers(MAILERSEND_API_KEY),
+            template,
+            recipients(),
+            batch_size=MAILERSEND_BATCH_SIZE,
+            concurrency=MAILERSEND_CONCURRENCY,
+            max_retries=MAILERSEND_MAX_RETRIES,
+            retry_backoff=HTTP_RETRY_BACKOFF
+        )
+        total_users = counts["total_users"]
+        total_batches = len(all_bulk_responses)
+        log.info("Érvényes userek száma: %s, batch-ek száma: %s", counts['valid_users'], total_batches)
         
-        if not valid_users:
+        if not counts["valid_users"]:
             return {
                 "success": False,
                 "message": "Nincs érvényes user email cím",
-                "total_users": len(users) if not request_data.user_emails else len(request_data.user_emails),
+                "total_users": total_users,
                 "valid_users": 0
             }
         
-        # 3. Készítsük el a MailerSend bulk email payload-ot
-        # MailerSend bulk endpoint: max 500 email objektum, mindegyik max 50 TO recipient
-        # Ha több mint 500 user van, több batch-re kell bontani
-        
-        batch_size = 500
-        total_batches = (len(valid_users) + batch_size - 1) // batch_size
-        
-        print(f"Batch-ek száma: {total_batches}")
-        
-        all_bulk_responses = []
-        
-        for batch_num in range(total_batches):
-            start_idx = batch_num * batch_size
-            end_idx = min(start_idx + batch_size, len(valid_users))
-            batch_users = valid_users[start_idx:end_idx]
-            
-            print(f"Batch {batch_num + 1}/{total_batches}: {len(batch_users)} user")
-            
-            # Készítsük el a bulk email objektumokat
-            bulk_emails = []
-            
-            for user in batch_users:
-                email_obj = {
-                    "from": {
-                        "email": request_data.from_email,
-                        "name": request_data.from_name
-                    },
-                    "to": [
-                        {
-                            "email": user["email"],
-                            "name": user["full_name"] if user["full_name"] else None
-                        }
-                    ],
-                    "subject": request_data.subject,
-                    "template_id": request_data.template_id
-                }
-                
-                # Personalization hozzáadása, ha van
-                if request_data.personalization_data:
-                    email_obj["personalization"] = [
-                        {
-                            "email": user["email"],
-                            "data": request_data.personalization_data
-                        }
-                    ]
-                
-                bulk_emails.append(email_obj)
-            
-            # MailerSend bulk API hívás
-            print(f"MailerSend bulk API hívás batch {batch_num + 1}...")
-            
-            bulk_payload = bulk_emails
-            
-            bulk_response = requests.post(
-                MAILERSEND_BULK_URL,
-                headers=mailersend_headers,
-                json=bulk_payload
-            )
-            
-            print(f"MailerSend válasz státuszkód: {bulk_response.status_code}")
-            
-            if bulk_response.status_code in [200, 201, 202]:
-                bulk_data = bulk_response.json()
-                all_bulk_responses.append({
-                    "batch_num": batch_num + 1,
-                    "status": "success",
-                    "bulk_email_id": bulk_data.get("id"),
-                    "users_count": len(batch_users)
-                })
-                print(f"✅ Batch {batch_num + 1} sikeresen elküldve")
-            else:
-                error_detail = f"MailerSend API hiba batch {batch_num + 1}: {bulk_response.status_code} - {bulk_response.text}"
-                print(f"❌ {error_detail}")
-                all_bulk_responses.append({
-                    "batch_num": batch_num + 1,
-                    "status": "error",
-                    "error": error_detail,
-                    "users_count": len(batch_users)
-                })
-        
         # 4. Összesítés
         successful_batches = sum(1 for resp in all_bulk_responses if resp["status"] == "success")
         failed_batches = len(all_bulk_responses) - successful_batches
@@ -1654,8 +1773,8 @@ async def sendmails(request_data: SendMailsRequest):
         return {
             "success": True,
             "message": "Bulk email küldés befejezve",
-            "total_users": len(users),
-            "valid_users": len(valid_users),
+            "total_users": total_users,
+            "valid_users": counts["valid_users"],
             "total_batches": total_batches,
             "successful_batches": successful_batches,
             "failed_batches": failed_batches,
@@ -1664,14 +1783,14 @@ async def sendmails(request_data: SendMailsRequest):
             "subject": request_data.subject
         }
         
-    except requests.exceptions.RequestException as e:
-        print(f"API hívási hiba: {str(e)}")
+    except httpx.HTTPError as e:
+        log.error("API hívási hiba: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Hiba az API hívás során: {str(e)}"
         )
     except Exception as e:
-        print(f"Váratlan hiba történt: {str(e)}")
+        log.exception("Váratlan hiba történt: %s", e)
         raise HTTPException(status_code=500, detail=f"Váratlan szerverhiba: {str(e)}")
 
 @app.get("/hun/{user_id}")
@@ -1679,17 +1798,12 @@ async def set_hungarian(user_id: int):
     """
     Beállítja a megadott felhasználó text_ mezőit magyar nyelvre.
     """
-    texts_path = os.path.join(os.path.dirname(__file__), "texts_hun.json")
-    with open(texts_path, "r", encoding="utf-8") as f:
-        texts = json.load(f)
+    texts = text_bundles["hun"].get()
 
-    url = f"https://api.adalo.com/v0/apps/{ADALO_USERS_APP_ID}/collections/{ADALO_USERS_COLLECTION_ID}/{user_id}"
-    headers = {
-        "Authorization": f"Bearer {ADALO_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    url = collection_url(ADALO_USERS_APP_ID, ADALO_USERS_COLLECTION_ID, user_id)
+    headers = adalo_headers(ADALO_API_KEY)
 
-    resp = requests.put(url, headers=headers, json=texts)
+    resp = await user_writes.put(url, headers=headers, json=texts)
     if resp.status_code not in [200, 201]:
         raise HTTPException(status_code=resp.status_code, detail=f"Adalo API hiba: {resp.text}")
 
@@ -1701,102 +1815,338 @@ async def set_english(user_id: int):
     """
     Beállítja a megadott felhasználó text_ mezőit angol nyelvre.
     """
-    texts_path = os.path.join(os.path.dirname(__file__), "texts_eng.json")
-    with open(texts_path, "r", encoding="utf-8") as f:
-        texts = json.load(f)
+    texts = text_bundles["eng"].get()
 
-    url = f"https://api.adalo.com/v0/apps/{ADALO_USERS_APP_ID}/collections/{ADALO_USERS_COLLECTION_ID}/{user_id}"
-    headers = {
-        "Authorization": f"Bearer {ADALO_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    url = collection_url(ADALO_USERS_APP_ID, ADALO_USERS_COLLECTION_ID, user_id)
+    headers = adalo_headers(ADALO_API_KEY)
 
-    resp = requests.put(url, headers=headers, json=texts)
+    resp = await user_writes.put(url, headers=headers, json=texts)
     if resp.status_code not in [200, 201]:
         raise HTTPException(status_code=resp.status_code, detail=f"Adalo API hiba: {resp.text}")
 
     return {"success": True, "user_id": user_id, "language": "eng", "updated_fields": texts}
 
 
+@app.post("/lang/batch")
+async def set_language_batch(request_data: LanguageBatchRequest):
+    """
+    Több felhasználó text_ mezőinek beállítása a megadott nyelvre, párhuzamos PUT-okkal.
+    Azok a userek kimaradnak, akiknél már minden szöveg a kért nyelven van.
+    """
+    if not request_data.user_ids:
+        raise HTTPException(status_code=400, detail="A user_ids lista nem lehet üres")
+
+    texts = text_bundles[request_data.language].get()
+    headers = adalo_headers(ADALO_API_KEY)
+
+    try:
+        # Az aktuális rekordok egy menetben töltődnek be, ebből dől el, kinél kell írni
+        with stage("fetch"):
+            users, missing = await fetch_records_by_id(
+                http_client,
+                ADALO_USERS_APP_ID,
+                ADALO_USERS_COLLECTION_ID,
+                request_data.user_ids,
+                headers,
+                concurrency=ADALO_WRITE_CONCURRENCY
+            )
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Hiba az Adalo API hívás során: {str(e)}")
+
+    async def loaded_users():
+        for user in users.values():
+            yield user
+
+    def build_payload(user: dict) -> Optional[dict]:
+        if all(user.get(key) == value for key, value in texts.items()):
+            return None
+        return texts
+
+    result = await bulk_update(
+        user_writes,
+        loaded_users(),
+        lambda user_id: collection_url(ADALO_USERS_APP_ID, ADALO_USERS_COLLECTION_ID, user_id),
+        headers,
+        build_payload,
+        concurrency=ADALO_WRITE_CONCURRENCY
+    )
+
+    return {
+        "success": not missing and not result.errors,
+        "language": request_data.language,
+        "requested": len(request_data.user_ids),
+        "updated": result.updated,
+        "skipped": result.skipped,
+        "not_found": [{"user_id": user_id, "status": status} for user_id, status in missing.items()],
+        "errors": [
+            {"user_id": error["user_id"], "status": error["status"], "detail": error["body"]}
+            for error in result.errors
+        ],
+        "stats": result.to_dict()
+    }
+
+
+async def set_all_hungarian_job(job: MutationJob) -> dict:
+    """
+    A /set-all-hungarian job törzse; a checkpointban már szereplő usereket kihagyja.
+    """
+    texts = text_bundles["hun"].get()
+
+    log.info("Összes user magyar szövegre állítása")
+
+    url = collection_url(ADALO_USERS_APP_ID, ADALO_USERS_COLLECTION_ID)
+    headers = adalo_headers(ADALO_API_KEY)
+
+    # Összes user lekérése paginálva, és frissítése párhuzamos PUT-okkal
+    users_with_email = 0
+    # Egy folytatott job korábbi futásaiban már feldolgozott userek (ezek nem "kihagyottak")
+    already_done = 0
+
+    def build_payload(user: dict) -> Optional[dict]:
+        nonlocal users_with_email, already_done
+        # Szűrés: csak akiknek van email
+        if not user.get("Email"):
+            return None
+        users_with_email += 1
+        if job.is_done(user["id"]):
+            already_done += 1
+            return None
+        # Akinél már minden szöveg magyar, annál nincs mit írni
+        if all(user.get(key) == value for key, value in texts.items()):
+            return None
+        return texts
+
+    result = await bulk_update(
+        user_writes,
+        adalo_records(url, headers),
+        lambda user_id: f"{url}/{user_id}",
+        headers,
+        build_payload,
+        concurrency=ADALO_WRITE_CONCURRENCY,
+        on_result=job_checkpoint(job)
+    )
+    errors = [
+        {"user_id": entry["id"], "status": entry["detail"]["status"], "detail": entry["detail"]["body"]}
+        for entry in job.failed
+    ]
+
+    log.info("Összes user: %s, email-lel rendelkező: %s", result.total, users_with_email)
+    log.info("Kész! Frissítve: %s, Hibás: %s", len(job.succeeded), len(errors))
+
+    return {
+        "success": True,
+        "total_users": users_with_email,
+        "updated": len(job.succeeded),
+        "skipped": users_with_email - already_done - result.updated - len(result.errors),
+        "errors_count": len(errors),
+        "errors": errors[:20],
+        "stats": result.to_dict()
+    }
+
 @app.get("/set-all-hungarian")
-async def set_all_hungarian():
+async def set_all_hungarian(
+    background: bool = Query(False, description="Optional: true esetén azonnal visszatér a job adataival (haladás: GET /jobs/{job_id})")
+):
     """
     Végigmegy az összes useren és beállítja a text_ mezőket magyar nyelvre.
-    Csak azokat a usereket frissíti, akiknek van email címe.
+    Csak azokat a usereket frissíti, akiknek van email címe, és akiknél még nem minden szöveg magyar.
+    Tartós háttér jobként fut: újraindítás után onnan folytatódik, ahol abbamaradt.
     """
-    texts_path = os.path.join(os.path.dirname(__file__), "texts_hun.json")
-    with open(texts_path, "r", encoding="utf-8") as f:
-        texts = json.load(f)
+    return await run_mutation_job("set-all-hungarian", background)
 
-    print("\n=== Összes user magyar szövegre állítása ===")
 
-    url = f"https://api.adalo.com/v0/apps/{ADALO_USERS_APP_ID}/collections/{ADALO_USERS_COLLECTION_ID}"
-    headers = {
-        "Authorization": f"Bearer {ADALO_API_KEY}",
-        "Content-Type": "application/json"
-    }
+@app.get("/coupons-cache")
+async def coupons_cache_stats():
+    """
+    A kupon cache állapota és találati számlálói.
+    """
+    return coupons_cache.stats()
 
-    # Összes user lekérése paginálva
-    all_users = []
-    offset = 0
-    limit = 100
-    page = 1
 
-    while True:
-        params = {"offset": offset, "limit": limit}
-        resp = requests.get(url, headers=headers, params=params)
-        if resp.status_code != 200:
-            raise HTTPException(status_code=resp.status_code, detail=f"Adalo API hiba: {resp.text}")
+@app.post("/coupons-cache/invalidate")
+async def invalidate_coupons_cache():
+    """
+    Érvényteleníti a kupon cache-t; a következő export újra lekéri a kuponokat.
+    """
+    coupons_cache.invalidate()
+    return {"success": True, "cache": coupons_cache.stats()}
 
-        data = resp.json()
-        records = data.get("records", [])
-        print(f"Oldal {page}: {len(records)} rekord")
 
-        if not records:
-            break
+@app.get("/export-cache")
+async def export_cache_stats():
+    """
+    A renderelt export cache mérete és találati számlálói.
+    """
+    return export_cache.stats()
 
-        all_users.extend(records)
 
-        next_offset = data.get("offset")
-        if next_offset is not None and next_offset > offset:
-            offset = next_offset
-        elif len(records) >= limit:
-            offset += limit
-        else:
-            break
+@app.post("/export-cache/clear")
+async def clear_export_cache():
+    """
+    Kiüríti a renderelt export cache-t.
+    """
+    export_cache.clear()
+    return {"success": True, "cache": export_cache.stats()}
 
-        page += 1
 
-    # Szűrés: csak akiknek van email
-    users_with_email = [u for u in all_users if u.get("Email")]
-    print(f"Összes user: {len(all_users)}, email-lel rendelkező: {len(users_with_email)}")
+def cache_metrics():
+    """
+    A cache-ek, a HTTP kliens, a user írások és a naplózás állapota a /metrics-hez (lekéréskor számolva).
+    """
+    caches = [coupons_cache.stats(), export_cache.stats(), record_cache.stats()]
+    yield ("huniexport_cache_hits_total", "counter", "Cache találatok (stale találatokkal együtt).",
+           [({"cache": c["name"]}, c["hits"] + c.get("stale_hits", 0)) for c in caches])
+    yield ("huniexport_cache_misses_total", "counter", "Cache hiányok.",
+           [({"cache": c["name"]}, c["misses"]) for c in caches])
+    yield ("huniexport_cache_entries", "gauge", "Cache bejegyzések száma.",
+           [({"cache": c["name"]}, c["entries"]) for c in caches if "entries" in c])
+    yield ("huniexport_text_bundle_loads_total", "counter", "Nyelvi szövegcsomagok (újra)betöltései.",
+           [({"language": language}, bundle.loads) for language, bundle in text_bundles.items()])
+    client_stats = http_client.stats()
+    yield ("huniexport_upstream_retries_total", "counter", "Upstream újrapróbálkozások.", [({}, client_stats["retries"])])
+    yield ("huniexport_upstream_coalesced_total", "counter", "Közös (single-flight) upstream kéréshez csatlakozott hívások.",
+           [({}, client_stats["single_flight"]["coalesced"])])
+    yield ("huniexport_upstream_concurrency_limit", "gauge", "Host-onkénti adaptív párhuzamossági limit.",
+           [({"host": host}, limiter["limit"]) for host, limiter in client_stats["hosts"].items()])
+    yield ("huniexport_upstream_in_flight", "gauge", "Host-onként éppen futó upstream kérések.",
+           [({"host": host}, limiter["in_flight"]) for host, limiter in client_stats["hosts"].items()])
+    writes = user_writes.stats()
+    yield ("huniexport_user_writes_total", "counter", "User rekordokra kért írások.", [({}, writes["requested_writes"])])
+    yield ("huniexport_user_write_puts_total", "counter", "Összefésülés után ténylegesen elküldött user PUT-ok.", [({}, writes["sent_puts"])])
+    logs = logging_setup.stats()
+    yield ("huniexport_log_records_dropped_total", "counter", "Tele naplósor miatt eldobott naplórekordok.", [({}, logs["dropped"])])
+    yield ("huniexport_log_records_sampled_out_total", "counter", "Mintavétel miatt ki nem írt rekordonkénti naplóüzenetek.", [({}, logs["sampled_out"])])
+    yield ("huniexport_log_queue_length", "gauge", "Kiírásra váró naplórekordok.", [({}, logs["queued"])])
+
+REGISTRY.add_collector(cache_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus szöveges formátumú metrikák: válaszidő hisztogramok útvonalanként és upstream
+    hívástípusonként, kérésenkénti upstream hívás / oldal / bájt eloszlás, exportált sorok,
+    cache találati arányok.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
-    updated = 0
-    errors = []
+@app.get("/record-cache")
+async def record_cache_stats():
+    """
+    A rekord cache állapota (bejegyzések, találati arány, kiszorítások, érvénytelenítések).
+    """
+    return record_cache.stats()
 
-    for user in users_with_email:
-        uid = user.get("id")
-        put_url = f"{url}/{uid}"
-        put_resp = requests.put(put_url, headers=headers, json=texts)
-        if put_resp.status_code in [200, 201]:
-            updated += 1
-        else:
-            errors.append({"user_id": uid, "status": put_resp.status_code, "detail": put_resp.text})
+@app.post("/record-cache/clear")
+async def clear_record_cache():
+    """
+    A rekord cache ürítése (pl. ha az appban közvetlenül módosítottak rekordokat).
+    """
+    record_cache.clear()
+    return {"success": True, "stats": record_cache.stats()}
 
-        if updated % 50 == 0 and updated > 0:
-            print(f"Frissítve: {updated}/{len(users_with_email)}")
+@app.get("/http-client")
+async def http_client_stats():
+    """
+    Az upstream hostok adaptív párhuzamossági limitje, válaszideje, 429 / hiba számlálói és az újrapróbálkozások száma,
+    valamint a user írások összefésülésének statisztikája.
+    """
+    return {**http_client.stats(), "user_writes": user_writes.stats()}
 
-    print(f"Kész! Frissítve: {updated}, Hibás: {len(errors)}")
 
+@app.get("/transactions-index")
+async def transactions_index_stats():
+    """
+    A partner -> tranzakció memóriabeli index mérete, felépítési ideje és a replika állapota.
+    """
     return {
-        "success": True,
-        "total_users": len(users_with_email),
-        "updated": updated,
-        "errors_count": len(errors),
-        "errors": errors[:20]
+        "index": transactions_index.stats(),
+        "replica": {
+            "enabled": transactions_replica is not None,
+            "transactions": transactions_replica.count() if transactions_replica is not None else None,
+            "staleness_seconds": transactions_replica.staleness() if transactions_replica is not None else None,
+            "watermark": transactions_replica.watermark if transactions_replica is not None else None,
+            "last_error": transactions_replica.last_error if transactions_replica is not None else None
+        }
     }
 
 
+@app.post("/exports", status_code=202)
+async def create_export_job(request_data: ExportJobRequest):
+    """
+    Export indítása a háttérben (a letöltő végpontokkal azonos tartalommal); a válasz a job azonosítója.
+    A haladás a GET /exports/{job_id}, a kész fájl a GET /exports/{job_id}/file végponton érhető el.
+    """
+    if not ADALO_API_KEY:
+        raise HTTPException(status_code=500, detail="Adalo API kulcs nincs beállítva (ADALO_API_KEY környezeti változó)")
+
+    if request_data.format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="A parquet exporthoz a pyarrow csomag szükséges")
+
+    # A dátumokat már itt ellenőrizzük, így a hibás kérés nem jut el a job-ig
+    parse_date_window(request_data.from_date, request_data.to_date)
+
+    if request_data.kind == "partner-transactions":
+        if request_data.partner_id is None:
+            raise HTTPException(status_code=400, detail="A partner-transactions exporthoz partner_id szükséges")
+        build = lambda progress: build_partner_transactions_export(
+            request_data.partner_id, request_data.from_date, request_data.to_date, request_data.max_staleness, progress
+        )
+    elif request_data.kind == "users":
+        build = lambda progress: build_users_export(request_data.from_date, request_data.to_date, progress)
+    else:
+        build = lambda progress: build_users_collection_export(request_data.from_date, request_data.to_date, progress)
+
+    job = export_jobs.submit(request_data.kind, request_data.format, request_data.model_dump(exclude={"kind", "format"}), build)
+    return job.to_dict()
+
+@app.get("/exports/{job_id}")
+async def get_export_job(job_id: str):
+    """
+    Egy export job állapota és haladása (lekért oldalak, kiírt sorok).
+    """
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Nem található export job: {job_id}")
+    return job.to_dict()
+
+@app.get("/exports/{job_id}/file")
+async def download_export_job(job_id: str):
+    """
+    A kész export fájl letöltése. Támogatja a HTTP Range kéréseket, így a megszakadt letöltés folytatható.
+    """
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Nem található export job: {job_id}")
+    if job.status == "expired":
+        raise HTTPException(status_code=410, detail=f"Az export fájl már lejárt: {job_id}")
+    if job.status == "failed":
+        raise HTTPException(status_code=409, detail=f"Az export job sikertelen: {job.error}")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Az export még nem készült el (állapot: {job.status})")
+    return FileResponse(job.path, media_type=job.media_type, filename=job.filename)
+
+
+@app.get("/jobs")
+async def list_mutation_jobs(limit: int = Query(20, ge=1, le=200)):
+    """
+    A legutóbbi módosító jobok (set-all-hungarian, notifalse, auto-delete-users) állapota.
+    """
+    return {"jobs": mutation_jobs.recent(limit)}
+
+@app.get("/jobs/{job_id}")
+async def get_mutation_job(
+    job_id: str,
+    details: bool = Query(False, description="Optional: true esetén a sikeres és hibás rekordok listája is")
+):
+    """
+    Egy módosító job állapota és haladása (sikeres / hibás rekordok, utoljára feldolgozott id).
+    """
+    job = mutation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Nem található job: {job_id}")
+    return job.to_dict(details=details)
+
+
 @app.get("/ping")
 async def ping():
     """
@@ -0,0 +1,223 @@
+"""
+Strukturált, nem blokkoló naplózás a print() hívások helyett.
+
+- Szintek útvonalanként: az alapszint (LOG_LEVEL) mellett egyes útvonalakra (a route sablonra,
+  pl. /download-transactions/{partner_id}) külön szint adható meg.
+- Mintavétel: a rekordonkénti (ciklusban keletkező) üzenetek `extra=sample("kulcs")`-csal
+  jelölve kulcsonként csak minden N-edik alkalommal kerülnek ki; a többit csak megszámoljuk.
+- Aszinkron kiírás: a hívó szál csak egy korlátos sorba teszi a rekordot (tele sor esetén
+  eldobja), a formázás, a titkok kitakarása és a stdout írás egy háttérszálban történik.
+- Kitakarás: az ismert titkok (API kulcsok) és a Bearer tokenek / Authorization értékek
+  helyére *** kerül a kimenetben.
+"""
+import atexit
+import json
+import logging
+import queue
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterable
+
+from metrics import current_request
+
+ROOT_LOGGER = "huniexport"
+
+# Az üzenetből kitakarandó minták: Bearer token, illetve Authorization / api_key jellegű kulcs-érték párok
+_SECRET_PATTERNS = [
+    re.compile(r"(Bearer\s+)[A-Za-z0-9._~+/=-]+", re.IGNORECASE),
+    re.compile(r"""((?:authorization|api[_-]?key|x-admin-key)['"]?\s*[:=]\s*['"]?)[^'",\s}]+""", re.IGNORECASE),
+]
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def sample(key: str) -> dict:
+    """
+    `extra` érték a rekordonkénti üzenetekhez: az azonos kulcsú üzenetekből csak minden N-edik kerül ki.
+    """
+    return {"sample_key": key}
+
+
+def parse_route_levels(spec: str) -> Dict[str, int]:
+    """
+    "útvonal=SZINT,útvonal=SZINT" formátum, pl. "/download-transactions/{partner_id}=WARNING".
+    """
+    levels: Dict[str, int] = {}
+    for item in spec.split(","):
+        route, sep, level = item.strip().rpartition("=")
+        if not sep or not route:
+            continue
+        levels[route.strip()] = logging.getLevelName(level.strip().upper())
+    return {route: level for route, level in levels.items() if isinstance(level, int)}
+
+
+class RouteLevelFilter(logging.Filter):
+    """
+    Az aktuális kérés útvonalához tartozó szint alapján szűr, és a rekordba írja az útvonalat
+    (a hívó szálban fut, itt még elérhető a kérés contextvar-ja).
+    """
+
+    def __init__(self, default_level: int, route_levels: Dict[str, int]):
+        super().__init__()
+        self.default_level = default_level
+        self.route_levels = route_levels
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        stats = current_request.get()
+        route = stats.route if stats is not None else None
+        record.route = route
+        return record.levelno >= self.route_levels.get(route, self.default_level)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    A `sample_key`-jel jelölt rekordokból kulcsonként az 1., N+1., 2N+1. ... kerül át.
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self.seen: Dict[str, int] = {}
+        self.suppressed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample_key", None)
+        if key is None:
+            return True
+        with self._lock:
+            count = self.seen.get(key, 0)
+            self.seen[key] = count + 1
+        if count % self.every == 0:
+            record.sample_rate = self.every
+            return True
+        self.suppressed += 1
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    A rekord formázás nélkül kerül a sorba (azt a listener szál végzi); tele sor esetén eldobjuk.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RedactingFormatter(logging.Formatter):
+    """
+    JSON soronként (`json_lines=True`) vagy olvasható szöveges formátum, a titkok kitakarásával.
+    """
+
+    def __init__(self, secrets: Iterable[str] = (), json_lines: bool = True):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(route)s] %(message)s")
+        # Hosszabb titok előbb, hogy egy rövidebb részsztring ne takarja ki félig
+        self.secrets = sorted({secret for secret in secrets if secret}, key=len, reverse=True)
+        self.json_lines = json_lines
+
+    def redact(self, text: str) -> str:
+        for secret in self.secrets:
+            text = text.replace(secret, "***")
+        for pattern in _SECRET_PATTERNS:
+            text = pattern.sub(r"\1***", text)
+        return text
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "route"):
+            record.route = None
+        if not self.json_lines:
+            return self.redact(super().format(record))
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "route": record.route,
+            "msg": record.getMessage(),
+        }
+        sample_rate = getattr(record, "sample_rate", None)
+        if sample_rate is not None and sample_rate > 1:
+            entry["sample_rate"] = sample_rate
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return self.redact(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+class LoggingSetup:
+    """
+    A beállított naplózás részei (a /metrics számlálóihoz és a leállításhoz).
+    """
+
+    def __init__(self, handler: NonBlockingQueueHandler, sampler: SamplingFilter, listener: QueueListener):
+        self.handler = handler
+        self.sampler = sampler
+        self.listener = listener
+        self._stopped = False
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.handler.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampler.suppressed,
+        }
+
+    def stop(self) -> None:
+        # A sorban maradt rekordok még kiíródnak
+        if not self._stopped:
+            self._stopped = True
+            self.listener.stop()
+
+
+def setup_logging(
+    level: str = "INFO",
+    route_levels: str = "",
+    sample_every: int = 100,
+    queue_size: int = 10000,
+    json_lines: bool = True,
+    secrets: Iterable[str] = (),
+    stream=None,
+) -> LoggingSetup:
+    """
+    A "huniexport" loggerek beállítása: útvonalankénti szint, mintavétel, háttérszálas kiírás.
+    """
+    default_level = logging.getLevelName(level.upper())
+    if not isinstance(default_level, int):
+        default_level = logging.INFO
+    levels = parse_route_levels(route_levels)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(RouteLevelFilter(default_level, levels))
+    sampler = SamplingFilter(sample_every)
+    handler.addFilter(sampler)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(RedactingFormatter(secrets, json_lines=json_lines))
+    listener = QueueListener(log_queue, output)
+    listener.start()
+
+    root = logging.getLogger(ROOT_LOGGER)
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    # A logger szintje a legalacsonyabb beállított szint; a pontos döntés a RouteLevelFilter-ben
+    root.setLevel(min([default_level, *levels.values()]))
+    root.propagate = False
+
+    setup = LoggingSetup(handler, sampler, listener)
+    atexit.register(setup.stop)
+    return setup
@@ -0,0 +1,246 @@
+"""
+Helyi, az Adalo collections API-t (és a MailerSend bulk email végpontot) utánzó szerver a
+benchmarkokhoz. N szintetikus userrel, tranzakcióval, kuponnal és üres statisztika
+collection-nel indul; a collection azonosító maga a collection neve (users, transactions,
+coupons, stats), így az appot ezekkel az ID-kkel kell indítani.
+
+Beállítható a válaszidő (+ véletlen szórás), az API által érvényesített maximális oldalméret
+és a 429-es válaszok aránya (Retry-After fejléccel).
+
+A /__stats végpont a kiszolgált hívások számát adja típusonként, a /__reset újra feltölti az
+adatokat és nullázza a számlálókat.
+
+Indítás: python benchmarks/fake_adalo.py --port 8100 --records 10000 --latency-ms 20
+"""
+import argparse
+import asyncio
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+COLLECTIONS = ("users", "transactions", "coupons", "stats")
+
+
+def _timestamp(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def seed_data(
+    records: int,
+    partners: int = 10,
+    coupons: int = 50,
+    heavy_user_transactions: int = 50,
+    seed: int = 42,
+) -> Dict[str, Dict[int, dict]]:
+    """
+    `records` user és `records` tranzakció, determinisztikusan. Az 1-es user (a /deleteuser
+    benchmark célpontja) `heavy_user_transactions` tranzakcióval rendelkezik, a többi tranzakció
+    egyenletesen oszlik el a userek és a `partners` partner között.
+    """
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    now = datetime.now(timezone.utc)
+
+    coupon_records = {i: {"id": i, "coupon_name": f"Kupon {i}"} for i in range(1, coupons + 1)}
+
+    transactions: Dict[int, dict] = {}
+    owners: Dict[int, list] = {}
+    for i in range(1, records + 1):
+        user_id = 1 if i <= heavy_user_transactions else rng.randint(1, records)
+        owners.setdefault(user_id, []).append(i)
+        updated = start + timedelta(minutes=rng.randint(0, 60 * 24 * 600))
+        transactions[i] = {
+            "id": i,
+            "transaction_id": f"T{i}",
+            "transaction_status": "finalized" if rng.random() < 0.9 else "pending",
+            "partner_transaction": [rng.randint(1, partners)],
+            "user_transaction": [user_id],
+            "coupon_transaction": [rng.randint(1, coupons)] if rng.random() < 0.6 else [],
+            "spend_value": rng.randint(500, 50000),
+            "discount_value": rng.choice([5, 10, 15, 20]),
+            "saved_value": rng.randint(50, 5000),
+            "hunicoin_value": rng.randint(0, 100),
+            "jutalek_value": rng.randint(10, 1000),
+            "created_at": _timestamp(updated),
+            "updated_at": _timestamp(updated),
+        }
+
+    users: Dict[int, dict] = {}
+    for i in range(1, records + 1):
+        created = start + timedelta(minutes=rng.randint(0, 60 * 24 * 600))
+        wants_delete = rng.random() < 0.01
+        users[i] = {
+            "id": i,
+            "Email": f"user{i}@example.com" if rng.random() < 0.95 else "",
+            "Full Name": f"Teszt User {i}",
+            "nickname": f"user{i}",
+            "created_at": _timestamp(created),
+            "updated_at": _timestamp(created),
+            "registration_date": _timestamp(created),
+            "verified_time": _timestamp(created),
+            "hunidate": _timestamp(created),
+            "student_verified": rng.random() < 0.5,
+            "subscribedtonews": rng.random() < 0.3,
+            "latestnotivisited": True,
+            "Admin?": False,
+            "total_hunicoins": rng.randint(0, 1000),
+            "wantsto_delete": _timestamp(now - timedelta(days=rng.randint(31, 90))) if wants_delete else None,
+            "transactions_user": owners.get(i, []),
+            "liked_partners": [rng.randint(1, partners)],
+            "text_home": "Home",
+        }
+
+    return {"users": users, "transactions": transactions, "coupons": coupon_records, "stats": {}}
+
+
+def create_app(
+    records: int,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    page_size: int = 100,
+    throttle_rate: float = 0.0,
+    retry_after: float = 0.0,
+    seed: int = 42,
+) -> FastAPI:
+    app = FastAPI(title="Fake Adalo")
+    state = {"data": seed_data(records, seed=seed), "calls": Counter(), "next_id": {}}
+    rng = random.Random(seed)
+
+    def reset() -> None:
+        state["data"] = seed_data(records, seed=seed)
+        state["calls"] = Counter()
+        state["next_id"] = {}
+
+    async def upstream(kind: str) -> Optional[Response]:
+        """
+        Késleltetés és 429 injektálás; a hívás típusa a számlálóba kerül.
+        """
+        if latency or jitter:
+            await asyncio.sleep(latency + rng.uniform(0, jitter))
+        if throttle_rate and rng.random() < throttle_rate:
+            state["calls"]["throttled"] += 1
+            return JSONResponse({"error": "Too Many Requests"}, status_code=429, headers={"Retry-After": f"{retry_after:g}"})
+        state["calls"][kind] += 1
+        return None
+
+    def collection(collection_id: str) -> Optional[Dict[int, dict]]:
+        return state["data"].get(collection_id)
+
+    def not_found() -> JSONResponse:
+        return JSONResponse({"error": "Record not found"}, status_code=404)
+
+    @app.get("/__stats")
+    async def stats():
+        return dict(state["calls"])
+
+    @app.post("/__reset")
+    async def reset_data():
+        reset()
+        return {"records": records}
+
+    @app.get("/v0/apps/{app_id}/users")
+    async def list_users(app_id: str, offset: int = 0, limit: int = 100):
+        return await list_records(app_id, "users", offset, limit)
+
+    @app.get("/v0/apps/{app_id}/collections/{collection_id}")
+    async def list_records(app_id: str, collection_id: str, offset: int = 0, limit: int = 100):
+        throttled = await upstream("list_page")
+        if throttled is not None:
+            return throttled
+        items = collection(collection_id)
+        if items is None:
+            return not_found()
+        # Az Adalo a kértnél kisebb oldalméretet is érvényesíthet
+        limit = max(0, min(limit, page_size))
+        page = list(items.values())[offset:offset + limit]
+        return {"records": page, "offset": offset + len(page)}
+
+    @app.get("/v0/apps/{app_id}/collections/{collection_id}/{record_id}")
+    async def get_record(app_id: str, collection_id: str, record_id: int):
+        throttled = await upstream("get")
+        if throttled is not None:
+            return throttled
+        record = (collection(collection_id) or {}).get(record_id)
+        return record if record is not None else not_found()
+
+    @app.put("/v0/apps/{app_id}/collections/{collection_id}/{record_id}")
+    async def update_record(app_id: str, collection_id: str, record_id: int, request: Request):
+        throttled = await upstream("put")
+        if throttled is not None:
+            return throttled
+        record = (collection(collection_id) or {}).get(record_id)
+        if record is None:
+            return not_found()
+        record.update(await request.json())
+        record["id"] = record_id
+        return record
+
+    @app.post("/v0/apps/{app_id}/collections/{collection_id}")
+    async def create_record(app_id: str, collection_id: str, request: Request):
+        throttled = await upstream("post")
+        if throttled is not None:
+            return throttled
+        items = collection(collection_id)
+        if items is None:
+            return not_found()
+        record_id = state["next_id"].get(collection_id) or max(items, default=0) + 1
+        state["next_id"][collection_id] = record_id + 1
+        record = await request.json()
+        record["id"] = record_id
+        items[record_id] = record
+        return JSONResponse(record, status_code=201)
+
+    @app.delete("/v0/apps/{app_id}/collections/{collection_id}/{record_id}")
+    async def delete_record(app_id: str, collection_id: str, record_id: int):
+        throttled = await upstream("delete")
+        if throttled is not None:
+            return throttled
+        items = collection(collection_id) or {}
+        if items.pop(record_id, None) is None:
+            return not_found()
+        return Response(status_code=204)
+
+    @app.post("/v1/bulk-email")
+    async def bulk_email(request: Request):
+        throttled = await upstream("mailersend_bulk")
+        if throttled is not None:
+            return throttled
+        emails = await request.json()
+        state["calls"]["emails"] += len(emails)
+        return JSONResponse({"message": "The bulk email is being processed.", "id": f"bulk{state['calls']['mailersend_bulk']}"}, status_code=202)
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Helyi Adalo (és MailerSend) utánzat benchmarkokhoz")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--records", type=int, default=1000, help="userek és tranzakciók száma")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="minden válasz előtti késleltetés")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="véletlen többlet késleltetés (0..jitter)")
+    parser.add_argument("--page-size", type=int, default=100, help="az API által érvényesített maximális oldalméret")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="a 429-cel megválaszolt kérések aránya (0..1)")
+    parser.add_argument("--retry-after", type=float, default=0.0, help="a 429 válaszok Retry-After értéke (mp)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app(
+        args.records,
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        page_size=args.page_size,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Mikro-benchmarkok az export CPU-igényes, hálózat nélküli lépéseire, regressziós küszöbbel.
+
+Esetek (mind az app saját függvényeit hívja, szintetikus rekordokon, növekvő méretben):
+    filter-transactions  partner / státusz / dátum szűrés (select_partner_transactions)
+    filter-users         email / dátum szűrés (select_users_created_between)
+    coupon-join          coupon_name hozzáadása (add_coupon_names)
+    columns              oszlop-kiválasztás és átnevezés (present_columns + fejlécek)
+    date-format          dátum formázás 'YYYY-MM-DD HH:MM'-re (table_rows, date_columns)
+    bool-format          Igen/Nem formázás (table_rows, bool_columns)
+    xlsx-write           XLSX írás előre elkészített sorokból (iter_xlsx)
+    export-pipeline      a teljes tranzakció export (szűrés, join, sorok, render_export)
+
+Minden eset legalább `--repeat`-szer fut (szemétgyűjtő nélkül), a mérvadó érték a
+legjobb (min) idő. Ha a baseline más gépen készült, a --normalize a nyers idők helyett egy
+rögzített, tisztán Python kalibrációs ciklus idejéhez viszonyított időket hasonlítja (ez maga is
+zajos, ezért nem alapértelmezett).
+
+    python benchmarks/micro.py                    # futtatás és ellenőrzés a baseline ellen
+    python benchmarks/micro.py --save-baseline    # a baseline (benchmarks/micro_baseline.json) frissítése
+
+Ha valamelyik eset a küszöbnél (alapból 30%) lassabb a baseline-nál, egyszer újramérődik; ha
+utána is lassabb, a kimenet REGRESSZIÓ sorokat ír, és a folyamat 1-es kóddal lép ki.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, NamedTuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Az app importja ne naplózzon (a szűrés figyelmeztetései sem érdekesek itt)
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from app import add_coupon_names, select_partner_transactions, select_users_created_between  # noqa: E402
+from exports import iter_xlsx, present_columns, render_export, table_rows  # noqa: E402
+from fake_adalo import seed_data  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "micro_baseline.json")
+
+PARTNER_ID = 1
+FROM_DATETIME = datetime(2024, 3, 1, tzinfo=timezone.utc)
+TO_DATETIME = datetime(2025, 3, 1, tzinfo=timezone.utc)
+
+TRANSACTION_COLUMNS = [
+    "id", "transaction_status", "user_transaction", "partner_transaction", "coupon_transaction", "coupon_name",
+    "spend_value", "discount_value", "saved_value", "hunicoin_value", "jutalek_value", "updated_at",
+]
+USER_DATE_COLUMNS = ["created_at", "updated_at", "registration_date", "verified_time", "hunidate"]
+USER_BOOL_COLUMNS = ["student_verified", "subscribedtonews", "latestnotivisited", "Admin?"]
+
+
+class Case(NamedTuple):
+    name: str
+    # Adatok -> a mérendő (argumentum nélküli) hívás; az előkészítés nem számít bele az időbe
+    prepare: Callable[[dict], Callable[[], object]]
+
+
+def _filter_transactions(data: dict) -> Callable[[], object]:
+    transactions = list(data["transactions"].values())
+    return lambda: select_partner_transactions(transactions, PARTNER_ID, FROM_DATETIME, TO_DATETIME)
+
+
+def _filter_users(data: dict) -> Callable[[], object]:
+    users = list(data["users"].values())
+    return lambda: select_users_created_between(users, "Email", FROM_DATETIME, TO_DATETIME)
+
+
+def _coupon_names(data: dict) -> dict:
+    return {coupon["id"]: coupon["coupon_name"] for coupon in data["coupons"].values()}
+
+
+def _coupon_join(data: dict) -> Callable[[], object]:
+    # A join felülírja a coupon_name mezőt, így ugyanaz a lista ismételten mérhető
+    transactions = list(data["transactions"].values())
+    coupons = _coupon_names(data)
+    return lambda: add_coupon_names(transactions, coupons)
+
+
+def _columns(data: dict) -> Callable[[], object]:
+    users = list(data["users"].values())
+    # A hiányzó oszlop miatt a present_columns a teljes listát végigjárja (a legrosszabb eset)
+    mapping = {column: column.replace("_", " ").capitalize() for column in [*users[0], "opened_noticoupon"]}
+
+    def run():
+        existing = present_columns(users, list(mapping))
+        return [mapping[column] for column in existing]
+    return run
+
+
+def _date_format(data: dict) -> Callable[[], object]:
+    users = list(data["users"].values())
+    return lambda: sum(1 for _ in table_rows(users, USER_DATE_COLUMNS, date_columns=USER_DATE_COLUMNS))
+
+
+def _bool_format(data: dict) -> Callable[[], object]:
+    users = list(data["users"].values())
+    return lambda: sum(1 for _ in table_rows(users, USER_BOOL_COLUMNS, bool_columns=USER_BOOL_COLUMNS))
+
+
+def _xlsx_write(data: dict) -> Callable[[], object]:
+    transactions = list(data["transactions"].values())
+    add_coupon_names(transactions, _coupon_names(data))
+    rows = list(table_rows(transactions, TRANSACTION_COLUMNS, date_columns=["updated_at"]))
+    return lambda: sum(len(chunk) for chunk in iter_xlsx(TRANSACTION_COLUMNS, rows))
+
+
+def _export_pipeline(data: dict) -> Callable[[], object]:
+    # Minden partner tranzakciói (a partner szűrés nélkül a join és az írás a teljes méreten fut)
+    transactions = [dict(record, partner_transaction=[PARTNER_ID]) for record in data["transactions"].values()]
+    coupons = _coupon_names(data)
+
+    def run():
+        selected = select_partner_transactions(transactions, PARTNER_ID, FROM_DATETIME, TO_DATETIME)
+        add_coupon_names(selected, coupons)
+        columns = present_columns(selected, TRANSACTION_COLUMNS)
+        rows = table_rows(selected, columns, date_columns=["updated_at"])
+        return len(render_export("xlsx", columns, rows))
+    return run
+
+
+CASES = [
+    Case("filter-transactions", _filter_transactions),
+    Case("filter-users", _filter_users),
+    Case("coupon-join", _coupon_join),
+    Case("columns", _columns),
+    Case("date-format", _date_format),
+    Case("bool-format", _bool_format),
+    Case("xlsx-write", _xlsx_write),
+    Case("export-pipeline", _export_pipeline),
+]
+
+
+def measure(run: Callable[[], object], repeat: int, min_total: float = 1.0, max_repeat: int = 100) -> List[float]:
+    """
+    Legalább `repeat` mérés, rövid esetnél addig, amíg az összidő eléri a `min_total` másodpercet.
+    A mérés alatt a szemétgyűjtő ki van kapcsolva (mint a timeit-nél), mert a nagy rekordlisták
+    miatt egy-egy gyűjtés véletlenszerűen torzítaná az időket.
+    """
+    run()  # bemelegítés
+    timings: List[float] = []
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while len(timings) < repeat or (sum(timings) < min_total and len(timings) < max_repeat):
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return timings
+
+
+def calibrate(repeat: int) -> float:
+    """
+    Egy rögzített, tisztán Python munka legjobb ideje (ms): a gép sebességének mércéje.
+    """
+    def work():
+        rows = [{"id": i, "value": str(i)} for i in range(200000)]
+        return sum(len(row["value"]) for row in rows if row["id"] % 3)
+    return min(measure(work, repeat)) * 1000
+
+
+def run_cases(cases: List[Case], sizes: List[int], repeat: int, results: Dict[str, dict]) -> None:
+    """
+    Az esetek mérése méretenként; egy már meglévő eredménynél (újramérés) a jobb idő marad.
+    """
+    for records in sizes:
+        data = seed_data(records)
+        for case in cases:
+            timings = measure(case.prepare(data), repeat)
+            best = min(timings)
+            key = f"{case.name}@{records}"
+            print(f"{key:<28} min {best * 1000:>10.1f} ms  median {statistics.median(timings) * 1000:>10.1f} ms"
+                  f"  {best * 1e6 / records:>8.2f} µs/rekord")
+            previous = results.get(key)
+            if previous is not None and previous["min_ms"] <= best * 1000:
+                continue
+            results[key] = {
+                "records": records,
+                "min_ms": round(best * 1000, 3),
+                "median_ms": round(statistics.median(timings) * 1000, 3),
+                "us_per_record": round(best * 1e6 / records, 3),
+            }
+
+
+def check(baseline: dict, current: dict, threshold: float, min_ms: float, normalize: bool = False) -> Dict[str, str]:
+    """
+    A baseline-nál a küszöbnél lassabb esetek (`normalize` esetén a kalibrációhoz viszonyítva).
+    A `min_ms` alatti különbség zajnak számít.
+    """
+    scale = current["meta"]["calibration_ms"] / baseline["meta"]["calibration_ms"] if normalize else 1.0
+    regressions: Dict[str, str] = {}
+    for key, result in current["results"].items():
+        before = baseline["results"].get(key)
+        if before is None:
+            continue
+        expected = before["min_ms"] * scale
+        if result["min_ms"] > expected * (1 + threshold) and result["min_ms"] - expected > min_ms:
+            regressions[key] = (
+                f"REGRESSZIÓ {key}: {result['min_ms']:.1f} ms, a baseline {expected:.1f} ms "
+                f"({(result['min_ms'] / expected - 1) * 100:+.0f}%, küszöb +{threshold * 100:.0f}%)"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export mikro-benchmarkok regressziós küszöbbel")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="rekordszámok vesszővel elválasztva")
+    parser.add_argument("--cases", default=",".join(case.name for case in CASES), help="esetek vesszővel elválasztva")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="az eredmény legyen az új baseline")
+    parser.add_argument("--threshold", type=float, default=0.3, help="megengedett lassulás aránya (0.3 = 30%%)")
+    parser.add_argument("--min-ms", type=float, default=2.0, help="ennél kisebb lassulás nem számít regressziónak")
+    parser.add_argument("--normalize", action="store_true", help="a kalibrációhoz viszonyított összevetés (más gépen készült baseline)")
+    parser.add_argument("--output", help="az eredmény mentése ide is (JSON)")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    selected = {name.strip() for name in args.cases.split(",") if name.strip()}
+    unknown = selected - {case.name for case in CASES}
+    if unknown:
+        parser.error(f"ismeretlen eset: {', '.join(sorted(unknown))}")
+    cases = [case for case in CASES if case.name in selected]
+
+    calibration = calibrate(args.repeat)
+    print(f"Kalibráció: {calibration:.1f} ms")
+    results: Dict[str, dict] = {}
+    run_cases(cases, sizes, args.repeat, results)
+
+    current = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "calibration_ms": round(calibration, 3),
+        },
+        "results": results,
+    }
+
+    def save(path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, sort_keys=True, ensure_ascii=False)
+            f.write("\n")
+
+    if args.save_baseline:
+        save(args.baseline)
+        print(f"Baseline mentve: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"Nincs baseline ({args.baseline}); létrehozás: --save-baseline", file=sys.stderr)
+        sys.exit(2)
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = check(baseline, current, args.threshold, args.min_ms, normalize=args.normalize)
+    if regressions:
+        # Egy zajos mérés ne buktassa el a futást: a gyanús esetek még egyszer lefutnak
+        print(f"\nÚjramérés (küszöb feletti): {', '.join(sorted(regressions))}")
+        for key in sorted(regressions):
+            name, records = key.rsplit("@", 1)
+            run_cases([case for case in cases if case.name == name], [int(records)], args.repeat, results)
+        regressions = check(baseline, current, args.threshold, args.min_ms, normalize=args.normalize)
+    if args.output:
+        save(args.output)
+
+    missing = sorted(set(results) - set(baseline["results"]))
+    if missing:
+        print(f"Nincs baseline érték: {', '.join(missing)}")
+    if regressions:
+        print("\n" + "\n".join(regressions[key] for key in sorted(regressions)), file=sys.stderr)
+        sys.exit(1)
+    print(f"\nNincs regresszió a baseline-hoz képest (küszöb +{args.threshold * 100:.0f}%).")
+
+
+if __name__ == "__main__":
+    main()
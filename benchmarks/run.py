@@ -0,0 +1,298 @@
+"""
+End-to-end benchmark: az app a helyi Adalo utánzat (fake_adalo.py) ellen fut, és minden
+végpont minden adatméreten (alapból 1k / 10k / 100k rekord) `--iterations`-szor hívódik.
+
+Mért értékek végpontonként és méretenként: válaszidő (első, medián, p95, max), áteresztőképesség
+(kérés/mp és rekord/mp a medián alapján), kérésenkénti upstream hívások típusonként (a fake
+szerver számlálóiból), 429 válaszok, válaszméret és az app folyamat csúcs memóriája (VmHWM).
+
+Minden végpont külön app folyamatban fut (így a csúcs memória végpontonként mérhető), a
+módosító végpontok előtt a fake adatai minden iterációnál visszaállnak. Az eredmény egy
+rendezett kulcsú JSON fájl, ami verziók között diffelhető; --compare egy korábbi eredményhez
+viszonyít.
+
+Példa:
+    python benchmarks/run.py --sizes 1000,10000 --latency-ms 20 --output benchmarks/results/main.json
+    python benchmarks/run.py --compare benchmarks/results/main.json
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_SERVER = os.path.join(ROOT, "benchmarks", "fake_adalo.py")
+
+# A fake szerver collection azonosítói (a collection neve)
+COLLECTION_ENV = {
+    "ADALO_USERS_COLLECTION_ID": "users",
+    "ADALO_TRANSACTIONS_COLLECTION_ID": "transactions",
+    "ADALO_COUPONS_COLLECTION_ID": "coupons",
+    "ADALO_STATS_COLLECTION_ID": "stats",
+}
+
+
+class Endpoint(NamedTuple):
+    name: str
+    method: str
+    path: str
+    body: Optional[dict] = None
+    # Módosítja a fake adatait: minden iteráció előtt visszaállítjuk
+    mutating: bool = False
+
+
+ENDPOINTS = [
+    Endpoint("download-transactions", "GET", "/download-transactions/1"),
+    Endpoint("download-users-collection", "GET", "/download-users-collection"),
+    Endpoint("get-partner-transactions", "POST", "/get-partner-transactions", {"partner_id": 1}),
+    Endpoint("notifalse", "GET", "/notifalse", mutating=True),
+    Endpoint("deleteuser", "GET", "/deleteuser/1", mutating=True),
+    Endpoint("sendmails", "POST", "/sendmails", {"template_id": "bench", "subject": "Benchmark"}),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"A folyamat kilépett indulás közben ({process.args})")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nem indult el időben: {url}")
+
+
+def stop(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    # Linuxon a folyamat eddigi csúcs rezidens memóriája; máshol nem mérjük
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def start_fake(args, records: int) -> (subprocess.Popen, str):
+    port = free_port()
+    command = [
+        sys.executable, FAKE_SERVER, "--port", str(port), "--records", str(records),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--page-size", str(args.page_size), "--throttle-rate", str(args.throttle_rate),
+        "--retry-after", str(args.retry_after),
+    ]
+    process = subprocess.Popen(command, cwd=ROOT)
+    base = f"http://127.0.0.1:{port}"
+    wait_until_ready(f"{base}/__stats", process, timeout=300)
+    return process, base
+
+
+def start_app(args, fake_base: str, workdir: str) -> (subprocess.Popen, str):
+    port = free_port()
+    env = dict(os.environ)
+    env.update(COLLECTION_ENV)
+    env.update({
+        "ADALO_API_BASE": f"{fake_base}/v0",
+        "MAILERSEND_BULK_URL": f"{fake_base}/v1/bulk-email",
+        "ADALO_PAGE_SIZE": str(args.page_size),
+        "TRANSACTIONS_REPLICA_ENABLED": "1" if args.replica else "0",
+        "TRANSACTIONS_REPLICA_PATH": os.path.join(workdir, "replica.sqlite3"),
+        "EXPORT_JOBS_DIR": os.path.join(workdir, "export_jobs"),
+        "MUTATION_JOBS_PATH": os.path.join(workdir, "mutation_jobs.sqlite3"),
+        "LOG_LEVEL": args.log_level,
+    })
+    command = [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL if args.quiet else None)
+    base = f"http://127.0.0.1:{port}"
+    wait_until_ready(f"{base}/ping", process)
+    return process, base
+
+
+def upstream_delta(before: Dict[str, int], after: Dict[str, int]) -> Dict[str, int]:
+    return {kind: after.get(kind, 0) - before.get(kind, 0) for kind in sorted(set(before) | set(after)) if after.get(kind, 0) != before.get(kind, 0)}
+
+
+def bench_endpoint(args, endpoint: Endpoint, records: int, fake_base: str, log: Callable[[str], None]) -> dict:
+    with tempfile.TemporaryDirectory(prefix="huniexport-bench-") as workdir:
+        httpx.post(f"{fake_base}/__reset", timeout=300)
+        app, app_base = start_app(args, fake_base, workdir)
+        latencies: List[float] = []
+        upstream: List[Dict[str, int]] = []
+        statuses: List[int] = []
+        sizes: List[int] = []
+        try:
+            with httpx.Client(base_url=app_base, timeout=args.timeout) as client:
+                for iteration in range(args.iterations):
+                    if endpoint.mutating and iteration > 0:
+                        httpx.post(f"{fake_base}/__reset", timeout=300)
+                    before = httpx.get(f"{fake_base}/__stats").json()
+                    started = time.perf_counter()
+                    response = client.request(endpoint.method, endpoint.path, json=endpoint.body)
+                    elapsed = time.perf_counter() - started
+                    after = httpx.get(f"{fake_base}/__stats").json()
+                    latencies.append(elapsed)
+                    upstream.append(upstream_delta(before, after))
+                    statuses.append(response.status_code)
+                    sizes.append(len(response.content))
+                    log(f"  {endpoint.name} @ {records}: #{iteration + 1} {response.status_code} {elapsed * 1000:.0f} ms")
+            rss = peak_rss_mb(app.pid)
+        finally:
+            stop(app)
+
+    median = statistics.median(latencies)
+    kinds = sorted({kind for calls in upstream for kind in calls})
+    return {
+        "records": records,
+        "iterations": len(latencies),
+        "status_codes": sorted(set(statuses)),
+        "latency_ms": {
+            "first": round(latencies[0] * 1000, 1),
+            "median": round(median * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1),
+        },
+        "throughput": {
+            "requests_per_second": round(1 / median, 2) if median else None,
+            "records_per_second": round(records / median, 1) if median else None,
+        },
+        # Kérésenkénti medián, típusonként (list_page, get, put, post, delete, mailersend_bulk, throttled, emails)
+        "upstream_calls": {kind: statistics.median(calls.get(kind, 0) for calls in upstream) for kind in kinds},
+        "response_bytes": int(statistics.median(sizes)),
+        "peak_rss_mb": rss,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: dict, new: dict) -> List[str]:
+    """
+    Eltérések egy korábbi eredményhez képest (medián válaszidő, upstream hívások, csúcs memória).
+    """
+    lines = []
+    for key in sorted(set(old["results"]) & set(new["results"])):
+        before, after = old["results"][key], new["results"][key]
+        old_ms, new_ms = before["latency_ms"]["median"], after["latency_ms"]["median"]
+        change = (new_ms - old_ms) / old_ms * 100 if old_ms else 0.0
+        old_calls, new_calls = sum(before["upstream_calls"].values()), sum(after["upstream_calls"].values())
+        lines.append(
+            f"{key:<40} {old_ms:>10.1f} -> {new_ms:>10.1f} ms ({change:+6.1f}%)"
+            f"  upstream {old_calls:g} -> {new_calls:g}  rss {before['peak_rss_mb']} -> {after['peak_rss_mb']} MB"
+        )
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Huniexport end-to-end benchmark a helyi Adalo utánzat ellen")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="rekordszámok vesszővel elválasztva")
+    parser.add_argument("--endpoints", default=",".join(endpoint.name for endpoint in ENDPOINTS), help="végpontok vesszővel elválasztva")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.0)
+    parser.add_argument("--replica", action="store_true", help="a tranzakció replika bekapcsolása (alapból ki)")
+    parser.add_argument("--timeout", type=float, default=1800.0, help="egy kérés maximális ideje (mp)")
+    parser.add_argument("--log-level", default="WARNING", help="az app LOG_LEVEL értéke")
+    parser.add_argument("--output", help="eredmény fájl (alapból benchmarks/results/<git revízió>.json)")
+    parser.add_argument("--compare", help="korábbi eredmény fájl, amihez az új eredményt viszonyítjuk")
+    parser.add_argument("--quiet", action="store_true", help="az app kimenetének elnyelése")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    selected = {name.strip() for name in args.endpoints.split(",") if name.strip()}
+    unknown = selected - {endpoint.name for endpoint in ENDPOINTS}
+    if unknown:
+        parser.error(f"ismeretlen végpont: {', '.join(sorted(unknown))}")
+    endpoints = [endpoint for endpoint in ENDPOINTS if endpoint.name in selected]
+
+    def log(message: str) -> None:
+        print(message, file=sys.stderr, flush=True)
+
+    revision = git_revision()
+    results: Dict[str, dict] = {}
+    for records in sizes:
+        log(f"Fake Adalo indítása {records} rekorddal...")
+        fake, fake_base = start_fake(args, records)
+        try:
+            for endpoint in endpoints:
+                results[f"{endpoint.name}@{records}"] = bench_endpoint(args, endpoint, records, fake_base, log)
+        finally:
+            stop(fake)
+
+    output = {
+        "meta": {
+            "revision": revision,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "page_size": args.page_size,
+            "throttle_rate": args.throttle_rate,
+            "replica": args.replica,
+        },
+        "results": results,
+    }
+    path = args.output or os.path.join(ROOT, "benchmarks", "results", f"{revision or 'latest'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write("\n")
+    log(f"Eredmény: {path}")
+
+    for key, result in results.items():
+        print(
+            f"{key:<40} median {result['latency_ms']['median']:>10.1f} ms  p95 {result['latency_ms']['p95']:>10.1f} ms"
+            f"  {result['throughput']['records_per_second']} rekord/mp  upstream {result['upstream_calls']}  rss {result['peak_rss_mb']} MB"
+        )
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        print(f"\nÖsszehasonlítás: {args.compare} ({previous['meta'].get('revision')}) -> {revision}")
+        for line in compare(previous, output):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
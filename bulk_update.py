@@ -0,0 +1,114 @@
+"""
+Tömeges mezőfrissítés Adalo rekordokon: a PUT törzs a listázásból már meglévő rekordból
+készül (nincs rekordonkénti GET), a már megfelelő rekordok kimaradnak, az írások pedig
+korlátozott párhuzamossággal futnak.
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Union
+
+import httpx
+
+from app_logging import get_logger
+from http_client import HttpClient
+from metrics import StageTimer, stage
+from write_buffer import WriteCoalescer
+
+log = get_logger("bulk_update")
+
+
+class BulkUpdateResult:
+    """
+    Egy tömeges frissítés eredménye és áteresztőképessége.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.updated = 0
+        self.skipped = 0
+        self.errors: List[dict] = []
+        self.started = time.perf_counter()
+        self.duration = 0.0
+
+    def to_dict(self) -> dict:
+        writes = self.updated + len(self.errors)
+        return {
+            "total": self.total,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "failed": len(self.errors),
+            "duration_seconds": round(self.duration, 3),
+            "records_per_second": round(self.total / self.duration, 1) if self.duration else None,
+            "writes_per_second": round(writes / self.duration, 1) if self.duration else None,
+        }
+
+
+async def bulk_update(
+    client: Union[HttpClient, WriteCoalescer],
+    records: AsyncIterator[Any],
+    record_url: Callable[[Any], str],
+    headers: Dict[str, str],
+    build_payload: Callable[[dict], Optional[dict]],
+    concurrency: int = 10,
+    progress_every: int = 50,
+    on_result: Optional[Callable[[Any, Optional[dict]], None]] = None,
+) -> BulkUpdateResult:
+    """
+    Minden rekordra meghívja a `build_payload`-ot; ha az None-t ad vissza, a rekord kimarad
+    (pl. a cél mező már a kívánt értéken áll), különben PUT-tal elküldi a `record_url(id)` címre.
+    Egyszerre legfeljebb `concurrency` írás fut; a hibás írások a result.errors-ba kerülnek.
+    Az `on_result` (ha meg van adva) minden írás után meghívódik: (id, None) siker, (id, hiba) hiba esetén
+    (pl. job checkpointhoz).
+    A rekordokra várakozás a kérés "fetch", a szabad írási helyre és a futó írásokra várakozás
+    a "write" szakaszidejébe számít.
+    """
+    result = BulkUpdateResult()
+    pending: set = set()
+    limit = max(1, concurrency)
+
+    def failed(record_id: Any, error: dict) -> None:
+        result.errors.append(error)
+        if on_result is not None:
+            on_result(record_id, error)
+
+    async def put(record_id: Any, payload: dict) -> None:
+        try:
+            response = await client.put(record_url(record_id), headers=headers, json=payload)
+        except httpx.HTTPError as e:
+            failed(record_id, {"user_id": record_id, "status": None, "body": str(e), "step": "put", "sent": payload})
+            return
+        if response.status_code in [200, 201]:
+            result.updated += 1
+            if on_result is not None:
+                on_result(record_id, None)
+            if result.updated % progress_every == 0:
+                log.debug("Frissítve: %s", result.updated)
+        else:
+            failed(record_id, {"user_id": record_id, "status": response.status_code, "body": response.text, "step": "put", "sent": payload})
+
+    try:
+        async for record in StageTimer("fetch").aiterate(records):
+            result.total += 1
+            if not isinstance(record, dict) or record.get("id") is None:
+                continue
+            payload = build_payload(record)
+            if payload is None:
+                result.skipped += 1
+                continue
+            if len(pending) >= limit:
+                with stage("write"):
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+            pending.add(asyncio.create_task(put(record["id"], payload)))
+        if pending:
+            with stage("write"):
+                await asyncio.gather(*pending)
+    finally:
+        # Hiba vagy megszakítás esetén a még futó írásokat leállítjuk
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        result.duration = time.perf_counter() - result.started
+    return result
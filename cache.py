@@ -0,0 +1,317 @@
+"""
+Folyamaton belüli cache-ek az Adalo-ból lekért, ritkán változó adatokhoz és az ezekből
+előállított válaszokhoz.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Generic, Hashable, NamedTuple, Optional, Tuple, TypeVar
+
+from app_logging import get_logger
+
+log = get_logger("cache")
+
+T = TypeVar("T")
+
+
+class RefreshingValue(Generic[T]):
+    """
+    Egyetlen érték (pl. kupon id -> név szótár) TTL-lel és stale-while-revalidate frissítéssel.
+
+    - `ttl` másodpercig az érték friss, ilyenkor a get() azonnal visszaadja (hit).
+    - utána még `stale_ttl` másodpercig a régi értéket adja vissza, miközben a háttérben frissít.
+    - ha nincs használható érték, a get() megvárja a betöltést (miss); ha a betöltés hibázik,
+      de van bármilyen korábbi érték, azt adja vissza a hiba helyett.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[], Awaitable[T]],
+        ttl: float = 300.0,
+        stale_ttl: float = 86400.0,
+    ):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._value: Optional[T] = None
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+        self.last_error: Optional[str] = None
+        # Minden betöltésnél nő, amikor az érték ténylegesen megváltozik (cache kulcsokhoz)
+        self.version = 0
+
+    def age(self) -> Optional[float]:
+        return None if self._loaded_at is None else time.monotonic() - self._loaded_at
+
+    async def _load(self) -> T:
+        async with self._lock:
+            # Ha közben egy másik kérés már frissített, nem töltjük be újra
+            age = self.age()
+            if age is not None and age < self.ttl:
+                return self._value
+            try:
+                value = await self.loader()
+            except Exception as e:
+                self.refresh_errors += 1
+                self.last_error = str(e)
+                raise
+            if self._loaded_at is None or value != self._value:
+                self.version += 1
+            self._value = value
+            self._loaded_at = time.monotonic()
+            self.last_error = None
+            return value
+
+    async def _background_refresh(self) -> None:
+        try:
+            await self._load()
+        except Exception as e:
+            log.warning("Háttérfrissítés sikertelen (%s): %s", self.name, e)
+
+    async def get(self) -> T:
+        age = self.age()
+        if age is not None and age < self.ttl:
+            self.hits += 1
+            return self._value
+        if age is not None and age < self.ttl + self.stale_ttl:
+            self.stale_hits += 1
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self._background_refresh())
+            return self._value
+
+        self.misses += 1
+        try:
+            return await self._load()
+        except Exception:
+            if self._loaded_at is not None:
+                # Elavult, de még mindig jobb, mint a hiba
+                log.warning("Frissítés sikertelen (%s), a korábbi érték kerül felhasználásra", self.name)
+                return self._value
+            raise
+
+    def invalidate(self) -> None:
+        """
+        A következő get() friss betöltést végez; a régi érték csak hiba esetén kerül elő.
+        """
+        if self._loaded_at is not None:
+            self._loaded_at = time.monotonic() - self.ttl - self.stale_ttl
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        age = self.age()
+        return {
+            "name": self.name,
+            "ttl_seconds": self.ttl,
+            "stale_ttl_seconds": self.stale_ttl,
+            "age_seconds": round(age, 3) if age is not None else None,
+            "version": self.version,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else None,
+            "refresh_errors": self.refresh_errors,
+            "last_error": self.last_error,
+        }
+
+
+class CachedBody(NamedTuple):
+    body: bytes
+    etag: str
+    media_type: str
+    filename: str
+
+
+class ResponseCache:
+    """
+    Előállított (renderelt) válaszok LRU cache-e méretkorláttal: legfeljebb `max_entries`
+    bejegyzés és összesen `max_bytes` bájt; a legrégebben használt bejegyzés esik ki először.
+    A kulcsnak minden olyan adatot tartalmaznia kell (pl. adatverzió), amitől a tartalom függ.
+    """
+
+    def __init__(self, name: str, max_bytes: int = 64 * 1024 * 1024, max_entries: int = 256):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[CachedBody]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Hashable, body: bytes, media_type: str, filename: str) -> CachedBody:
+        """
+        Bejegyzés mentése erős ETag-gel (a tartalom hash-e); a korlátnál nagyobb tartalom nem kerül a cache-be.
+        """
+        entry = CachedBody(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', media_type, filename)
+        if len(body) > self.max_bytes:
+            return entry
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old.body)
+        self._entries[key] = entry
+        self.size += len(body)
+        while self._entries and (self.size > self.max_bytes or len(self._entries) > self.max_entries):
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted.body)
+            self.evictions += 1
+        return entry
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self._entries),
+            "size_bytes": self.size,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+
+class RecordCache:
+    """
+    Egyedi Adalo rekordok korlátos LRU cache-e (app, collection, id) kulcsokkal, `ttl`
+    másodperces élettartammal. Listázásból és egyedi lekérésből is feltöltődik, a saját
+    írásaink pedig felülírják vagy érvénytelenítik a bejegyzést.
+    A cache a betett rekord (sekély) másolatát tárolja, így a listázó hívó szabadon bővítheti a
+    saját példányát; a visszaadott rekordokat viszont a hívók nem módosíthatják.
+    """
+
+    def __init__(self, name: str, ttl: float = 60.0, max_entries: int = 20000):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(app_id: str, collection_id: str, record_id) -> Tuple[str, str, str]:
+        # Az id az URL-ből stringként, a rekordból számként érkezik
+        return (app_id, collection_id, str(record_id))
+
+    def get(self, app_id: str, collection_id: str, record_id) -> Optional[dict]:
+        key = self.key(app_id, collection_id, record_id)
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, app_id: str, collection_id: str, record: dict) -> None:
+        if not isinstance(record, dict) or record.get("id") is None or self.max_entries <= 0:
+            return
+        key = self.key(app_id, collection_id, record["id"])
+        self._entries[key] = (time.monotonic(), dict(record))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put_many(self, app_id: str, collection_id: str, records) -> None:
+        for record in records:
+            self.put(app_id, collection_id, record)
+
+    def invalidate(self, app_id: str, collection_id: str, record_id) -> None:
+        if self._entries.pop(self.key(app_id, collection_id, record_id), None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class FileBackedJSON:
+    """
+    Egy JSON fájl tartalma a memóriában. Csak akkor olvassa újra a lemezről, ha a fájl
+    módosítási ideje (vagy mérete) megváltozott, így a fájl szerkesztése újraindítás nélkül érvényesül.
+    Ha az újraolvasás hibás JSON-t talál, a korábbi tartalom marad használatban.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._value = None
+        self._signature: Optional[Tuple[int, int]] = None
+        self.loads = 0
+        self.last_error: Optional[str] = None
+
+    def get(self):
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature != self._signature:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._value = json.load(f)
+            except ValueError as e:
+                self.last_error = str(e)
+                if self._signature is None:
+                    raise
+                log.warning("Hibás JSON a(z) %s fájlban, a korábbi tartalom marad: %s", self.path, e)
+            else:
+                self.loads += 1
+                self.last_error = None
+            self._signature = signature
+        return self._value
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Match fejléc összevetése egy ETag-gel (gyenge összehasonlítás, ahogy a 304-hez az RFC 9110 előírja).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tag = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == tag:
+            return True
+    return False
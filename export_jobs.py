@@ -0,0 +1,231 @@
+"""
+Aszinkron export jobok: a hosszú exportok a kérés útvonalán kívül futnak, az eredmény
+lemezre kerül, és onnan (HTTP Range támogatással, folytatható módon) tölthető le.
+"""
+import asyncio
+import os
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from app_logging import get_logger
+from exports import EXPORT_FORMATS, ExportProgress, ExportTable, iter_export
+
+log = get_logger("export_jobs")
+
+# Egy job által előállított fájlok előtagja (indításkor csak ezeket takarítjuk el)
+_ARTIFACT_PREFIX = "export_job_"
+
+
+class _WriteCancelled(Exception):
+    """
+    A job leállt, miközben az író szál még dolgozott.
+    """
+
+
+class _WriteGuard:
+    """
+    Az író szál és a leállítás közötti jelzés: a lock miatt a végleges fájl átnevezése és a
+    leállítás nem fedhetik át egymást, így vagy nincs végleges fájl, vagy a leállítás törli.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancelled = False
+
+
+class ExportJob:
+    """
+    Egy export job állapota: queued -> running -> done / failed, a fájl lejárta után expired.
+    """
+
+    def __init__(self, kind: str, export_format: str, params: dict):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.format = export_format
+        self.params = params
+        self.status = "queued"
+        self.progress = ExportProgress()
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.error_status: Optional[int] = None
+        self.path: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.size: Optional[int] = None
+        self.expires_at: Optional[float] = None
+
+    @property
+    def media_type(self) -> str:
+        return EXPORT_FORMATS[self.format][1]
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "format": self.format,
+            "params": self.params,
+            "status": self.status,
+            "progress": self.progress.to_dict(),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "expires_at": self.expires_at,
+            "filename": self.filename,
+            "size": self.size,
+            "error": self.error,
+            "error_status": self.error_status,
+        }
+
+
+class ExportJobManager:
+    """
+    Export jobok ütemezése legfeljebb `max_workers` párhuzamos futással; a kész fájlok
+    `ttl` másodperc után törlődnek, a lejárt jobok adatai még egy `ttl`-ig lekérdezhetők.
+    """
+
+    def __init__(self, directory: str, max_workers: int = 2, ttl: float = 3600.0, sweep_interval: float = 60.0):
+        self.directory = directory
+        self.max_workers = max(1, max_workers)
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._jobs: Dict[str, ExportJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._workers = asyncio.Semaphore(self.max_workers)
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # Egy korábbi futás fájljaihoz már nem tartozik job, ezeket eltakarítjuk
+        for name in os.listdir(self.directory):
+            if name.startswith(_ARTIFACT_PREFIX):
+                self._remove_file(os.path.join(self.directory, name))
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        if self._sweeper is not None:
+            tasks.append(self._sweeper)
+            self._sweeper = None
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def submit(
+        self,
+        kind: str,
+        export_format: str,
+        params: dict,
+        build: Callable[[ExportProgress], Awaitable[ExportTable]],
+    ) -> ExportJob:
+        """
+        Új job felvétele; a `build` a job haladás-követőjével hívódik, és az export tartalmát adja vissza.
+        """
+        job = ExportJob(kind, export_format, params)
+        self._jobs[job.id] = job
+        task = asyncio.create_task(self._run(job, build))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        log.info("Export job felvéve: %s (%s, %s)", job.id, kind, export_format)
+        return job
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        return self._jobs.get(job_id)
+
+    async def _run(self, job: ExportJob, build: Callable[[ExportProgress], Awaitable[ExportTable]]) -> None:
+        async with self._workers:
+            job.status = "running"
+            job.started_at = time.time()
+            log.info("Export job indul: %s", job.id)
+            try:
+                table = await build(job.progress)
+                extension = EXPORT_FORMATS[job.format][0]
+                path = os.path.join(self.directory, f"{_ARTIFACT_PREFIX}{job.id}.{extension}")
+                # Az írás (és a sorok formázása) blokkoló, ezért külön szálon fut
+                guard = _WriteGuard()
+                try:
+                    job.size = await asyncio.to_thread(self._write, job, table, path, guard)
+                except asyncio.CancelledError:
+                    # A szál tovább fut: a következő chunk után abbahagyja és törli a részleges fájlt
+                    with guard.lock:
+                        guard.cancelled = True
+                    self._remove_file(path)
+                    raise
+                job.path = path
+                job.filename = f"{table.basename}.{extension}"
+                job.status = "done"
+                log.info("Export job kész: %s (%s sor, %s bájt)", job.id, job.progress.rows_written, job.size)
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "A job leállításra került"
+                raise
+            except HTTPException as e:
+                job.status = "failed"
+                job.error = str(e.detail)
+                job.error_status = e.status_code
+                log.warning("Export job sikertelen: %s (%s: %s)", job.id, e.status_code, e.detail)
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                job.error_status = 500
+                log.error("Export job sikertelen: %s (%s)", job.id, e)
+            finally:
+                job.finished_at = time.time()
+                job.expires_at = job.finished_at + self.ttl
+
+    def _write(self, job: ExportJob, table: ExportTable, path: str, guard: _WriteGuard) -> int:
+        # Ideiglenes fájlba írunk, így félkész fájl sosem tölthető le
+        partial = f"{path}.part"
+        try:
+            with open(partial, "wb") as f:
+                for chunk in iter_export(job.format, table.headers, job.progress.count_rows(table.rows)):
+                    if guard.cancelled:
+                        raise _WriteCancelled()
+                    f.write(chunk)
+            with guard.lock:
+                if guard.cancelled:
+                    raise _WriteCancelled()
+                os.replace(partial, path)
+        except BaseException:
+            self._remove_file(partial)
+            raise
+        return os.path.getsize(path)
+
+    def expire(self) -> None:
+        """
+        Lejárt fájlok törlése; a jobot még egy ttl-ig 'expired' állapotban megtartjuk, utána elfelejtjük.
+        """
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.expires_at is None or now < job.expires_at:
+                continue
+            if job.status != "expired":
+                if job.path:
+                    self._remove_file(job.path)
+                job.path = None
+                job.status = "expired"
+                log.info("Export job lejárt: %s", job_id)
+            elif now >= job.expires_at + self.ttl:
+                del self._jobs[job_id]
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.expire()
+            except Exception as e:
+                log.error("Export jobok takarítása sikertelen: %s", e)
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
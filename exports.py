@@ -0,0 +1,475 @@
+"""
+Export motor: rekordokból oszlop-kiválasztás, átnevezés, formázás és streamelt írás
+XLSX, CSV, NDJSON vagy Parquet formátumban.
+
+A fájl közvetlenül a válasz-streambe íródik (soronként, illetve Parquet esetén
+row group-onként), így nincs pandas DataFrame, nincs ideiglenes fájl, és a
+memóriahasználat nem nő a sorok számával.
+"""
+import csv
+import io
+import json
+import math
+import re
+import zipfile
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from fastapi.responses import Response, StreamingResponse
+
+from metrics import EXPORT_ROWS, StageTimer
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Formátum -> (fájl kiterjesztés, media type)
+EXPORT_FORMATS = {
+    "xlsx": ("xlsx", XLSX_MEDIA_TYPE),
+    "csv": ("csv", "text/csv; charset=utf-8"),
+    "ndjson": ("ndjson", "application/x-ndjson"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+# Parquet row group mérete (ennyi sor van egyszerre a memóriában)
+PARQUET_BATCH_SIZE = 10000
+
+# Ekkora darabokban kerül a kimenet a válasz-streambe
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Az XML 1.0-ban nem megengedett vezérlő karakterek
+_ILLEGAL_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+class ExportTable(NamedTuple):
+    """
+    Egy export tartalma: fájlnév (kiterjesztés nélkül), átnevezett fejlécek és a sorok (lusta iterátor).
+    """
+    basename: str
+    headers: List[str]
+    rows: Iterable[Sequence[Any]]
+
+
+class ExportProgress:
+    """
+    Egy export haladása: lekért oldalak és rekordok, illetve a kiírt sorok száma.
+    """
+
+    def __init__(self):
+        self.pages_fetched = 0
+        self.records_fetched = 0
+        self.rows_total: Optional[int] = None
+        self.rows_written = 0
+
+    def page_fetched(self, records: List[dict]) -> None:
+        self.pages_fetched += 1
+        self.records_fetched += len(records)
+
+    def count_rows(self, rows: Iterable[Sequence[Any]]) -> Iterator[Sequence[Any]]:
+        for row in rows:
+            yield row
+            self.rows_written += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "pages_fetched": self.pages_fetched,
+            "records_fetched": self.records_fetched,
+            "rows_total": self.rows_total,
+            "rows_written": self.rows_written,
+        }
+
+
+def present_columns(records: Iterable[dict], columns: Sequence[str]) -> List[str]:
+    """
+    A kívánt oszlopok közül azok, amelyek legalább egy rekordban előfordulnak (az eredeti sorrendben).
+    """
+    wanted = set(columns)
+    found = set()
+    for record in records:
+        found.update(key for key in record if key in wanted)
+        if len(found) == len(wanted):
+            break
+    return [column for column in columns if column in found]
+
+
+def format_date(value: Any) -> Any:
+    """
+    ISO (UTC) dátum -> 'YYYY-MM-DD HH:MM'; üres érték üres marad, a nem értelmezhető érték változatlan.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M')
+    return value
+
+
+def format_bool(value: Any) -> Optional[str]:
+    # True/False -> Igen/Nem, minden más üres cella
+    if value is True:
+        return "Igen"
+    if value is False:
+        return "Nem"
+    return None
+
+
+def table_rows(
+    records: Iterable[dict],
+    columns: Sequence[str],
+    date_columns: Sequence[str] = (),
+    bool_columns: Sequence[str] = (),
+) -> Iterator[list]:
+    """
+    Rekordonként egy sor a megadott (eredeti nevű) oszlopokkal, dátum és Igen/Nem formázással.
+    """
+    date_indexes = {i for i, column in enumerate(columns) if column in date_columns}
+    bool_indexes = {i for i, column in enumerate(columns) if column in bool_columns}
+    for record in records:
+        row = [record.get(column) for column in columns]
+        for i in date_indexes:
+            row[i] = format_date(row[i])
+        for i in bool_indexes:
+            row[i] = format_bool(row[i])
+        yield row
+
+
+# --- XLSX ---
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+    '</styleSheet>'
+)
+
+
+def _workbook_xml(sheet_name: str) -> str:
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(sheet_name)}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+def _column_letter(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _cell_xml(ref: str, value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+            return ""
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    text = _ILLEGAL_XML_CHARS.sub("", str(value))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _row_xml(row_number: int, letters: List[str], values: Sequence[Any]) -> str:
+    cells = "".join(_cell_xml(f"{letters[i]}{row_number}", value) for i, value in enumerate(values))
+    return f'<row r="{row_number}">{cells}</row>'
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Nem visszatekerhető (unseekable) kimenet a zipfile számára: a beírt bájtokat a
+    generátor darabonként kiüríti és továbbküldi a kliensnek.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_xlsx(headers: Sequence[str], rows: Iterable[Sequence[Any]], sheet_name: str = "Sheet1") -> Iterator[bytes]:
+    """
+    Egylapos XLSX fájl bájtjai darabonként. A sorok egyenként kerülnek feldolgozásra.
+    """
+    letters = [_column_letter(i) for i in range(len(headers))]
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _ROOT_RELS)
+        archive.writestr("xl/workbook.xml", _workbook_xml(sheet_name))
+        archive.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        archive.writestr("xl/styles.xml", _STYLES)
+        yield sink.drain()
+
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            parts = [
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>',
+                _row_xml(1, letters, headers),
+            ]
+            size = sum(len(part) for part in parts)
+            for row_number, row in enumerate(rows, start=2):
+                part = _row_xml(row_number, letters, row)
+                parts.append(part)
+                size += len(part)
+                if size >= STREAM_CHUNK_SIZE:
+                    sheet.write("".join(parts).encode("utf-8"))
+                    parts = []
+                    size = 0
+                    data = sink.drain()
+                    if data:
+                        yield data
+            parts.append("</sheetData></worksheet>")
+            sheet.write("".join(parts).encode("utf-8"))
+    yield sink.drain()
+
+
+# --- CSV / NDJSON ---
+
+def _csv_value(value: Any) -> Any:
+    # Ugyanaz a szöveges alak, mint az Excel cellákban (listák pl. "[1, 2]")
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return value
+
+
+def iter_csv(headers: Sequence[str], rows: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        if buffer.tell() >= STREAM_CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def iter_ndjson(headers: Sequence[str], rows: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    """
+    Soronként egy JSON objektum az átnevezett oszlopnevekkel; a listák JSON tömbök maradnak.
+    """
+    parts: List[str] = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(headers, row)), ensure_ascii=False, default=str) + "\n"
+        parts.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_SIZE:
+            yield "".join(parts).encode("utf-8")
+            parts = []
+            size = 0
+    if parts:
+        yield "".join(parts).encode("utf-8")
+
+
+# --- Parquet ---
+
+def _parquet_schema(pa, headers: Sequence[str], batch: List[Sequence[Any]]):
+    """
+    Séma az első batch alapján; a csak üres értékeket tartalmazó oszlopok szövegesek lesznek.
+    """
+    fields = []
+    for i, header in enumerate(headers):
+        values = [row[i] for row in batch]
+        try:
+            column_type = pa.array(values).type
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            column_type = pa.string()
+        if pa.types.is_null(column_type):
+            column_type = pa.string()
+        fields.append(pa.field(header, column_type))
+    return pa.schema(fields)
+
+
+def _parquet_column(pa, values: List[Any], column_type):
+    try:
+        return pa.array(values, type=column_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        # Eltérő típusú érték egy későbbi batch-ben: szöveges oszlopnál stringgé alakítjuk,
+        # egyébként a nem konvertálható érték üres lesz
+        if pa.types.is_string(column_type):
+            return pa.array([None if value is None else str(value) for value in values], type=column_type)
+        converted = []
+        for value in values:
+            try:
+                converted.append(pa.scalar(value, type=column_type).as_py())
+            except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+                converted.append(None)
+        return pa.array(converted, type=column_type)
+
+
+def iter_parquet(headers: Sequence[str], rows: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    """
+    Parquet fájl row group-onként írva egy streambe (pyarrow szükséges).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    writer = None
+    schema = None
+    batch: List[Sequence[Any]] = []
+    rows = iter(rows)
+    while True:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= PARQUET_BATCH_SIZE:
+                break
+        if not batch and writer is not None:
+            break
+        if schema is None:
+            schema = _parquet_schema(pa, headers, batch)
+            writer = pq.ParquetWriter(sink, schema, compression="snappy")
+        if batch:
+            columns = [
+                _parquet_column(pa, [row[i] for row in batch], field.type)
+                for i, field in enumerate(schema)
+            ]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+        data = sink.drain()
+        if data:
+            yield data
+        if len(batch) < PARQUET_BATCH_SIZE:
+            break
+    writer.close()
+    yield sink.drain()
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def content_disposition(filename: str) -> str:
+    return f"attachment; filename=\"{filename}\"; filename*=utf-8''{quote(filename)}"
+
+
+def xlsx_response(filename: str, headers: Sequence[str], rows: Iterable[Sequence[Any]]) -> StreamingResponse:
+    """
+    Streamelt XLSX letöltés (a sorok generálása a válasz küldése közben történik).
+    """
+    return StreamingResponse(
+        iter_xlsx(headers, rows),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": content_disposition(filename)}
+    )
+
+
+def _count_exported(export_format: str, rows: Iterable[Sequence[Any]]) -> Iterator[Sequence[Any]]:
+    # A metrika a végén (vagy megszakításkor) egyszer frissül, nem soronként
+    count = 0
+    try:
+        for row in rows:
+            count += 1
+            yield row
+    finally:
+        EXPORT_ROWS.inc(count, format=export_format)
+
+
+def iter_export(export_format: str, headers: Sequence[str], rows: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    """
+    A kért formátum író generátora. A sorok előállítása (érték- és dátum formázás) a kérés
+    "format", a fájl írása a "render" szakaszidejébe számít.
+    """
+    writers = {"xlsx": iter_xlsx, "csv": iter_csv, "ndjson": iter_ndjson, "parquet": iter_parquet}
+    format_timer = StageTimer("format")
+    chunks = writers[export_format](headers, format_timer.iterate(_count_exported(export_format, rows)))
+    return StageTimer("render", exclude=format_timer).iterate(chunks)
+
+
+def export_response(export_format: str, basename: str, headers: Sequence[str], rows: Iterable[Sequence[Any]]) -> StreamingResponse:
+    """
+    Streamelt letöltés a kért formátumban; a fájlnév kiterjesztését a formátum adja.
+    """
+    extension, media_type = EXPORT_FORMATS[export_format]
+    return StreamingResponse(
+        iter_export(export_format, headers, rows),
+        media_type=media_type,
+        headers={"Content-Disposition": content_disposition(f"{basename}.{extension}")}
+    )
+
+
+def render_export(export_format: str, headers: Sequence[str], rows: Iterable[Sequence[Any]]) -> bytes:
+    """
+    A teljes export egyetlen bájtsorozatként (cache-elhető válaszokhoz; blokkoló, szálban futtasd).
+    """
+    return b"".join(iter_export(export_format, headers, rows))
+
+
+def cached_export_response(body: bytes, media_type: str, filename: str, etag: str, not_modified: bool = False) -> Response:
+    """
+    Cache-ből kiszolgált export ETag fejléccel; `not_modified` esetén üres 304-es válasz.
+    """
+    if not_modified:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": content_disposition(filename), "ETag": etag}
+    )
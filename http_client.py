@@ -0,0 +1,251 @@
+"""
+Közös, connection pool-os aszinkron HTTP kliens az összes upstream híváshoz (Adalo, MailerSend).
+
+Egyetlen httpx.AsyncClient példány él az alkalmazás teljes élettartama alatt, így a
+TLS kapcsolatok újrahasznosulnak (keep-alive), és egy lassú Adalo oldal nem blokkolja
+az uvicorn event loop-ot.
+
+Az egyszerre futó, azonos olvasások (pl. ugyanannak a collection oldalnak a lekérése
+több párhuzamos végpont hívásból) egyetlen upstream kérésen osztoznak (single-flight).
+
+A host-onkénti párhuzamosságot egy adaptív (AIMD) limit szabályozza, a 429 / 5xx
+válaszokat és hálózati hibákat pedig idempotens kéréseknél jitteres visszalépéssel
+újrapróbáljuk (a Retry-After fejléc betartásával).
+"""
+import asyncio
+import time
+from typing import Callable, Dict, Hashable, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app_logging import get_logger
+from rate_limit import RETRYABLE_STATUSES, THROTTLE_STATUSES, AdaptiveLimiter, backoff_delay, retry_after_seconds
+
+log = get_logger("http_client")
+
+# Ezek a metódusok biztonságosan megismételhetők; 429-nél (a kérés fel sem lett dolgozva) bármelyik
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT"}
+
+# Az egyszerre futó, azonos ilyen kérések egyetlen upstream kérésen osztoznak
+SINGLE_FLIGHT_METHODS = {"GET", "HEAD"}
+
+# (metódus, URL, végső válasz vagy None, eltelt másodpercek)
+ResponseHook = Callable[[str, str, Optional[httpx.Response], float], None]
+
+
+def _flight_path(url: str) -> str:
+    # A cím lekérdezési paraméterek nélkül (a listázás paraméterei nem számítanak)
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path.rstrip('/')}"
+
+
+def _affected_by_write(path: str, written: str, parent: str) -> bool:
+    return path == written or path == parent or path.startswith(written + "/")
+
+
+class HttpClient:
+    """
+    Vékony wrapper a httpx.AsyncClient körül host-onkénti adaptív párhuzamossági limittel
+    (legfeljebb `max_per_host`, induláskor `initial_per_host`) és újrapróbálkozással.
+    A start()/close() hívásokat az app lifespan kezeli, de az első kérés lustán is elindítja.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 30.0,
+        connect_timeout: float = 10.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        max_per_host: int = 20,
+        initial_per_host: int = 4,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        retry_max_backoff: float = 30.0,
+        single_flight: bool = True,
+    ):
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.max_per_host = max_per_host
+        self.initial_per_host = initial_per_host
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.retry_max_backoff = retry_max_backoff
+        self.retries = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limiters: Dict[str, AdaptiveLimiter] = {}
+        self._response_hooks: List[ResponseHook] = []
+        self.single_flight = single_flight
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._host_limiters.clear()
+
+    def _limiter_for(self, url: str) -> AdaptiveLimiter:
+        host = urlsplit(url).netloc
+        limiter = self._host_limiters.get(host)
+        if limiter is None:
+            limiter = AdaptiveLimiter(
+                host, initial=self.initial_per_host, max_limit=self.max_per_host, max_pause=self.retry_max_backoff
+            )
+            self._host_limiters[host] = limiter
+        return limiter
+
+    def add_response_hook(self, hook: ResponseHook) -> None:
+        """
+        A hook minden befejezett kérés után meghívódik (metódus, URL, végső válasz vagy None,
+        ha a kérés hibával ért véget, eltelt idő újrapróbálkozásokkal együtt); pl. a rekord
+        cache írás utáni frissítéséhez és a metrikákhoz.
+        """
+        self._response_hooks.append(hook)
+
+    def _notify(self, method: str, url: str, response: Optional[httpx.Response], elapsed: float) -> None:
+        for hook in self._response_hooks:
+            try:
+                hook(method, url, response, elapsed)
+            except Exception as e:
+                log.warning("Response hook hiba (%s %s): %s", method, url, e)
+
+    def _single_flight_key(self, method: str, url: str, kwargs: dict) -> Optional[Hashable]:
+        # Csak a törzs nélküli olvasások vonhatók össze (azonos URL, paraméterek és fejlécek)
+        if not self.single_flight or method not in SINGLE_FLIGHT_METHODS or not set(kwargs) <= {"headers", "params"}:
+            return None
+        headers = kwargs.get("headers") or {}
+        return method, str(httpx.URL(url, params=kwargs.get("params"))), tuple(sorted(headers.items()))
+
+    def _forget_flights(self, url: str) -> None:
+        """
+        Egy írás (PUT / POST / DELETE ...) után az érintett címekre futó olvasásokhoz nem lehet
+        csatlakozni: azok még az írás előtt indultak, így a régi adatot adnák vissza. Érintett a
+        cím maga, az alatta lévők (pl. a collection rekordjai) és a szülője (pl. a listázás).
+        A már várakozók megkapják a közös választ, az új GET-ek új upstream kérést indítanak.
+        """
+        path = _flight_path(url)
+        parent = path.rsplit("/", 1)[0]
+        for key in [key for key in self._in_flight if _affected_by_write(_flight_path(key[1]), path, parent)]:
+            del self._in_flight[key]
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Kérés küldése (lásd _send). Az egyszerre futó, azonos GET / HEAD kérések egyetlen
+        upstream kérésen osztoznak (single-flight), és mind ugyanazt a választ kapják; egy saját
+        írás befejezése után viszont a korábban indult olvasásokhoz már nem csatlakozhat új kérés.
+        """
+        method = method.upper()
+        key = self._single_flight_key(method, url, kwargs)
+        if key is None:
+            try:
+                return await self._request(method, url, **kwargs)
+            finally:
+                if method not in SINGLE_FLIGHT_METHODS:
+                    self._forget_flights(url)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._request(method, url, **kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._flight_done(key, done))
+        else:
+            self.coalesced += 1
+        # Egy várakozó megszakadása nem szakítja meg a többiekkel közös kérést
+        return await asyncio.shield(task)
+
+    def _flight_done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Ha minden várakozó elment, a hibát itt "olvassuk ki", hogy ne legyen figyelmeztetés
+        if not task.cancelled():
+            task.exception()
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await self._send(method, url, **kwargs)
+        except BaseException:
+            self._notify(method, url, None, time.perf_counter() - started)
+            raise
+        self._notify(method, url, response, time.perf_counter() - started)
+        return response
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Kérés küldése a host adaptív limitje alatt. 429 esetén mindig, 5xx és hálózati hiba
+        esetén csak idempotens metódusnál próbálkozik újra (legfeljebb max_retries-szor);
+        ha az újrapróbálkozások elfogynak, az utolsó választ adja vissza (illetve a hibát dobja).
+        """
+        if self._client is None:
+            await self.start()
+        limiter = self._limiter_for(url)
+        idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            await limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = await self._client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                limiter.release("error")
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt, self.retry_backoff, self.retry_max_backoff)
+                log.warning("Upstream hálózati hiba (%s %s): %s, újrapróbálkozás %.2f mp múlva (%s/%s)", method, url, e, delay, attempt + 1, self.max_retries)
+            except asyncio.CancelledError:
+                # Korai leállás (lapozás vége, kliens bontás): nem csökkenti a host limitjét
+                limiter.release("cancelled")
+                raise
+            except BaseException:
+                limiter.release("error")
+                raise
+            else:
+                status = response.status_code
+                retry_after = retry_after_seconds(response) if status in RETRYABLE_STATUSES else None
+                if status in THROTTLE_STATUSES:
+                    limiter.release("throttled", retry_after=retry_after)
+                elif status in RETRYABLE_STATUSES:
+                    limiter.release("error", retry_after=retry_after)
+                else:
+                    limiter.release("ok", latency=time.monotonic() - started)
+                    return response
+                retryable = idempotent or status in THROTTLE_STATUSES
+                if not retryable or attempt >= self.max_retries:
+                    return response
+                await response.aclose()
+                if retry_after is not None:
+                    delay = min(retry_after, self.retry_max_backoff)
+                else:
+                    delay = backoff_delay(attempt, self.retry_backoff, self.retry_max_backoff)
+                log.warning("Upstream %s (%s %s), újrapróbálkozás %.2f mp múlva (%s/%s)", status, method, url, delay, attempt + 1, self.max_retries)
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "retries": self.retries,
+            "single_flight": {"enabled": self.single_flight, "in_flight": len(self._in_flight), "coalesced": self.coalesced},
+            "hosts": {host: limiter.stats() for host, limiter in self._host_limiters.items()},
+        }
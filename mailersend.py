@@ -0,0 +1,193 @@
+"""
+MailerSend bulk email küldés: a címzettek egy generátorból, lustán állnak össze batch-ekké,
+a batch-ek korlátozott párhuzamossággal mennek ki. Újrapróbálkozás csak akkor van, ha a kérés
+bizonyosan nem ért célba (kapcsolódási hiba, Retry-After-es 503; a 429-et a HTTP kliens kezeli):
+a bulk küldés nem idempotens, egy bizonytalan kimenetelű hiba után az újraküldés duplán
+kiküldött emaileket jelentene.
+A közös (from / subject / template_id) mezők egyszer készülnek el, minden email objektum
+ugyanarra a dict-re hivatkozik.
+"""
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from app_logging import get_logger
+from http_client import HttpClient
+from metrics import StageTimer, stage
+from rate_limit import backoff_delay, retry_after_seconds
+
+log = get_logger("mailersend")
+
+# MailerSend bulk endpoint: egy kérésben legfeljebb 500 email objektum
+MAILERSEND_MAX_BATCH_SIZE = 500
+
+# Két újrapróbálkozás között legfeljebb ennyi másodperc telik el
+RETRY_MAX_BACKOFF = 30.0
+
+# A kérés biztosan nem jutott el a szerverig (a törzs nem ment ki)
+NOT_DELIVERED_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+def mailersend_headers(api_key: str) -> Dict[str, str]:
+    return {
+        "Content-Type": "application/json",
+        "X-Requested-With": "XMLHttpRequest",
+        "Authorization": f"Bearer {api_key}"
+    }
+
+
+class EmailTemplate:
+    """
+    Egy kiküldés közös adatai; az email objektumok ezekre hivatkoznak (nem másolják).
+    """
+
+    def __init__(
+        self,
+        from_email: str,
+        from_name: str,
+        subject: str,
+        template_id: str,
+        personalization_data: Optional[dict] = None,
+    ):
+        self.sender = {"email": from_email, "name": from_name}
+        self.subject = subject
+        self.template_id = template_id
+        self.personalization_data = personalization_data
+
+    def email(self, recipient: dict) -> dict:
+        email_obj = {
+            "from": self.sender,
+            "to": [
+                {
+                    "email": recipient["email"],
+                    "name": recipient["full_name"] if recipient["full_name"] else None
+                }
+            ],
+            "subject": self.subject,
+            "template_id": self.template_id
+        }
+        # Personalization hozzáadása, ha van
+        if self.personalization_data:
+            email_obj["personalization"] = [
+                {
+                    "email": recipient["email"],
+                    "data": self.personalization_data
+                }
+            ]
+        return email_obj
+
+
+async def recipient_batches(recipients: AsyncIterator[dict], batch_size: int) -> AsyncIterator[List[dict]]:
+    batch: List[dict] = []
+    async for recipient in recipients:
+        batch.append(recipient)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _send_batch(
+    client: HttpClient,
+    url: str,
+    headers: Dict[str, str],
+    template: EmailTemplate,
+    batch_num: int,
+    batch: List[dict],
+    max_retries: int,
+    retry_backoff: float,
+) -> dict:
+    # A payload csak a küldés idejére él
+    payload = [template.email(recipient) for recipient in batch]
+    attempt = 0
+    while True:
+        log.debug("MailerSend bulk API hívás batch %s...", batch_num)
+        try:
+            response = await client.post(url, headers=headers, json=payload)
+        except NOT_DELIVERED_ERRORS as e:
+            if attempt < max_retries:
+                attempt += 1
+                log.warning("Batch %s kapcsolódási hiba (%s), újrapróbálkozás (%s/%s)", batch_num, e, attempt, max_retries)
+                await asyncio.sleep(backoff_delay(attempt, retry_backoff, RETRY_MAX_BACKOFF))
+                continue
+            error_detail = f"MailerSend API hiba batch {batch_num}: {e}"
+            log.error("%s", error_detail)
+            return {"batch_num": batch_num, "status": "error", "error": error_detail, "users_count": len(batch)}
+        except httpx.TransportError as e:
+            # A kérés kimehetett (pl. olvasási timeout): nem küldjük újra, a batch állapota bizonytalan
+            error_detail = f"MailerSend API hiba batch {batch_num} (a kiküldés bizonytalan, nem küldtük újra): {e!r}"
+            log.error("%s", error_detail)
+            return {"batch_num": batch_num, "status": "error", "error": error_detail, "users_count": len(batch)}
+
+        log.debug("MailerSend válasz státuszkód: %s", response.status_code)
+        if response.status_code in [200, 201, 202]:
+            log.info("Batch %s sikeresen elküldve", batch_num)
+            return {
+                "batch_num": batch_num,
+                "status": "success",
+                "bulk_email_id": response.json().get("id"),
+                "users_count": len(batch)
+            }
+        # Retry-After-es 503: a szerver elutasította a kérést, biztonságosan újraküldhető. A 429-et
+        # a HTTP kliens már a saját limitjei szerint újrapróbálta, itt nem küldjük újra még egyszer.
+        retry_after = retry_after_seconds(response)
+        rejected = response.status_code == 503 and retry_after is not None
+        if rejected and attempt < max_retries:
+            attempt += 1
+            log.warning("Batch %s elutasítva (%s), újrapróbálkozás (%s/%s)", batch_num, response.status_code, attempt, max_retries)
+            await asyncio.sleep(min(retry_after, RETRY_MAX_BACKOFF))
+            continue
+        error_detail = f"MailerSend API hiba batch {batch_num}: {response.status_code} - {response.text}"
+        log.error("%s", error_detail)
+        return {"batch_num": batch_num, "status": "error", "error": error_detail, "users_count": len(batch)}
+
+
+async def send_bulk_emails(
+    client: HttpClient,
+    url: str,
+    headers: Dict[str, str],
+    template: EmailTemplate,
+    recipients: AsyncIterator[dict],
+    batch_size: int = MAILERSEND_MAX_BATCH_SIZE,
+    concurrency: int = 4,
+    max_retries: int = 3,
+    retry_backoff: float = 1.0,
+) -> List[dict]:
+    """
+    A `recipients` generátorból `batch_size` méretű batch-eket képez, és egyszerre legfeljebb
+    `concurrency` batch-et küld el. A 429 választ (Retry-After-rel) a HTTP kliens kezeli; a batch
+    csak akkor megy ki újra (legfeljebb `max_retries`-szor), ha bizonyosan nem ért célba
+    (kapcsolódási hiba, Retry-After-es 503). Más hálózati hiba vagy 5xx a batch hibájaként kerül
+    az eredménybe, újraküldés nélkül, mert a bulk küldés nem idempotens. Egyszerre legfeljebb
+    `concurrency` batch van a memóriában. Visszaadja a batch-enkénti eredményeket, sorrendben.
+    A címzettekre várakozás a kérés "fetch", a küldésekre várakozás a "send" szakaszidejébe számít.
+    """
+    limit = max(1, concurrency)
+    results: List[dict] = []
+    pending: set = set()
+    batch_num = 0
+    try:
+        batches = recipient_batches(recipients, min(batch_size, MAILERSEND_MAX_BATCH_SIZE))
+        async for batch in StageTimer("fetch").aiterate(batches):
+            batch_num += 1
+            log.debug("Batch %s: %s user", batch_num, len(batch))
+            if len(pending) >= limit:
+                with stage("send"):
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                results.extend(task.result() for task in done)
+            pending.add(asyncio.create_task(
+                _send_batch(client, url, headers, template, batch_num, batch, max_retries, retry_backoff)
+            ))
+        if pending:
+            with stage("send"):
+                results.extend(await asyncio.gather(*pending))
+            pending = set()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    results.sort(key=lambda result: result["batch_num"])
+    return results
@@ -0,0 +1,295 @@
+"""
+Prometheus szöveges formátumú metrikák (a /metrics végponthoz), külső függőség nélkül.
+
+A bejövő kérésenkénti upstream statisztika (hívások, lekért oldalak, fogadott bájtok) egy
+contextvar-ban utazik: a kérés kezelése közben indított taskok is ugyanabba gyűjtenek, így
+egy N+1 mintázat (pl. userenkénti / tranzakciónkénti kérések) kérésenkénti számként látszik.
+
+Ugyanitt gyűlnek a kérés feldolgozási szakaszainak idői is (pl. fetch, filter, coupons, format,
+render); ezek a válasz Server-Timing fejlécébe kerülnek.
+"""
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Válaszidő bucketek (másodperc)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Darabszám bucketek (upstream hívások / oldalak egy bejövő kérésre)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# Méret bucketek (bájt)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # kulcs -> [bucketenkénti darabszám (nem kumulatív)..., +Inf darabszám], összeg
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = "+Inf" if math.isinf(bound) else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# Lekéréskor kiszámolt metrikák: (név, típus, leírás, [(címkék, érték), ...])
+Sample = Tuple[Dict[str, str], float]
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[object] = []
+        self._collectors: List[Collector] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, metric_type, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "huniexport_http_requests_total", "Bejövő kérések száma útvonalanként és státuszonként.", ("route", "method", "status")))
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "huniexport_http_request_duration_seconds", "Bejövő kérések kezelési ideje (a válasz fejlécéig).", ("route", "method")))
+UPSTREAM_CALLS = REGISTRY.register(Counter(
+    "huniexport_upstream_calls_total", "Upstream hívások száma típusonként és a kiváltó útvonal szerint.", ("route", "call_type", "status")))
+UPSTREAM_CALL_DURATION = REGISTRY.register(Histogram(
+    "huniexport_upstream_call_duration_seconds", "Upstream hívások ideje (újrapróbálkozásokkal együtt).", ("call_type",)))
+UPSTREAM_BYTES = REGISTRY.register(Counter(
+    "huniexport_upstream_received_bytes_total", "Upstream válaszokból fogadott bájtok.", ("call_type",)))
+REQUEST_UPSTREAM_CALLS = REGISTRY.register(Histogram(
+    "huniexport_request_upstream_calls", "Egy bejövő kérés által indított upstream hívások száma.", ("route",), COUNT_BUCKETS))
+REQUEST_UPSTREAM_PAGES = REGISTRY.register(Histogram(
+    "huniexport_request_upstream_pages", "Egy bejövő kérés által lekért collection oldalak száma.", ("route",), COUNT_BUCKETS))
+REQUEST_UPSTREAM_BYTES = REGISTRY.register(Histogram(
+    "huniexport_request_upstream_received_bytes", "Egy bejövő kérés által fogadott upstream bájtok.", ("route",), SIZE_BUCKETS))
+EXPORT_ROWS = REGISTRY.register(Counter(
+    "huniexport_export_rows_total", "Exportált sorok száma formátumonként.", ("format",)))
+
+
+class RequestStats:
+    """
+    Egy bejövő kérés upstream statisztikája. Az útvonal (sablon, pl. /deleteuser/{user_id})
+    a routing után kerül az ASGI scope-ba, ezért lustán olvassuk ki.
+    """
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+        self.pages = 0
+        self.bytes_received = 0
+        # szakasz neve -> összesített idő (másodperc), az első előfordulás sorrendjében
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        # Szálból (pl. to_thread-ben futó renderelés) is hívható
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self, total: float) -> str:
+        """
+        Server-Timing fejléc érték: a szakaszok, az upstream hívások összesített ideje és a teljes idő (ms).
+        Az upstream idő párhuzamos hívásoknál a faliórás időnél nagyobb is lehet.
+        """
+        with self._lock:
+            stages = list(self.stages.items())
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages]
+        if self.upstream_calls:
+            entries.append(f'upstream;desc="{self.upstream_calls} calls";dur={self.upstream_seconds * 1000:.1f}')
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("current_request", default=None)
+
+
+def track_upstream_call(call_type: str, status: str, duration: float, bytes_received: int) -> None:
+    """
+    Egy befejezett upstream hívás rögzítése a globális metrikákban és az aktuális kérés statisztikájában.
+    """
+    stats = current_request.get()
+    route = stats.route if stats is not None else "background"
+    UPSTREAM_CALLS.inc(route=route, call_type=call_type, status=status)
+    UPSTREAM_CALL_DURATION.observe(duration, call_type=call_type)
+    UPSTREAM_BYTES.inc(bytes_received, call_type=call_type)
+    if stats is not None:
+        stats.upstream_calls += 1
+        stats.upstream_seconds += duration
+        stats.bytes_received += bytes_received
+        if call_type == "list_page":
+            stats.pages += 1
+
+
+def observe_request(stats: RequestStats, method: str, status: int, duration: float) -> None:
+    HTTP_REQUESTS.inc(route=stats.route, method=method, status=status)
+    HTTP_REQUEST_DURATION.observe(duration, route=stats.route, method=method)
+    REQUEST_UPSTREAM_CALLS.observe(stats.upstream_calls, route=stats.route)
+    REQUEST_UPSTREAM_PAGES.observe(stats.pages, route=stats.route)
+    REQUEST_UPSTREAM_BYTES.observe(stats.bytes_received, route=stats.route)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    A blokk idejének hozzáadása az aktuális kérés `name` szakaszához (kérésen kívül nem csinál semmit).
+    Ugyanaz a szakasz többször is előfordulhat, az idők összeadódnak.
+    """
+    stats = current_request.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_stage(name, time.perf_counter() - started)
+
+
+class StageTimer:
+    """
+    Iterátorok szakaszideje: csak a következő elem előállításával töltött idő számít, a fogyasztóé
+    (a ciklustörzsé) nem. Az idő a létrehozáskor aktuális kéréshez adódik, az iterátor végén egyszer,
+    így a válasz küldése közben, szálban futó streamelés is ugyanahhoz a kéréshez mér. Az `exclude`
+    timer ideje levonódik (pl. a render idejéből a beágyazott sorformázásé).
+    """
+
+    def __init__(self, name: str, exclude: Optional["StageTimer"] = None):
+        self.name = name
+        self.exclude = exclude
+        self.seconds = 0.0
+        self._stats = current_request.get()
+
+    def _add(self, started: float, excluded_before: float) -> None:
+        self.seconds += time.perf_counter() - started
+        if self.exclude is not None:
+            self.seconds -= self.exclude.seconds - excluded_before
+
+    def _record(self) -> None:
+        if self._stats is not None:
+            self._stats.add_stage(self.name, self.seconds)
+
+    def iterate(self, iterable: Iterable) -> Iterator:
+        iterator = iter(iterable)
+        try:
+            while True:
+                started = time.perf_counter()
+                excluded_before = self.exclude.seconds if self.exclude is not None else 0.0
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self._add(started, excluded_before)
+                yield item
+        finally:
+            self._record()
+
+    async def aiterate(self, iterable: AsyncIterable) -> AsyncIterator:
+        iterator = iterable.__aiter__()
+        try:
+            while True:
+                started = time.perf_counter()
+                excluded_before = self.exclude.seconds if self.exclude is not None else 0.0
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    self._add(started, excluded_before)
+                yield item
+        finally:
+            self._record()
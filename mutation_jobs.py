@@ -0,0 +1,316 @@
+"""
+Tartós, folytatható háttér jobok a teljes userbázist módosító műveletekhez
+(set-all-hungarian, notifalse, auto-delete-users).
+
+A job állapota (sikeres és sikertelen rekordok, utoljára feldolgozott id) rendszeresen
+egy helyi SQLite fájlba kerül; a feldolgozott rekordok külön táblába, checkpointonként csak az
+újak, így egy checkpoint ideje nem nő a job méretével. Ha a folyamat leáll vagy újraindul, a
+félbemaradt jobok induláskor automatikusan folytatódnak, és a már feldolgozott rekordokat kihagyják.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from app_logging import get_logger
+
+log = get_logger("mutation_jobs")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mutation_jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_mutation_jobs_created_at ON mutation_jobs (created_at);
+CREATE TABLE IF NOT EXISTS mutation_job_records (
+    job_id TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    record_id TEXT NOT NULL,
+    detail TEXT,
+    PRIMARY KEY (job_id, outcome, seq)
+);
+"""
+
+# Ilyen állapotú jobok induláskor folytatódnak
+RESUMABLE_STATUSES = ("queued", "running")
+
+
+class MutationJob:
+    """
+    Egy job és a checkpointja. A futtató függvény a record_success / record_failure
+    hívásokkal jelzi a haladást, és az is_done alapján hagyja ki a már feldolgozott rekordokat.
+    """
+
+    def __init__(self, kind: str, params: Optional[dict] = None, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.runs = 0
+        self.last_id: Any = None
+        self.succeeded: List[dict] = []
+        self.failed: List[dict] = []
+        self.progress: Dict[str, Any] = {}
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self._done: Set[Any] = set()
+        # Ennyi sikeres / sikertelen bejegyzés van már a mutation_job_records táblában
+        self._persisted = {"succeeded": 0, "failed": 0}
+        self._on_change: Optional[Callable[["MutationJob"], None]] = None
+
+    def is_done(self, record_id: Any) -> bool:
+        return record_id in self._done
+
+    def record_success(self, record_id: Any, detail: Optional[dict] = None) -> None:
+        self.succeeded.append({"id": record_id, "detail": detail})
+        self._mark(record_id)
+
+    def record_failure(self, record_id: Any, detail: Optional[dict] = None) -> None:
+        self.failed.append({"id": record_id, "detail": detail})
+        self._mark(record_id)
+
+    def _mark(self, record_id: Any) -> None:
+        self._done.add(record_id)
+        self.last_id = record_id
+        if self._on_change is not None:
+            self._on_change(self)
+
+    def to_dict(self, details: bool = False) -> dict:
+        data = {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "runs": self.runs,
+            "last_id": self.last_id,
+            "succeeded_count": len(self.succeeded),
+            "failed_count": len(self.failed),
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+        }
+        if details:
+            data["succeeded"] = self.succeeded
+            data["failed"] = self.failed
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MutationJob":
+        job = cls(data["kind"], data.get("params"), job_id=data["id"])
+        job.status = data["status"]
+        job.created_at = data["created_at"]
+        job.started_at = data.get("started_at")
+        job.finished_at = data.get("finished_at")
+        job.runs = data.get("runs", 0)
+        job.last_id = data.get("last_id")
+        job.succeeded = data.get("succeeded") or []
+        job.failed = data.get("failed") or []
+        job.progress = data.get("progress") or {}
+        job.result = data.get("result")
+        job.error = data.get("error")
+        job._done = {entry["id"] for entry in job.succeeded + job.failed}
+        return job
+
+
+class MutationJobRunner:
+    """
+    Regisztrált job fajták futtatása háttérben, fajtánként legfeljebb egy aktív jobbal.
+    A checkpoint legfeljebb `checkpoint_interval` másodpercenként (és minden állapotváltáskor)
+    íródik ki; a befejezett jobokból a legutóbbi `keep_finished` marad meg.
+    """
+
+    def __init__(self, path: str, checkpoint_interval: float = 2.0, keep_finished: int = 50):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.keep_finished = keep_finished
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._handlers: Dict[str, Callable[[MutationJob], Awaitable[dict]]] = {}
+        self._jobs: Dict[str, MutationJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._last_saved: Dict[str, float] = {}
+
+    def register(self, kind: str, handler: Callable[[MutationJob], Awaitable[dict]]) -> None:
+        self._handlers[kind] = handler
+
+    # --- tárolás ---
+
+    def _save(self, job: MutationJob) -> None:
+        # Csak az előző mentés óta feldolgozott rekordok íródnak ki
+        new_entries = []
+        counts = {}
+        for outcome, entries in (("succeeded", job.succeeded), ("failed", job.failed)):
+            start = job._persisted[outcome]
+            counts[outcome] = len(entries)
+            new_entries.extend(
+                (job.id, outcome, seq, json.dumps(entry["id"]), json.dumps(entry["detail"], ensure_ascii=False))
+                for seq, entry in enumerate(entries[start:], start)
+            )
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO mutation_jobs (id, kind, status, created_at, data) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET status = excluded.status, data = excluded.data",
+                (job.id, job.kind, job.status, job.created_at, json.dumps(job.to_dict(), ensure_ascii=False)),
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO mutation_job_records (job_id, outcome, seq, record_id, detail) VALUES (?, ?, ?, ?, ?)",
+                new_entries,
+            )
+        job._persisted = counts
+        self._last_saved[job.id] = time.monotonic()
+
+    def _checkpoint(self, job: MutationJob) -> None:
+        if time.monotonic() - self._last_saved.get(job.id, 0.0) >= self.checkpoint_interval:
+            self._save(job)
+
+    def _restore(self, data: str) -> MutationJob:
+        """
+        Job a mentett adataiból és a feldolgozott rekordjaiból. A korábbi formátumban a rekordok
+        a job adatai között vannak: ezek a következő mentéskor kerülnek át a külön táblába.
+        """
+        data = json.loads(data)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT outcome, record_id, detail FROM mutation_job_records WHERE job_id = ? ORDER BY outcome, seq",
+                (data["id"],),
+            ).fetchall()
+        if rows:
+            data["succeeded"] = []
+            data["failed"] = []
+            for outcome, record_id, detail in rows:
+                data[outcome].append({"id": json.loads(record_id), "detail": json.loads(detail)})
+        job = MutationJob.from_dict(data)
+        if rows:
+            job._persisted = {"succeeded": len(job.succeeded), "failed": len(job.failed)}
+        return job
+
+    def _load(self, job_id: str) -> Optional[MutationJob]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM mutation_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._restore(row[0]) if row else None
+
+    def _prune(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM mutation_jobs WHERE status NOT IN (?, ?) AND id NOT IN ("
+                "SELECT id FROM mutation_jobs WHERE status NOT IN (?, ?) ORDER BY created_at DESC LIMIT ?)",
+                (*RESUMABLE_STATUSES, *RESUMABLE_STATUSES, self.keep_finished),
+            )
+            self._conn.execute("DELETE FROM mutation_job_records WHERE job_id NOT IN (SELECT id FROM mutation_jobs)")
+
+    # --- életciklus ---
+
+    def start(self) -> None:
+        """
+        A félbemaradt (queued / running) jobok folytatása, pl. újraindítás után.
+        """
+        self._prune()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM mutation_jobs WHERE status IN (?, ?) ORDER BY created_at",
+                RESUMABLE_STATUSES,
+            ).fetchall()
+        for (data,) in rows:
+            job = self._restore(data)
+            if job.kind not in self._handlers or self.active(job.kind) is not None:
+                continue
+            log.info("Félbemaradt job folytatása: %s (%s), eddig %s sikeres, %s hibás", job.kind, job.id, len(job.succeeded), len(job.failed))
+            self._launch(job)
+
+    async def stop(self) -> None:
+        # A futó jobok 'running' állapotban, az aktuális checkpointtal maradnak meg, így a következő induláskor folytatódnak
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # --- jobok ---
+
+    def active(self, kind: str) -> Optional[MutationJob]:
+        for job_id in self._tasks:
+            job = self._jobs[job_id]
+            if job.kind == kind:
+                return job
+        return None
+
+    def submit(self, kind: str, params: Optional[dict] = None) -> MutationJob:
+        """
+        Új job indítása; ha ugyanilyen fajtájú job már fut, azt adja vissza.
+        """
+        if kind not in self._handlers:
+            raise KeyError(kind)
+        running = self.active(kind)
+        if running is not None:
+            return running
+        job = MutationJob(kind, params)
+        self._save(job)
+        self._launch(job)
+        return job
+
+    def _launch(self, job: MutationJob) -> None:
+        job._on_change = self._checkpoint
+        self._jobs[job.id] = job
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+
+    async def _run(self, job: MutationJob) -> None:
+        job.status = "running"
+        job.runs += 1
+        job.started_at = job.started_at or time.time()
+        job.error = None
+        self._save(job)
+        try:
+            job.result = await self._handlers[job.kind](job)
+            job.status = "done"
+        except asyncio.CancelledError:
+            # Leállítás: a job 'running' marad, a checkpoint mentésre kerül
+            self._save(job)
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(getattr(e, "detail", e))
+            log.error("Job sikertelen: %s (%s): %s", job.kind, job.id, job.error)
+        job.finished_at = time.time()
+        self._save(job)
+
+    async def wait(self, job: MutationJob) -> MutationJob:
+        """
+        Megvárja a job végét. A várakozó kérés megszakadása nem állítja le a jobot.
+        """
+        task = self._tasks.get(job.id)
+        if task is not None:
+            await asyncio.shield(task)
+        return job
+
+    def get(self, job_id: str) -> Optional[MutationJob]:
+        return self._jobs.get(job_id) or self._load(job_id)
+
+    def recent(self, limit: int = 20) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM mutation_jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        jobs = [self.get(job_id) for (job_id,) in rows]
+        return [job.to_dict() for job in jobs if job is not None]
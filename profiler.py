@@ -0,0 +1,110 @@
+"""
+Mintavételező profiler egy-egy kérés vizsgálatához (a ?profile=1 módhoz), külső függőség nélkül.
+
+Egy háttérszál `interval` másodpercenként lekéri az összes szál aktuális hívási láncát
+(sys._current_frames), és függvényenként számolja, hányszor volt a lánc tetején (saját idő)
+és hányszor szerepelt benne (kumulatív idő). A tétlen szálak (event loop select, üres
+szálkészlet) mintái nem számítanak. A mintavétel a teljes folyamatra vonatkozik, így az
+éppen párhuzamosan futó más kérések is látszhatnak a riportban.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+# (fájl, függvény) párok, amelyekben egy szál tétlenül várakozik
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+FrameKey = Tuple[str, int, str]
+
+
+def _frame_key(frame) -> FrameKey:
+    code = frame.f_code
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def _label(key: FrameKey) -> str:
+    filename, line, name = key
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def _is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, max_depth: int = 128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.ticks = 0
+        self.samples = 0
+        self.self_counts: Counter = Counter()
+        self.total_counts: Counter = Counter()
+        self.started: Optional[float] = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.ticks += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or _is_idle(frame):
+                    continue
+                self._sample(frame)
+
+    def _sample(self, frame) -> None:
+        self.samples += 1
+        self.self_counts[_frame_key(frame)] += 1
+        seen = set()
+        depth = 0
+        while frame is not None and depth < self.max_depth:
+            key = _frame_key(frame)
+            # Rekurzió esetén egy függvény mintánként csak egyszer számít
+            if key not in seen:
+                seen.add(key)
+                self.total_counts[key] += 1
+            frame = frame.f_back
+            depth += 1
+
+    def report(self, title: str, limit: int = 30) -> str:
+        """
+        Szöveges riport: a legtöbb saját és kumulatív mintát kapott függvények. A százalék a
+        mintavételi körök számához viszonyít (több aktív szál esetén összegük 100% fölé mehet).
+        """
+        ticks = max(1, self.ticks)
+        lines: List[str] = [
+            title,
+            f"Időtartam: {self.duration:.3f} s, mintavételi körök: {self.ticks} ({self.interval * 1000:g} ms), aktív minták: {self.samples}",
+            "",
+        ]
+        for heading, counts in (("Saját idő (a hívási lánc tetején)", self.self_counts),
+                                ("Kumulatív idő (a hívási láncban bárhol)", self.total_counts)):
+            lines.append(f"{heading}:")
+            lines.append(f"{'%':>7} {'minta':>7} {'~ms':>9}  függvény")
+            for key, count in counts.most_common(limit):
+                lines.append(
+                    f"{count * 100 / ticks:6.1f}% {count:7d} {count * self.interval * 1000:9.1f}  {_label(key)}"
+                )
+            lines.append("")
+        return "\n".join(lines)
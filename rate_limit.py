@@ -0,0 +1,169 @@
+"""
+Adaptív (AIMD) párhuzamosság-szabályozás és újrapróbálkozási segédfüggvények az upstream
+hívásokhoz: egészséges válaszidő mellett lassan nő a párhuzamos kérések száma, 429 / 5xx
+esetén a felére esik, a Retry-After fejlécet pedig host szinten betartjuk.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Deque, Optional
+
+import httpx
+
+# Ezekre a státuszokra lassítunk (és idempotens kérésnél újrapróbálkozunk)
+THROTTLE_STATUSES = {429}
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AdaptiveLimiter:
+    """
+    Egy host párhuzamossági limitje, additive increase / multiplicative decrease szerint.
+
+    - minden sikeres, egészséges válaszidejű kérés után a limit 1/limit-tel nő (ablakonként +1),
+    - 429 / 5xx / hálózati hiba esetén a limit `decrease_factor`-szorosára csökken
+      (egy válaszidőnyi ablakon, illetve `cooldown`-on belül csak egyszer, hogy egy hullámnyi
+      hiba ne nullázza le),
+    - Retry-After esetén a host összes kérése szünetel a megadott ideig, de legfeljebb
+      `max_pause` másodpercig (egy hibás vagy túl nagy fejléc ne állítsa le a hostot).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 20,
+        latency_tolerance: float = 2.0,
+        decrease_factor: float = 0.5,
+        cooldown: float = 0.0,
+        max_pause: float = 30.0,
+    ):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.max_pause = max_pause
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._latency_ewma: Optional[float] = None
+        self._latency_baseline: Optional[float] = None
+        self.successes = 0
+        self.throttled = 0
+        self.failures = 0
+
+    async def acquire(self) -> None:
+        while True:
+            wait = self._blocked_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    # Minket már felébresztettek, a helyet továbbadjuk
+                    self._wake()
+                else:
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        pass
+                raise
+
+    def release(self, outcome: str, latency: Optional[float] = None, retry_after: Optional[float] = None) -> None:
+        """
+        outcome: "ok" (sikeres válasz), "throttled" (429), "error" (5xx / hálózati hiba) vagy
+        "cancelled" (a hívó megszakította a kérést: nem az upstream hibája, a limit nem változik).
+        """
+        self.in_flight -= 1
+        now = time.monotonic()
+        if outcome == "cancelled":
+            pass
+        elif outcome == "ok":
+            self.successes += 1
+            if latency is not None:
+                self._observe_latency(latency)
+            if self._healthy():
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        else:
+            if outcome == "throttled":
+                self.throttled += 1
+            else:
+                self.failures += 1
+            if now - self._last_decrease >= max(self.cooldown, self._latency_ewma or 0.0):
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self._last_decrease = now
+        if retry_after:
+            self._blocked_until = max(self._blocked_until, now + min(retry_after, self.max_pause))
+        self._wake()
+
+    def _observe_latency(self, latency: float) -> None:
+        alpha = 0.2
+        self._latency_ewma = latency if self._latency_ewma is None else (1 - alpha) * self._latency_ewma + alpha * latency
+        # Az alapvonal a gyorsabb válaszokhoz azonnal, a lassabbakhoz csak lassan igazodik
+        if self._latency_baseline is None or latency < self._latency_baseline:
+            self._latency_baseline = latency
+        else:
+            self._latency_baseline += (latency - self._latency_baseline) * 0.01
+
+    def _healthy(self) -> bool:
+        if self._latency_ewma is None or self._latency_baseline is None:
+            return True
+        return self._latency_ewma <= self._latency_baseline * self.latency_tolerance
+
+    def _wake(self) -> None:
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "latency_ewma_ms": round(self._latency_ewma * 1000, 1) if self._latency_ewma is not None else None,
+            "latency_baseline_ms": round(self._latency_baseline * 1000, 1) if self._latency_baseline is not None else None,
+            "paused_seconds": round(max(0.0, self._blocked_until - time.monotonic()), 3),
+            "successes": self.successes,
+            "throttled": self.throttled,
+            "failures": self.failures,
+        }
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """
+    A Retry-After fejléc másodpercben (szám vagy HTTP dátum formátumban), ha van.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    # "Full jitter" exponenciális visszalépés: 0 és base * 2^attempt között véletlenszerűen
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
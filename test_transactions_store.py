@@ -0,0 +1,46 @@
+import asyncio
+
+from transactions_store import PartnerTransactionIndex, TransactionsReplica
+
+
+def _transaction(record_id: int) -> dict:
+    return {
+        "id": record_id,
+        "transaction_status": "finalized",
+        "partner_transaction": [1],
+        "updated_at": f"2025-01-01T00:00:0{record_id}.000Z",
+    }
+
+
+def test_record_skipped_by_offset_drift_is_restored(tmp_path):
+    records = [_transaction(i) for i in range(1, 6)]
+    scans = [
+        records,
+        # Egy közben történt törlés miatt elcsúszott az offset: a 3-as rekord kimaradt a körből
+        [record for record in records if record["id"] != 3],
+        records,
+    ]
+
+    async def fetch():
+        for record in scans.pop(0):
+            yield dict(record)
+
+    async def run():
+        index = PartnerTransactionIndex()
+        replica = TransactionsReplica(str(tmp_path / "replica.sqlite3"), fetch, index=index)
+        try:
+            await replica.sync()
+            skipped = await replica.sync()
+            assert skipped["deleted"] == 1
+            assert 3 not in {record["id"] for record in index.lookup(1)}
+
+            # A 3-as rekord updated_at-je nem frissebb a vízjelnél, mégis vissza kell kerülnie
+            restored = await replica.sync()
+            assert restored["deleted"] == 0
+            assert replica.count() == 5
+            assert [record["id"] for record in await replica.partner_transactions(1)] == [1, 2, 3, 4, 5]
+            assert [record["id"] for record in index.lookup(1)] == [1, 2, 3, 4, 5]
+        finally:
+            replica.close()
+
+    asyncio.run(run())
@@ -0,0 +1,512 @@
+"""
+A tranzakciók collection helyi, SQLite-ban tárolt replikája háttér-szinkronizálással.
+
+Az első szinkron a teljes collection-t betölti, utána csak azokat a rekordokat írja újra,
+amelyek updated_at értéke a legutóbbi vízjelnél (watermark) frissebb. A partner szerinti
+lekérdezések így az Adalo API helyett egy indexelt helyi táblából szolgálhatók ki.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app_logging import get_logger
+
+log = get_logger("transactions_store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    transaction_status TEXT,
+    updated_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transaction_partners (
+    partner_id INTEGER NOT NULL,
+    transaction_id INTEGER NOT NULL,
+    PRIMARY KEY (partner_id, transaction_id)
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_status ON transactions (transaction_status);
+CREATE INDEX IF NOT EXISTS idx_transactions_updated_at ON transactions (updated_at);
+CREATE INDEX IF NOT EXISTS idx_transaction_partners_tx ON transaction_partners (transaction_id);
+CREATE TABLE IF NOT EXISTS sync_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def adalo_timestamp(value: datetime) -> str:
+    # Az Adalo dátum formátuma: 2025-01-31T12:34:56.789Z
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + "Z"
+
+
+def parse_adalo_timestamp(value) -> Optional[float]:
+    """
+    Adalo dátum string -> UTC epoch másodperc; hibás vagy hiányzó érték esetén None.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc).timestamp()
+    except (ValueError, TypeError):
+        return None
+
+
+class PartnerTransactionIndex:
+    """
+    Memóriabeli inverted index: partner id -> updated_at szerint rendezett 'finalized'
+    tranzakció id-k, valamint id -> rekord. Egy partner dátum-ablakos lekérdezése így
+    bináris keresés a teljes tranzakció lista bejárása helyett.
+
+    A hiányzó updated_at-ű tranzakciók külön halmazba kerülnek (csak dátumszűrő nélkül
+    jelennek meg), a hibás updated_at-űek pedig csak a szűretlen listázásban.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: Dict[int, dict] = {}
+        # partner id -> rendezett (updated_at epoch, tranzakció id) kulcsok
+        self._by_partner: Dict[int, List[Tuple[float, int]]] = {}
+        self._missing_date: Dict[int, Set[int]] = {}
+        self._bad_date: Dict[int, Set[int]] = {}
+        # tranzakció id -> (partner id-k, kulcs vagy None, dátum állapot)
+        self._entries: Dict[int, Tuple[Tuple[int, ...], Optional[Tuple[float, int]], str]] = {}
+        self.build_seconds: Optional[float] = None
+        self.built_at: Optional[float] = None
+        self.incremental_updates = 0
+
+    @property
+    def is_ready(self) -> bool:
+        return self.built_at is not None
+
+    def _remove_locked(self, record_id: int) -> None:
+        entry = self._entries.pop(record_id, None)
+        self._records.pop(record_id, None)
+        if entry is None:
+            return
+        partners, key, date_state = entry
+        for partner_id in partners:
+            if date_state == "ok":
+                keys = self._by_partner.get(partner_id)
+                if keys:
+                    position = bisect_left(keys, key)
+                    if position < len(keys) and keys[position] == key:
+                        del keys[position]
+                    if not keys:
+                        del self._by_partner[partner_id]
+            else:
+                bucket = (self._missing_date if date_state == "missing" else self._bad_date).get(partner_id)
+                if bucket is not None:
+                    bucket.discard(record_id)
+                    if not bucket:
+                        del (self._missing_date if date_state == "missing" else self._bad_date)[partner_id]
+
+    def _add_locked(self, record: dict, sort_later: bool = False) -> None:
+        record_id = record.get("id")
+        if record_id is None or record.get("transaction_status") != "finalized":
+            return
+        partners = tuple(dict.fromkeys(record.get("partner_transaction") or []))
+        if not partners:
+            return
+        updated_at = record.get("updated_at")
+        timestamp = parse_adalo_timestamp(updated_at)
+        if timestamp is not None:
+            date_state, key = "ok", (timestamp, record_id)
+        else:
+            date_state, key = ("missing" if not updated_at else "bad"), None
+
+        self._records[record_id] = record
+        self._entries[record_id] = (partners, key, date_state)
+        for partner_id in partners:
+            if date_state == "ok":
+                keys = self._by_partner.setdefault(partner_id, [])
+                if sort_later:
+                    keys.append(key)
+                else:
+                    insort(keys, key)
+            elif date_state == "missing":
+                self._missing_date.setdefault(partner_id, set()).add(record_id)
+            else:
+                self._bad_date.setdefault(partner_id, set()).add(record_id)
+
+    def build(self, records: Iterable[dict]) -> None:
+        """
+        Teljes újraépítés (induláskor vagy a replika első betöltése után).
+        """
+        started = time.perf_counter()
+        with self._lock:
+            self._records.clear()
+            self._by_partner.clear()
+            self._missing_date.clear()
+            self._bad_date.clear()
+            self._entries.clear()
+            for record in records:
+                if isinstance(record, dict):
+                    self._add_locked(record, sort_later=True)
+            for keys in self._by_partner.values():
+                keys.sort()
+        self.build_seconds = time.perf_counter() - started
+        self.built_at = time.time()
+
+    def upsert(self, records: Iterable[dict]) -> None:
+        """
+        Inkrementális frissítés: a régi bejegyzést eltávolítja, az újat (ha 'finalized') beszúrja.
+        """
+        with self._lock:
+            for record in records:
+                if not isinstance(record, dict) or record.get("id") is None:
+                    continue
+                self._remove_locked(record["id"])
+                self._add_locked(record)
+                self.incremental_updates += 1
+
+    def remove(self, record_ids: Iterable[int]) -> None:
+        with self._lock:
+            for record_id in record_ids:
+                self._remove_locked(record_id)
+                self.incremental_updates += 1
+
+    def lookup(
+        self,
+        partner_id: int,
+        from_datetime: Optional[datetime] = None,
+        to_datetime: Optional[datetime] = None,
+        include_bad_dates: bool = False,
+    ) -> List[dict]:
+        """
+        Egy partner 'finalized' tranzakciói a [from, to] ablakban, id szerint rendezve (ahogy a
+        replika és az élő lekérdezés is adja, így a válasz sorrendje nem függ attól, melyik út fut).
+        Dátumszűrő nélkül a hiányzó updated_at-űek is benne vannak.
+        """
+        with self._lock:
+            keys = self._by_partner.get(partner_id, [])
+            low = 0
+            high = len(keys)
+            if from_datetime is not None:
+                low = bisect_left(keys, (from_datetime.timestamp(), float("-inf")))
+            if to_datetime is not None:
+                high = bisect_right(keys, (to_datetime.timestamp(), float("inf")))
+            # Másolatok, hogy a hívó (pl. coupon_name hozzáadása) ne módosítsa az indexelt rekordokat
+            result = [dict(self._records[record_id]) for _, record_id in keys[low:high]]
+            if from_datetime is None and to_datetime is None:
+                extra = set(self._missing_date.get(partner_id, ()))
+                if include_bad_dates:
+                    extra |= self._bad_date.get(partner_id, set())
+                result.extend(dict(self._records[record_id]) for record_id in extra)
+        result.sort(key=lambda record: record["id"])
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "partners": len(set(self._by_partner) | set(self._missing_date) | set(self._bad_date)),
+                "transactions": len(self._records),
+                "dated_entries": sum(len(keys) for keys in self._by_partner.values()),
+                "undated_entries": sum(len(ids) for ids in self._missing_date.values())
+                + sum(len(ids) for ids in self._bad_date.values()),
+                "build_seconds": round(self.build_seconds, 6) if self.build_seconds is not None else None,
+                "built_at": datetime.fromtimestamp(self.built_at, timezone.utc).isoformat() if self.built_at else None,
+                "incremental_updates": self.incremental_updates,
+            }
+
+
+class TransactionsReplica:
+    """
+    SQLite replika: `transactions` (id, státusz, updated_at, teljes JSON rekord) és a
+    `transaction_partners` kapcsolótábla, mert a partner_transaction mező egy lista.
+    A `fetch_records` egy aszinkron generátort visszaadó függvény (pl. az app adalo_records-a).
+    Ha `index` meg van adva, minden írás/törlés azon is átvezetésre kerül.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fetch_records: Callable[[], AsyncIterator[dict]],
+        sync_interval: float = 60.0,
+        index: Optional[PartnerTransactionIndex] = None,
+    ):
+        self.path = path
+        self.fetch_records = fetch_records
+        self.sync_interval = sync_interval
+        self.index = index
+        self._lock = threading.Lock()
+        self._sync_lock = asyncio.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # A meta adatok memóriában is megvannak: a kérésenkénti olvasás (staleness, data_version)
+        # így nem fut sqlite-on, és nem vár a szinkron szál írásaira
+        self._meta: Dict[str, str] = dict(self._conn.execute("SELECT key, value FROM sync_meta").fetchall())
+        self._task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+
+    # --- meta adatok ---
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        return self._meta.get(key)
+
+    def _set_meta(self, values: Dict[str, str]) -> None:
+        # Egy tranzakcióban íródik ki; a memóriabeli példány csak utána frissül
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO sync_meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                list(values.items()),
+            )
+        self._meta.update(values)
+
+    @property
+    def watermark(self) -> Optional[str]:
+        return self._get_meta("watermark")
+
+    @property
+    def data_version(self) -> int:
+        """
+        Minden olyan szinkronnál nő, amely ténylegesen módosított vagy törölt tranzakciót
+        (a replikából előállított eredmények cache kulcsához).
+        """
+        value = self._get_meta("data_version")
+        return int(value) if value is not None else 0
+
+    @property
+    def last_sync_at(self) -> Optional[float]:
+        value = self._get_meta("last_sync_at")
+        return float(value) if value is not None else None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.last_sync_at is not None
+
+    def staleness(self) -> Optional[float]:
+        """
+        Hány másodperce futott le utoljára sikeres szinkron (None, ha még soha).
+        """
+        last = self.last_sync_at
+        return None if last is None else max(0.0, time.time() - last)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    # --- írás ---
+
+    def _upsert(self, records: Iterable[dict]) -> int:
+        """
+        Rekordok beírása; a visszatérési érték a ténylegesen megváltozott (új vagy módosult) sorok száma.
+        """
+        rows = []
+        partner_rows = []
+        ids = []
+        for record in records:
+            record_id = record.get("id")
+            if record_id is None:
+                continue
+            ids.append((record_id,))
+            rows.append((
+                record_id,
+                record.get("transaction_status"),
+                record.get("updated_at"),
+                json.dumps(record, ensure_ascii=False),
+            ))
+            for partner_id in record.get("partner_transaction") or []:
+                partner_rows.append((partner_id, record_id))
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM transaction_partners WHERE transaction_id = ?", ids)
+            before = self._conn.total_changes
+            # Változatlan rekordnál nincs írás, így a változások száma a valódi módosításokat méri
+            self._conn.executemany(
+                "INSERT INTO transactions (id, transaction_status, updated_at, data) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET transaction_status = excluded.transaction_status, "
+                "updated_at = excluded.updated_at, data = excluded.data "
+                "WHERE transactions.data IS NOT excluded.data",
+                rows,
+            )
+            changed = self._conn.total_changes - before
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO transaction_partners (partner_id, transaction_id) VALUES (?, ?)",
+                partner_rows,
+            )
+        return changed
+
+    def _stored_ids(self) -> Set[int]:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT id FROM transactions")}
+
+    def _delete_missing(self, seen_ids: set) -> List[int]:
+        stored = self._stored_ids()
+        missing = [(record_id,) for record_id in stored - seen_ids]
+        if missing:
+            with self._lock, self._conn:
+                self._conn.executemany("DELETE FROM transaction_partners WHERE transaction_id = ?", missing)
+                self._conn.executemany("DELETE FROM transactions WHERE id = ?", missing)
+        return [record_id for (record_id,) in missing]
+
+    def _all_records(self) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM transactions").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    async def _write(self, batch: List[dict], rebuild_index: bool) -> int:
+        changed = await asyncio.to_thread(self._upsert, batch)
+        if self.index is not None and not rebuild_index:
+            self.index.upsert(batch)
+        return changed
+
+    async def sync(self) -> dict:
+        """
+        Egy szinkron kör: első alkalommal teljes betöltés, utána csak a vízjelnél frissebb
+        rekordokat írja. Az Adalo-ból már törölt rekordokat a teljes kör végén eltávolítja.
+        """
+        async with self._sync_lock:
+            started = time.time()
+            watermark = self.watermark
+            new_watermark = watermark
+            seen_ids = set()
+            batch: List[dict] = []
+            written = 0
+            changed = 0
+            # Első betöltéskor (vagy ha az index még üres) az indexet a végén egyben építjük fel
+            rebuild_index = self.index is not None and (watermark is None or not self.index.is_ready)
+            # Az offset alapú lapozás egy közben történt beszúrás / törlés miatt átugorhat egy rekordot,
+            # amit a kör végén helyben törlünk; a vízjelnél nem frissebb, de helyben hiányzó rekordok
+            # ezért szintén beíródnak (különben a következő körök sem hoznák vissza)
+            stored_ids = await asyncio.to_thread(self._stored_ids) if watermark is not None else set()
+
+            async for record in self.fetch_records():
+                if not isinstance(record, dict):
+                    continue
+                if record.get("id") is not None:
+                    seen_ids.add(record["id"])
+                updated_at = record.get("updated_at")
+                if (
+                    watermark is None or updated_at is None or updated_at > watermark
+                    or record.get("id") not in stored_ids
+                ):
+                    batch.append(record)
+                if updated_at and (new_watermark is None or updated_at > new_watermark):
+                    new_watermark = updated_at
+                if len(batch) >= 500:
+                    changed += await self._write(batch, rebuild_index)
+                    written += len(batch)
+                    batch = []
+
+            if batch:
+                changed += await self._write(batch, rebuild_index)
+                written += len(batch)
+            deleted = await asyncio.to_thread(self._delete_missing, seen_ids)
+            if self.index is not None:
+                if rebuild_index:
+                    records = await asyncio.to_thread(self._all_records)
+                    await asyncio.to_thread(self.index.build, records)
+                elif deleted:
+                    self.index.remove(deleted)
+
+            meta = {"last_sync_at": str(time.time())}
+            if new_watermark is not None:
+                meta["watermark"] = new_watermark
+            if changed or deleted:
+                meta["data_version"] = str(self.data_version + 1)
+            await asyncio.to_thread(self._set_meta, meta)
+            self.last_error = None
+
+            result = {
+                "full_load": watermark is None,
+                "seen": len(seen_ids),
+                "written": written,
+                "changed": changed,
+                "deleted": len(deleted),
+                "data_version": self.data_version,
+                "watermark": new_watermark,
+                "duration_seconds": round(time.time() - started, 3),
+            }
+            log.info("Tranzakció replika szinkron kész: %s", result)
+            return result
+
+    # --- olvasás ---
+
+    def _partner_transactions(
+        self,
+        partner_id: int,
+        status: Optional[str],
+        updated_from: Optional[str],
+        updated_to: Optional[str],
+    ) -> List[dict]:
+        query = (
+            "SELECT t.data FROM transaction_partners p "
+            "JOIN transactions t ON t.id = p.transaction_id "
+            "WHERE p.partner_id = ?"
+        )
+        params: list = [partner_id]
+        if status is not None:
+            query += " AND t.transaction_status = ?"
+            params.append(status)
+        if updated_from is not None:
+            query += " AND t.updated_at >= ?"
+            params.append(updated_from)
+        if updated_to is not None:
+            query += " AND t.updated_at <= ?"
+            params.append(updated_to)
+        query += " ORDER BY t.id"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    async def partner_transactions(
+        self,
+        partner_id: int,
+        status: Optional[str] = "finalized",
+        updated_from: Optional[datetime] = None,
+        updated_to: Optional[datetime] = None,
+    ) -> List[dict]:
+        """
+        Egy partner tranzakciói a replikából, opcionálisan státusz és updated_at tartomány szerint.
+        """
+        return await asyncio.to_thread(
+            self._partner_transactions,
+            partner_id,
+            status,
+            adalo_timestamp(updated_from) if updated_from else None,
+            adalo_timestamp(updated_to) if updated_to else None,
+        )
+
+    # --- háttér szinkron ---
+
+    async def _run(self) -> None:
+        # Újraindítás után az index azonnal felépül a már meglévő helyi adatokból
+        if self.index is not None and not self.index.is_ready and self.is_ready:
+            records = await asyncio.to_thread(self._all_records)
+            await asyncio.to_thread(self.index.build, records)
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                log.error("Hiba a tranzakció replika szinkron során: %s", e)
+            await asyncio.sleep(self.sync_interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
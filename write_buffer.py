@@ -0,0 +1,118 @@
+"""
+Write-coalescing réteg a rekordonkénti PUT-okhoz: ugyanarra a rekordra rövid időn belül
+érkező mezőfrissítések egyetlen PUT-ba olvadnak össze.
+
+Az első írás azonnal kimegy. Amíg az úton van (és utána még `window` másodpercig), az
+ugyanarra a rekordra érkező további írások mezői összefésülődnek (a későbbi érték nyer),
+és egyetlen követő PUT-tal mennek ki. Minden hívó megvárja azt a PUT-ot, amelyik az ő
+mezőit is tartalmazta, és annak válaszát kapja vissza, így a put() visszatérése után az
+írás biztosan megtörtént (vagy a hibáját megkapta).
+"""
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from http_client import HttpClient
+
+
+class _PendingWrite:
+    def __init__(self, url: str, headers: Dict[str, str]):
+        self.url = url
+        self.headers = headers
+        self.fields: Dict[str, Any] = {}
+        self.waiters: List[asyncio.Future] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def take(self) -> Tuple[Dict[str, Any], List[asyncio.Future]]:
+        fields, waiters = self.fields, self.waiters
+        self.fields, self.waiters = {}, []
+        return fields, waiters
+
+
+class WriteCoalescer:
+    """
+    A HttpClient.put helyett használható (azonos hívási formával), így a bulk_update is
+    ezen keresztül írhat. `enabled=False` esetén minden írás közvetlenül kimegy.
+    """
+
+    def __init__(self, client: HttpClient, window: float = 0.2, enabled: bool = True):
+        self.client = client
+        self.window = window
+        self.enabled = enabled
+        self._pending: Dict[Tuple[str, Optional[str]], _PendingWrite] = {}
+        self._flushing = False
+        self.requested = 0
+        self.sent = 0
+        self.failed = 0
+
+    async def put(self, url: str, headers: Dict[str, str], json: Dict[str, Any]) -> httpx.Response:
+        self.requested += 1
+        if not self.enabled:
+            self.sent += 1
+            return await self.client.put(url, headers=headers, json=json)
+
+        # Eltérő hitelesítésű írások nem olvadnak össze
+        key = (url, headers.get("Authorization"))
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = self._pending[key] = _PendingWrite(url, headers)
+        entry.fields.update(json)
+        waiter = asyncio.get_running_loop().create_future()
+        entry.waiters.append(waiter)
+        if entry.task is None:
+            entry.task = asyncio.create_task(self._drain(key, entry))
+        # A hívó megszakadása nem szakítja meg a (más hívók mezőit is tartalmazó) PUT-ot
+        return await asyncio.shield(waiter)
+
+    async def _drain(self, key: Tuple[str, Optional[str]], entry: _PendingWrite) -> None:
+        try:
+            while entry.waiters:
+                fields, waiters = entry.take()
+                self.sent += 1
+                try:
+                    response = await self.client.put(entry.url, headers=entry.headers, json=fields)
+                except Exception as e:
+                    self.failed += 1
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_exception(e)
+                else:
+                    if response.status_code not in [200, 201]:
+                        self.failed += 1
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_result(response)
+                # Az írás után még `window` ideig gyűjtjük az ugyanerre a rekordra érkező frissítéseket
+                if self.window > 0 and not self._flushing:
+                    await asyncio.sleep(self.window)
+        finally:
+            self._pending.pop(key, None)
+            for waiter in entry.waiters:
+                if not waiter.done():
+                    waiter.set_exception(RuntimeError("A függő írás megszakadt"))
+
+    async def flush(self) -> None:
+        """
+        Minden függő írás azonnali kiküldése és megvárása (pl. leállításkor).
+        """
+        self._flushing = True
+        try:
+            while self._pending:
+                tasks = [entry.task for entry in self._pending.values() if entry.task is not None]
+                if not tasks:
+                    break
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self._flushing = False
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "window_seconds": self.window,
+            "requested_writes": self.requested,
+            "sent_puts": self.sent,
+            "coalesced_writes": self.requested - self.sent,
+            "failed_puts": self.failed,
+            "pending_records": len(self._pending),
+        }